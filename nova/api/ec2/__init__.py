@@ -20,6 +20,9 @@ Starting point for routing EC2 requests.
 
 """
 
+import hashlib
+import socket
+import time
 import urlparse
 
 from eventlet.green import httplib
@@ -58,6 +61,18 @@ ec2_opts = [
     cfg.StrOpt('keystone_ec2_url',
                default='http://localhost:5000/v2.0/ec2tokens',
                help='URL to get token from ec2 request.'),
+    cfg.IntOpt('keystone_ec2_cache_ttl',
+               default=30,
+               help='Seconds to remember that keystone accepted the '
+                    'credentials of an ec2 request, 0 disables caching'),
+    cfg.IntOpt('keystone_ec2_negative_cache_ttl',
+               default=5,
+               help='Seconds to remember that keystone rejected the '
+                    'credentials of an ec2 request, 0 disables caching'),
+    cfg.IntOpt('keystone_ec2_max_idle_connections',
+               default=10,
+               help='Number of idle keep-alive connections to '
+                    'keystone_ec2_url to keep around'),
     cfg.BoolOpt('ec2_private_dns_show_ip',
                 default=False,
                 help='Return the IP address as private dns hostname in '
@@ -190,8 +205,108 @@ class Lockout(wsgi.Middleware):
         return res
 
 
+class KeystoneConnectionPool(object):
+    """Keep-alive connections to keystone_ec2_url.
+
+    Connections are handed out to one request at a time and put back for
+    the next one once their response is read, unless keystone asked for
+    the connection to be closed or max_idle connections are already idle.
+    A request failing on a connection that sat idle is retried, keystone
+    may have closed it in the meantime.
+    """
+
+    def __init__(self, url, max_idle):
+        o = urlparse.urlparse(url)
+        if o.scheme == "http":
+            self.conn_class = httplib.HTTPConnection
+        else:
+            self.conn_class = httplib.HTTPSConnection
+        self.netloc = o.netloc
+        self.path = o.path
+        self.max_idle = max_idle
+        self.idle = []
+
+    def post(self, body, headers):
+        """POST body to the url, returns (status, reason, data)."""
+        while True:
+            if self.idle:
+                conn = self.idle.pop()
+                reused = True
+            else:
+                conn = self.conn_class(self.netloc)
+                reused = False
+            try:
+                conn.request('POST', self.path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            if response.will_close or len(self.idle) >= self.max_idle:
+                conn.close()
+            else:
+                self.idle.append(conn)
+            return response.status, response.reason, data
+
+
 class EC2KeystoneAuth(wsgi.Middleware):
-    """Authenticate an EC2 request with keystone and convert to context."""
+    """Authenticate an EC2 request with keystone and convert to context.
+
+    Keystone's answer is cached for keystone_ec2_cache_ttl seconds when it
+    accepts the credentials and keystone_ec2_negative_cache_ttl seconds
+    when it rejects them, keyed by a digest of everything the signature
+    covers, so clients polling the API don't validate the same signed
+    request over and over again.
+    """
+
+    def __init__(self, application):
+        self.mc = memorycache.get_client()
+        self.pool = KeystoneConnectionPool(
+                CONF.keystone_ec2_url, CONF.keystone_ec2_max_idle_connections)
+        self.stats = {'hits': 0, 'misses': 0, 'upstream_time': 0.0}
+        super(EC2KeystoneAuth, self).__init__(application)
+
+    def _cache_key(self, cred_dict):
+        digest = hashlib.sha256()
+        for key in ('access', 'signature', 'host', 'verb', 'path'):
+            digest.update(utils.utf8(cred_dict[key]) + '\0')
+        for key, value in sorted(cred_dict['params'].iteritems()):
+            digest.update('%s=%s\0' % (utils.utf8(key), utils.utf8(value)))
+        return 'ec2auth-%s' % digest.hexdigest()
+
+    def _validate(self, cred_dict, creds_json):
+        """Ask keystone about credentials, returns (status, reason, data)."""
+        cache_key = self._cache_key(cred_dict)
+        cached = self.mc.get(cache_key)
+        if cached is not None:
+            self.stats['hits'] += 1
+            return cached
+        self.stats['misses'] += 1
+
+        headers = {'Content-Type': 'application/json'}
+        start = time.time()
+        status, reason, data = self.pool.post(creds_json, headers)
+        elapsed = time.time() - start
+        self.stats['upstream_time'] += elapsed
+
+        stats = self.stats
+        hit_rate = 100.0 * stats['hits'] / (stats['hits'] + stats['misses'])
+        avg_time = stats['upstream_time'] / stats['misses']
+        LOG.debug(_("Keystone validated ec2 credentials in %(elapsed).3fs "
+                    "(average %(avg_time).3fs, cache hit rate "
+                    "%(hit_rate).1f%%)") % locals())
+
+        if status == 200:
+            ttl = CONF.keystone_ec2_cache_ttl
+        elif status == 401:
+            ttl = CONF.keystone_ec2_negative_cache_ttl
+        else:
+            ttl = 0
+        if ttl > 0:
+            self.mc.set(cache_key, (status, reason, data), time=ttl)
+        return status, reason, data
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
@@ -223,24 +338,15 @@ class EC2KeystoneAuth(wsgi.Middleware):
         else:
             creds = {'auth': {'OS-KSEC2:ec2Credentials': cred_dict}}
         creds_json = jsonutils.dumps(creds)
-        headers = {'Content-Type': 'application/json'}
 
-        o = urlparse.urlparse(CONF.keystone_ec2_url)
-        if o.scheme == "http":
-            conn = httplib.HTTPConnection(o.netloc)
-        else:
-            conn = httplib.HTTPSConnection(o.netloc)
-        conn.request('POST', o.path, body=creds_json, headers=headers)
-        response = conn.getresponse()
-        data = response.read()
-        if response.status != 200:
-            if response.status == 401:
-                msg = response.reason
+        status, reason, data = self._validate(cred_dict, creds_json)
+        if status != 200:
+            if status == 401:
+                msg = reason
             else:
                 msg = _("Failure communicating with keystone")
             return ec2_error(req, request_id, "Unauthorized", msg)
         result = jsonutils.loads(data)
-        conn.close()
 
         try:
             token_id = result['access']['token']['id']
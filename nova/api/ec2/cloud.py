@@ -23,6 +23,7 @@ datastore.
 """
 
 import base64
+import collections
 import time
 
 from nova.api.ec2 import ec2utils
@@ -1037,12 +1038,14 @@ class CloudController(object):
         return {'instancesSet': instances_set}
 
     def _format_instance_bdm(self, context, instance_uuid, root_device_name,
-                             result):
+                             result, bdms=None):
         """Format InstanceBlockDeviceMappingResponseItemType."""
         root_device_type = 'instance-store'
         mapping = []
-        for bdm in db.block_device_mapping_get_all_by_instance(context,
-                                                               instance_uuid):
+        if bdms is None:
+            bdms = db.block_device_mapping_get_all_by_instance(context,
+                                                               instance_uuid)
+        for bdm in bdms:
             volume_id = bdm['volume_id']
             if (volume_id is None or bdm['no_device']):
                 continue
@@ -1123,6 +1126,21 @@ class CloudController(object):
             except exception.NotFound:
                 instances = []
 
+        # NOTE: look up what the instances refer to with a few batched
+        #       queries rather than a few queries per instance.
+        admin_context = context.elevated()
+        instance_uuids = [instance['uuid'] for instance in instances]
+        ec2utils.prefetch_ec2_inst_ids(admin_context, instance_uuids)
+        ec2utils.prefetch_glance_ids(context,
+                [instance[key] for instance in instances
+                 for key in ('image_ref', 'kernel_id', 'ramdisk_id')])
+        bdms = collections.defaultdict(list)
+        for bdm in db.block_device_mapping_get_all_by_instances(
+                context, instance_uuids):
+            bdms[bdm['instance_uuid']].append(bdm)
+        zones = ec2utils.get_availability_zones_by_hosts(admin_context,
+                set(instance['host'] for instance in instances))
+
         for instance in instances:
             if not context.is_admin:
                 if pipelib.is_vpn_image(instance['image_ref']):
@@ -1168,11 +1186,9 @@ class CloudController(object):
             i['amiLaunchIndex'] = instance['launch_index']
             self._format_instance_root_device_name(instance, i)
             self._format_instance_bdm(context, instance['uuid'],
-                                      i['rootDeviceName'], i)
-            host = instance['host']
-            services = db.service_get_all_by_host(context.elevated(), host)
-            zone = ec2utils.get_availability_zone_by_host(services, host)
-            i['placement'] = {'availabilityZone': zone}
+                                      i['rootDeviceName'], i,
+                                      bdms[instance['uuid']])
+            i['placement'] = {'availabilityZone': zones[instance['host']]}
             if instance['reservation_id'] not in reservations:
                 r = {}
                 r['reservationId'] = instance['reservation_id']
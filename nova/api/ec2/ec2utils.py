@@ -23,13 +23,52 @@ from nova import context
 from nova import db
 from nova import exception
 from nova.network import model as network_model
+from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
 from nova.openstack.common import uuidutils
+from nova import utils
+
+ec2utils_opts = [
+    cfg.IntOpt('ec2_id_cache_size',
+               default=10000,
+               help='Number of uuid to ec2 id mappings of instances and '
+                    'images to keep in memory'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(ec2utils_opts)
 
 LOG = logging.getLogger(__name__)
 
 
+class _LRUCache(object):
+    """Dict-like cache keeping the most recently used items."""
+
+    def __init__(self):
+        self._items = utils.LRUDict()
+
+    def get(self, key):
+        return self._items.get(key)
+
+    def set(self, key, value):
+        self._items[key] = value
+        while len(self._items) > CONF.ec2_id_cache_size:
+            self._items.popitem()
+
+    def clear(self):
+        self._items.clear()
+
+
+# NOTE: the mappings of uuids to ec2 ids never change once created, so
+#       they can be kept for as long as there is room for them.
+_ID_CACHE = _LRUCache()
+
+
+def reset_cache():
+    _ID_CACHE.clear()
+
+
 def image_type(image_type):
     """Converts to a three letter image type.
 
@@ -56,10 +95,22 @@ def glance_id_to_id(context, glance_id):
     """Convert a glance id to an internal (db) id."""
     if glance_id is None:
         return
-    try:
-        return db.s3_image_get_by_uuid(context, glance_id)['id']
-    except exception.NotFound:
-        return db.s3_image_create(context, glance_id)['id']
+    image_id = _ID_CACHE.get(('image', glance_id))
+    if image_id is None:
+        try:
+            image_id = db.s3_image_get_by_uuid(context, glance_id)['id']
+        except exception.NotFound:
+            image_id = db.s3_image_create(context, glance_id)['id']
+        _ID_CACHE.set(('image', glance_id), image_id)
+    return image_id
+
+
+def prefetch_glance_ids(context, glance_ids):
+    """Look up the internal ids of many glance ids in one query."""
+    missing = [glance_id for glance_id in set(glance_ids)
+               if glance_id and _ID_CACHE.get(('image', glance_id)) is None]
+    for s3_image in db.s3_image_get_by_uuids(context, missing):
+        _ID_CACHE.set(('image', s3_image['uuid']), s3_image['id'])
 
 
 def ec2_id_to_glance_id(context, ec2_id):
@@ -122,6 +173,18 @@ def get_availability_zone_by_host(services, host):
     return 'unknown zone'
 
 
+def get_availability_zones_by_hosts(context, hosts):
+    """Return a dict of the availability zones of many hosts."""
+    if not hosts:
+        return {}
+    service_hosts = set(service['host']
+                        for service in db.service_get_all(context))
+    zones = dict((host, 'unknown zone') for host in hosts)
+    zones.update(availability_zones.get_host_availability_zones(
+            context, [host for host in hosts if host in service_hosts]))
+    return zones
+
+
 def id_to_ec2_id(instance_id, template='i-%08x'):
     """Convert an instance ID (int) to an ec2 ID (i-[base 16 number])."""
     return template % int(instance_id)
@@ -214,10 +277,24 @@ def is_ec2_timestamp_expired(request, expires=None):
 def get_int_id_from_instance_uuid(context, instance_uuid):
     if instance_uuid is None:
         return
-    try:
-        return db.get_ec2_instance_id_by_uuid(context, instance_uuid)
-    except exception.NotFound:
-        return db.ec2_instance_create(context, instance_uuid)['id']
+    int_id = _ID_CACHE.get(('instance', instance_uuid))
+    if int_id is None:
+        try:
+            int_id = db.get_ec2_instance_id_by_uuid(context, instance_uuid)
+        except exception.NotFound:
+            int_id = db.ec2_instance_create(context, instance_uuid)['id']
+        _ID_CACHE.set(('instance', instance_uuid), int_id)
+    return int_id
+
+
+def prefetch_ec2_inst_ids(context, instance_uuids):
+    """Look up the ec2 ids of many instances in one query."""
+    missing = [instance_uuid for instance_uuid in set(instance_uuids)
+               if _ID_CACHE.get(('instance', instance_uuid)) is None]
+    if missing:
+        int_ids = db.get_ec2_instance_ids_by_uuids(context, missing)
+        for instance_uuid, int_id in int_ids.iteritems():
+            _ID_CACHE.set(('instance', instance_uuid), int_id)
 
 
 def get_int_id_from_volume_uuid(context, volume_uuid):
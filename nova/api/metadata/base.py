@@ -30,6 +30,7 @@ from nova import context
 from nova import db
 from nova import network
 from nova.openstack.common import cfg
+from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
 from nova.virt import netutils
 
@@ -104,8 +105,10 @@ class InstanceMetadata():
 
         self.ip_info = ec2utils.get_ip_info_for_instance(ctxt, instance)
 
-        self.security_groups = db.security_group_get_by_instance(ctxt,
-                                                            instance['id'])
+        # NOTE: kept as primitives so that the whole object can be pickled
+        # into memcached and shared by metadata workers.
+        self.security_groups = jsonutils.to_primitive(
+            db.security_group_get_by_instance(ctxt, instance['id']))
 
         self.mappings = _format_instance_mapping(ctxt, instance)
 
@@ -404,11 +407,16 @@ class InstanceMetadata():
             yield ('%s/%s/%s' % ("openstack", CONTENT_DIR, cid), content)
 
 
-def get_metadata_by_address(address):
-    ctxt = context.get_admin_context()
+def get_instance_uuid_by_address(address, ctxt=None):
+    ctxt = ctxt or context.get_admin_context()
     fixed_ip = network.API().get_fixed_ip_by_address(ctxt, address)
+    return fixed_ip['instance_uuid']
 
-    return get_metadata_by_instance_id(fixed_ip['instance_uuid'],
+
+def get_metadata_by_address(address):
+    ctxt = context.get_admin_context()
+    return get_metadata_by_instance_id(get_instance_uuid_by_address(address,
+                                                                    ctxt),
                                        address,
                                        ctxt)
 
@@ -20,18 +20,27 @@
 import hashlib
 import hmac
 import os
+import sys
 
+from eventlet import event
+from eventlet import greenthread
 import webob.dec
 import webob.exc
 
 from nova.api.metadata import base
 from nova.common import memorycache
+from nova import context
+from nova import db
 from nova import exception
 from nova.openstack.common import cfg
+from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 from nova import wsgi
 
 CACHE_EXPIRATION = 15  # in seconds
+BUILD_TIMEOUT = 10  # in seconds
+BUILD_POLL_INTERVAL = 0.1  # in seconds
 
 CONF = cfg.CONF
 CONF.import_opt('use_forwarded_for', 'nova.api.auth')
@@ -48,7 +57,16 @@ metadata_proxy_opts = [
          help='Shared secret to validate proxies Quantum metadata requests')
 ]
 
+metadata_cache_opts = [
+    cfg.IntOpt('metadata_cache_expiration',
+               default=15,
+               help='Time in seconds to cache metadata documents.  Documents '
+                    'are versioned by the last update of their instance, '
+                    'so changes to the instance itself show up at once'),
+]
+
 CONF.register_opts(metadata_proxy_opts)
+CONF.register_opts(metadata_cache_opts)
 
 LOG = logging.getLogger(__name__)
 
@@ -58,38 +76,89 @@ class MetadataRequestHandler(wsgi.Application):
 
     def __init__(self):
         self._cache = memorycache.get_client()
+        self._building = {}
 
     def get_metadata_by_remote_address(self, address):
         if not address:
             raise exception.FixedIpNotFoundForAddress(address=address)
 
-        cache_key = 'metadata-%s' % address
-        data = self._cache.get(cache_key)
-        if data:
-            return data
+        cache_key = 'metadata-address-%s' % address
+        instance_uuid = self._cache.get(cache_key)
+        if instance_uuid is None:
+            try:
+                instance_uuid = base.get_instance_uuid_by_address(address)
+            except exception.NotFound:
+                return None
+            self._cache.set(cache_key, instance_uuid, CACHE_EXPIRATION)
+
+        return self.get_metadata_by_instance_id(instance_uuid, address)
 
+    def get_metadata_by_instance_id(self, instance_id, address):
+        ctxt = context.get_admin_context()
         try:
-            data = base.get_metadata_by_address(address)
+            version = db.instance_get_updated_at(ctxt, instance_id)
         except exception.NotFound:
             return None
 
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
-
+        # NOTE: documents are keyed by the version of the instance they
+        # were built from, so any change to the instance is picked up by
+        # the next request instead of after the cache entry expires.  Only
+        # the version is read for a cached document, the whole instance
+        # is read when building one.
+        cache_key = 'metadata-%s-%s-%s' % (instance_id,
+                                           timeutils.strtime(version),
+                                           address)
+        data = self._cache.get(cache_key)
+        if data is None:
+            try:
+                data = self._build_metadata(cache_key, ctxt, instance_id,
+                                            address)
+            except exception.NotFound:
+                return None
         return data
 
-    def get_metadata_by_instance_id(self, instance_id, address):
-        cache_key = 'metadata-%s' % instance_id
-        data = self._cache.get(cache_key)
-        if data:
-            return data
+    def _build_metadata(self, cache_key, ctxt, instance_id, address):
+        """Build the document of an instance once for concurrent requests.
+
+        Requests for a document that this process is already building
+        wait for that build.  Across workers sharing memcached, the worker
+        that takes the build lock builds the document and the others wait
+        for it to show up in the cache.
+        """
+        building = self._building.get(cache_key)
+        if building is not None:
+            return building.wait()
 
+        building = event.Event()
+        self._building[cache_key] = building
         try:
-            data = base.get_metadata_by_instance_id(instance_id, address)
-        except exception.NotFound:
-            return None
+            data = self._build_metadata_locked(cache_key, ctxt, instance_id,
+                                               address)
+        except Exception:
+            exc_info = sys.exc_info()
+            building.send_exception(*exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        else:
+            building.send(data)
+        finally:
+            del self._building[cache_key]
+        return data
 
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
+    def _build_metadata_locked(self, cache_key, ctxt, instance_id, address):
+        lock_key = '%s-building' % cache_key
+        while not self._cache.add(lock_key, True, BUILD_TIMEOUT):
+            greenthread.sleep(BUILD_POLL_INTERVAL)
+            data = self._cache.get(cache_key)
+            if data is not None:
+                return data
 
+        try:
+            instance = db.instance_get_by_uuid(ctxt, instance_id)
+            data = base.InstanceMetadata(jsonutils.to_primitive(instance),
+                                         address)
+            self._cache.set(cache_key, data, CONF.metadata_cache_expiration)
+        finally:
+            self._cache.delete(lock_key)
         return data
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
@@ -28,20 +28,45 @@ authorize = extensions.soft_extension_authorizer('compute',
                                                  'extended_availability_zone')
 
 
+def _prefetch_host_azs(req):
+    """Fetch the availability zones of the hosts of the cached instances."""
+    context = req.environ['nova.context']
+    if not authorize(context):
+        return
+    try:
+        instances = req.get_db_instances().values()
+    except KeyError:
+        return
+
+    hosts = set(instance['host'] for instance in instances
+                if instance['host'])
+    zones = availability_zones.get_host_availability_zones(
+            context.elevated(), hosts)
+    req.cache_db_items('host_availability_zones',
+                       [{'host': host, 'availability_zone': zone}
+                        for host, zone in zones.iteritems()],
+                       'host')
+
+
 class ExtendedAZController(wsgi.Controller):
 
-    def _get_host_az(self, context, instance):
-        admin_context = context.elevated()
-        if instance['host']:
+    def _get_host_az(self, req, context, instance):
+        if not instance['host']:
+            return
+        try:
+            return req.get_db_item('host_availability_zones',
+                                   instance['host'])['availability_zone']
+        except (KeyError, TypeError):
+            admin_context = context.elevated()
             return availability_zones.get_host_availability_zone(
                                             admin_context, instance['host'])
 
-    def _extend_server(self, context, server, instance):
+    def _extend_server(self, req, context, server, instance):
         key = "%s:availability_zone" % Extended_availability_zone.alias
         server[key] = instance.get('availability_zone', None)
 
         key = "%s:host_availability_zone" % Extended_availability_zone.alias
-        server[key] = self._get_host_az(context, instance)
+        server[key] = self._get_host_az(req, context, instance)
 
     @wsgi.extends
     def show(self, req, resp_obj, id):
@@ -50,9 +75,10 @@ class ExtendedAZController(wsgi.Controller):
             resp_obj.attach(xml=ExtendedAZTemplate())
             server = resp_obj.obj['server']
             db_instance = req.get_db_instance(server['id'])
-            self._extend_server(context, server, db_instance)
+            self._extend_server(req, context, server, db_instance)
 
     @wsgi.extends
+    @wsgi.prefetch(_prefetch_host_azs)
     def detail(self, req, resp_obj):
         context = req.environ['nova.context']
         if authorize(context):
@@ -60,7 +86,7 @@ class ExtendedAZController(wsgi.Controller):
             servers = list(resp_obj.obj['servers'])
             for server in servers:
                 db_instance = req.get_db_instance(server['id'])
-                self._extend_server(context, server, db_instance)
+                self._extend_server(req, context, server, db_instance)
 
 
 class Extended_availability_zone(extensions.ExtensionDescriptor):
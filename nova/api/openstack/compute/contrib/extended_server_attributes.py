@@ -26,23 +26,51 @@ authorize = extensions.soft_extension_authorizer('compute',
                                                  'extended_server_attributes')
 
 
+def _prefetch_compute_nodes(req):
+    """Fetch the compute nodes of all the cached instances at once."""
+    context = req.environ['nova.context']
+    if not authorize(context):
+        return
+    try:
+        instances = req.get_db_instances().values()
+    except KeyError:
+        return
+
+    hosts = set(instance['host'] for instance in instances)
+    compute_nodes = dict((host, None) for host in hosts)
+    for compute_node in db.compute_node_get_by_hosts(
+            context, [host for host in hosts if host]):
+        host = compute_node['service']['host']
+        if compute_nodes.get(host) is None:
+            compute_nodes[host] = compute_node
+    req.cache_db_items('compute_nodes',
+                       [{'host': host, 'compute_node': compute_node}
+                        for host, compute_node in compute_nodes.iteritems()],
+                       'host')
+
+
 class ExtendedServerAttributesController(wsgi.Controller):
     def __init__(self, *args, **kwargs):
         super(ExtendedServerAttributesController, self).__init__(*args,
                                                                  **kwargs)
         self.compute_api = compute.API()
 
-    def _get_hypervisor_hostname(self, context, instance):
-        compute_node = db.compute_node_get_by_host(context, instance["host"])
+    def _get_hypervisor_hostname(self, req, context, instance):
+        try:
+            compute_node = req.get_db_item('compute_nodes',
+                                           instance['host'])['compute_node']
+        except (KeyError, TypeError):
+            compute_node = db.compute_node_get_by_host(context,
+                                                       instance["host"])
 
         try:
             return compute_node["hypervisor_hostname"]
         except TypeError:
             return
 
-    def _extend_server(self, context, server, instance):
+    def _extend_server(self, req, context, server, instance):
         key = "%s:hypervisor_hostname" % Extended_server_attributes.alias
-        server[key] = self._get_hypervisor_hostname(context, instance)
+        server[key] = self._get_hypervisor_hostname(req, context, instance)
 
         for attr in ['host', 'name']:
             if attr == 'name':
@@ -62,9 +90,10 @@ class ExtendedServerAttributesController(wsgi.Controller):
             db_instance = req.get_db_instance(server['id'])
             # server['id'] is guaranteed to be in the cache due to
             # the core API adding it in its 'show' method.
-            self._extend_server(context, server, db_instance)
+            self._extend_server(req, context, server, db_instance)
 
     @wsgi.extends
+    @wsgi.prefetch(_prefetch_compute_nodes)
     def detail(self, req, resp_obj):
         context = req.environ['nova.context']
         if authorize(context):
@@ -76,7 +105,7 @@ class ExtendedServerAttributesController(wsgi.Controller):
                 db_instance = req.get_db_instance(server['id'])
                 # server['id'] is guaranteed to be in the cache due to
                 # the core API adding it in its 'detail' method.
-                self._extend_server(context, server, db_instance)
+                self._extend_server(req, context, server, db_instance)
 
 
 class Extended_server_attributes(extensions.ExtensionDescriptor):
@@ -843,6 +843,20 @@ class Resource(wsgi.Application):
         # Run post-processing in the reverse order
         return None, reversed(post)
 
+    def prefetch_extension_data(self, extensions, request):
+        """Run the prefetch functions declared by the extensions.
+
+        Each function is run once, however many extensions need it, so
+        that the extensions find what they need cached on the request
+        instead of querying for it server by server.
+        """
+        done = set()
+        for ext in extensions:
+            for func in getattr(ext, 'wsgi_prefetch', ()):
+                if func not in done:
+                    done.add(func)
+                    func(request)
+
     def post_process_extensions(self, extensions, resp_obj, request,
                                 action_args):
         for ext in extensions:
@@ -979,7 +993,9 @@ class Resource(wsgi.Application):
                     resp_obj._default_code = meth.wsgi_code
                 resp_obj.preserialize(accept, self.default_serializers)
 
-                # Process post-processing extensions
+                # Fetch what the extensions need in as few queries as
+                # possible, then process post-processing extensions
+                self.prefetch_extension_data(extensions, request)
                 response = self.post_process_extensions(post, resp_obj,
                                                         request, action_args)
 
@@ -1090,6 +1106,26 @@ def extends(*args, **kwargs):
     return decorator
 
 
+def prefetch(*funcs):
+    """Indicate the data an extension needs to be fetched beforehand.
+
+    Each function is called with the request once the extended method
+    has run, and is expected to fetch the data for all the objects the
+    method cached on the request in a single query and cache it there
+    too::
+
+        @extends
+        @prefetch(_prefetch_compute_nodes)
+        def detail(...):
+            pass
+    """
+
+    def decorator(func):
+        func.wsgi_prefetch = getattr(func, 'wsgi_prefetch', ()) + funcs
+        return func
+    return decorator
+
+
 class ControllerMetaclass(type):
     """Controller metaclass.
 
@@ -18,6 +18,7 @@
 from nova import db
 from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 
 availability_zone_opts = [
     cfg.StrOpt('internal_service_availability_zone',
@@ -28,6 +29,10 @@ availability_zone_opts = [
                deprecated_name='node_availability_zone',
                default='nova',
                help='default compute node availability_zone'),
+    cfg.IntOpt('availability_zone_cache_time',
+               default=15,
+               help='Seconds between reloads of the availability zones of '
+                    'hosts from aggregates changed by other services'),
     ]
 
 CONF = cfg.CONF
@@ -35,12 +40,36 @@ CONF.register_opts(availability_zone_opts)
 
 LOG = logging.getLogger(__name__)
 
+_HOST_ZONES = {}
+
+
+def reset_cache():
+    """Forget the availability zones of hosts, they are reloaded next time."""
+    _HOST_ZONES.clear()
+
+
+def _get_host_zones(context):
+    """Return a dict of hosts to the set of their availability zones.
+
+    The map is kept in memory.  It is reloaded when this process changes
+    aggregates, and every availability_zone_cache_time seconds to pick up
+    the changes made by other services.
+    """
+    generation = db.aggregate_generation()
+    now = timeutils.utcnow_ts()
+    if (_HOST_ZONES.get('generation') != generation or
+            now >= _HOST_ZONES['expires']):
+        zones = db.aggregate_host_get_by_metadata_key(context,
+                key='availability_zone')
+        _HOST_ZONES.update(zones=zones, generation=generation,
+                           expires=now + CONF.availability_zone_cache_time)
+    return _HOST_ZONES['zones']
+
 
 def set_availability_zones(context, services):
     # Makes sure services isn't a sqlalchemy object
     services = [dict(service.iteritems()) for service in services]
-    metadata = db.aggregate_host_get_by_metadata_key(context,
-            key='availability_zone')
+    metadata = _get_host_zones(context)
     for service in services:
         az = CONF.internal_service_availability_zone
         if service['topic'] == "compute":
@@ -53,14 +82,25 @@ def set_availability_zones(context, services):
 
 
 def get_host_availability_zone(context, host):
-    metadata = db.aggregate_metadata_get_by_host(
-        context, host, key='availability_zone')
-    if 'availability_zone' in metadata:
-        return list(metadata['availability_zone'])[0]
+    metadata = _get_host_zones(context)
+    if metadata.get(host):
+        return list(metadata[host])[0]
     else:
         return CONF.default_availability_zone
 
 
+def get_host_availability_zones(context, hosts):
+    """Return a dict of the availability zones of hosts."""
+    metadata = _get_host_zones(context)
+    zones = {}
+    for host in hosts:
+        if metadata.get(host):
+            zones[host] = list(metadata[host])[0]
+        else:
+            zones[host] = CONF.default_availability_zone
+    return zones
+
+
 def get_availability_zones(context):
     """Return available and unavailable zones."""
     enabled_services = db.service_get_all(context, False)
@@ -65,7 +65,7 @@ class CellsManager(manager.Manager):
 
     Scheduling requests get passed to the scheduler class.
     """
-    RPC_API_VERSION = '1.4'
+    RPC_API_VERSION = '1.6'
 
     def __init__(self, *args, **kwargs):
         # Mostly for tests.
@@ -190,6 +190,13 @@ class CellsManager(manager.Manager):
         """Return cell information for our neighbor cells."""
         return self.state_manager.get_cell_info_for_neighbors()
 
+    def get_instance_update_lags(self, _ctxt):
+        """Return the number of batches and instance updates received
+        from each child cell and the last and highest number of seconds
+        they took to reach us.
+        """
+        return self.msg_runner.get_instance_update_lags()
+
     def run_compute_api_method(self, ctxt, cell_name, method_info, call):
         """Call a compute API method in a specific cell."""
         response = self.msg_runner.run_compute_api_method(ctxt,
@@ -230,17 +237,46 @@ class CellsManager(manager.Manager):
         self.msg_runner.sync_instances(ctxt, project_id, updated_since,
                                        deleted)
 
-    def service_get_all(self, ctxt, filters):
-        """Return services in this cell and in all child cells."""
+    def _response_values(self, responses, missing_cells=None):
+        """Yield the cell name and value of each response to a broadcast
+        call.  A cell that didn't respond in time raises CellTimeout,
+        unless missing_cells is a list, which gets its name instead.
+        """
+        for response in responses:
+            if (missing_cells is not None and response.failure and
+                    isinstance(response.value, exception.CellTimeout)):
+                LOG.warn(_("Leaving out cell %s, which did not respond "
+                           "in time"), response.cell_name)
+                missing_cells.append(response.cell_name)
+                continue
+            yield response.cell_name, response.value_or_raise()
+
+    def _partial_result(self, result, missing_cells):
+        """Return the result of a broadcast call as is, or along with the
+        names of the cells that didn't respond in time if the caller
+        asked for a partial result.
+        """
+        if missing_cells is None:
+            return result
+        return {'result': result, 'missing_cells': missing_cells}
+
+    def service_get_all(self, ctxt, filters, partial=False):
+        """Return services in this cell and in all child cells.
+
+        If partial is True, cells that don't respond in time are left out
+        and a dict of the services as 'result' and of the names of these
+        cells as 'missing_cells' is returned.
+        """
+        missing_cells = [] if partial else None
         responses = self.msg_runner.service_get_all(ctxt, filters)
         ret_services = []
         # 1 response per cell.  Each response is a list of services.
-        for response in responses:
-            services = response.value_or_raise()
+        for cell_name, services in self._response_values(responses,
+                                                         missing_cells):
             for service in services:
-                cells_utils.add_cell_to_service(service, response.cell_name)
+                cells_utils.add_cell_to_service(service, cell_name)
                 ret_services.append(service)
-        return ret_services
+        return self._partial_result(ret_services, missing_cells)
 
     def service_get_by_compute_host(self, ctxt, host_name):
         """Return a service entry for a compute host in a certain cell."""
@@ -262,7 +298,8 @@ class CellsManager(manager.Manager):
         return response.value_or_raise()
 
     def task_log_get_all(self, ctxt, task_name, period_beginning,
-                         period_ending, host=None, state=None):
+                         period_ending, host=None, state=None,
+                         partial=False):
         """Get task logs from the DB from all cells or a particular
         cell.
 
@@ -272,7 +309,10 @@ class CellsManager(manager.Manager):
         the host if specified.
 
         'state' also may be None.  If it's not, filter by the state as well.
+
+        'partial' works as for service_get_all().
         """
+        missing_cells = [] if partial else None
         if host is None:
             cell_name = None
         else:
@@ -288,13 +328,12 @@ class CellsManager(manager.Manager):
         # 1 response per cell.  Each response is a list of task log
         # entries.
         ret_task_logs = []
-        for response in responses:
-            task_logs = response.value_or_raise()
+        for cell_name, task_logs in self._response_values(responses,
+                                                          missing_cells):
             for task_log in task_logs:
-                cells_utils.add_cell_to_task_log(task_log,
-                                                 response.cell_name)
+                cells_utils.add_cell_to_task_log(task_log, cell_name)
                 ret_task_logs.append(task_log)
-        return ret_task_logs
+        return self._partial_result(ret_task_logs, missing_cells)
 
     def compute_node_get(self, ctxt, compute_id):
         """Get a compute node by ID in a specific cell."""
@@ -306,28 +345,36 @@ class CellsManager(manager.Manager):
         cells_utils.add_cell_to_compute_node(node, cell_name)
         return node
 
-    def compute_node_get_all(self, ctxt, hypervisor_match=None):
-        """Return list of compute nodes in all cells."""
+    def compute_node_get_all(self, ctxt, hypervisor_match=None,
+                             partial=False):
+        """Return list of compute nodes in all cells.
+
+        'partial' works as for service_get_all().
+        """
+        missing_cells = [] if partial else None
         responses = self.msg_runner.compute_node_get_all(ctxt,
                 hypervisor_match=hypervisor_match)
         # 1 response per cell.  Each response is a list of compute_node
         # entries.
         ret_nodes = []
-        for response in responses:
-            nodes = response.value_or_raise()
+        for cell_name, nodes in self._response_values(responses,
+                                                      missing_cells):
             for node in nodes:
-                cells_utils.add_cell_to_compute_node(node,
-                                                     response.cell_name)
+                cells_utils.add_cell_to_compute_node(node, cell_name)
                 ret_nodes.append(node)
-        return ret_nodes
+        return self._partial_result(ret_nodes, missing_cells)
+
+    def compute_node_stats(self, ctxt, partial=False):
+        """Return compute node stats totals from all cells.
 
-    def compute_node_stats(self, ctxt):
-        """Return compute node stats totals from all cells."""
+        'partial' works as for service_get_all().
+        """
+        missing_cells = [] if partial else None
         responses = self.msg_runner.compute_node_stats(ctxt)
         totals = {}
-        for response in responses:
-            data = response.value_or_raise()
+        for cell_name, data in self._response_values(responses,
+                                                     missing_cells):
             for key, val in data.iteritems():
                 totals.setdefault(key, 0)
                 totals[key] += val
-        return totals
+        return self._partial_result(totals, missing_cells)
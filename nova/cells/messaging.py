@@ -22,8 +22,11 @@ reached.
 
 The interface into this module is the MessageRunner class.
 """
+import copy
 import sys
+import time
 
+from eventlet import greenthread
 from eventlet import queue
 
 from nova.cells import state as cells_state
@@ -50,7 +53,27 @@ cell_messaging_opts = [
             help='Maximum number of hops for cells routing.'),
     cfg.StrOpt('scheduler',
             default='nova.cells.scheduler.CellsScheduler',
-            help='Cells scheduler to use')]
+            help='Cells scheduler to use'),
+    cfg.FloatOpt('instance_update_batch_window',
+            default=0.0,
+            help='Seconds to hold instance updates, destroys and faults '
+                 'for the top cell before sending them in one message, '
+                 'merging the updates of the same instance.  0 sends '
+                 'each of them right away.  Only set this once all the '
+                 'cells above this one have been upgraded to accept '
+                 'batches.'),
+    cfg.IntOpt('instance_update_batch_size',
+            default=100,
+            help='Number of instance updates, destroys and faults held '
+                 'for the top cell that causes them to be sent right '
+                 'away.'),
+    cfg.FloatOpt('broadcast_timeout_ratio',
+            default=0.8,
+            help='Ratio of the time a cell waits for the responses of '
+                 'its neighbor cells to a broadcast call that these '
+                 'cells wait for the responses of their own neighbors.  '
+                 'Cells that did not respond in time get a CellTimeout '
+                 'response.')]
 
 CONF = cfg.CONF
 CONF.import_opt('name', 'nova.cells.opts', group='cells')
@@ -226,7 +249,8 @@ class _BaseMessage(object):
         wait_time = CONF.cells.call_timeout
         try:
             for x in xrange(num_responses):
-                json_responses = self.resp_queue.get(timeout=wait_time)
+                cell_name, json_responses = self.resp_queue.get(
+                        timeout=wait_time)
                 responses.extend(json_responses)
         except queue.Empty:
             raise exception.CellTimeout()
@@ -341,11 +365,25 @@ class _TargetedMessage(_BaseMessage):
         self.base_attrs_to_json.append('target_cell')
 
     def _get_next_hop(self):
-        """Return the cell name for the next hop.  If the next hop is
-        the current cell, return None.
+        """Return the cell state for the next hop, which is our own if we
+        are the target.  Routes are looked up in the routing table of
+        the state manager, and only worked out from the paths the first
+        time.
         """
         if self.target_cell == self.routing_path:
             return self.state_manager.my_cell_state
+        routing_table = self.state_manager.get_routing_table()
+        route = (self.direction, self.routing_path, self.target_cell)
+        next_hop = routing_table.get(route)
+        if next_hop is None:
+            next_hop = self._find_next_hop()
+            routing_table[route] = next_hop
+        return next_hop
+
+    def _find_next_hop(self):
+        """Work out the neighbor cell for the next hop from the routing
+        path and the target cell.
+        """
         target_cell = self.target_cell
         routing_path = self.routing_path
         current_hops = routing_path.count(_PATH_CELL_SEP)
@@ -438,13 +476,21 @@ class _BroadcastMessage(_BaseMessage):
     message_type = 'broadcast'
 
     def __init__(self, msg_runner, ctxt, method_name, method_kwargs,
-            direction, run_locally=True, **kwargs):
+            direction, run_locally=True, timeout=None, **kwargs):
         super(_BroadcastMessage, self).__init__(msg_runner, ctxt,
                 method_name, method_kwargs, direction, **kwargs)
         # The local cell creating this message has the option
         # to be able to process the message locally or not.
         self.run_locally = run_locally
         self.is_broadcast = True
+        # Seconds to wait for the responses of our neighbor cells.  Each
+        # hop waits less than the one it got the message from, so that
+        # the responses it got in time get back before that one gives up.
+        if timeout is None:
+            self.timeout = CONF.cells.call_timeout
+        else:
+            self.timeout = timeout * CONF.cells.broadcast_timeout_ratio
+        self.base_attrs_to_json.append('timeout')
 
     def _get_next_hops(self):
         """Set the next hops and return the number of hops.  The next
@@ -462,6 +508,59 @@ class _BroadcastMessage(_BaseMessage):
         for cell in target_cells:
             cell.send_message(self)
 
+    def _neighbor_path(self, cell_name):
+        return self.routing_path + _PATH_CELL_SEP + cell_name
+
+    def _send_to_cell_for_response(self, cell):
+        """Send the message to a neighbor cell that is to respond.  If
+        that fails, the failure is its response.
+        """
+        try:
+            cell.send_message(self)
+        except Exception as exc:
+            exc_info = sys.exc_info()
+            LOG.exception(_("Error sending message to cell %(cell)s: "
+                            "%(exc)s"), locals())
+            response = Response(self._neighbor_path(cell.name), exc_info,
+                                True)
+            self.msg_runner._put_response(self.uuid, [response.to_json()],
+                                          cell_name=cell.name)
+
+    def _wait_for_neighbor_responses(self, target_cells):
+        """Wait up to self.timeout seconds for the responses of the
+        neighbor cells, as they arrive.  Each cell that didn't respond
+        in time gets a CellTimeout failure as its response.
+
+        Destroy the eventlet queue when done.
+        """
+        pending = set(cell.name for cell in target_cells)
+        responses = []
+        deadline = time.time() + self.timeout
+        try:
+            while pending:
+                wait_time = max(deadline - time.time(), 0)
+                try:
+                    cell_name, json_responses = self.resp_queue.get(
+                            timeout=wait_time)
+                except queue.Empty:
+                    break
+                if cell_name not in pending:
+                    continue
+                pending.discard(cell_name)
+                responses.extend(json_responses)
+        finally:
+            self._cleanup_response_queue()
+        for cell_name in pending:
+            LOG.warn(_("Timed out waiting for responses from cell "
+                       "%(cell_name)s to %(method_name)s"),
+                     {'cell_name': cell_name,
+                      'method_name': self.method_name})
+            exc = exception.CellTimeout()
+            response = Response(self._neighbor_path(cell_name),
+                                (type(exc), exc, None), True)
+            responses.append(response.to_json())
+        return responses
+
     def _send_json_responses(self, json_responses):
         """Responses to broadcast messages always need to go to the
         neighbor cell from which we received this message.  That
@@ -480,10 +579,12 @@ class _BroadcastMessage(_BaseMessage):
         to process it locally as well.
 
         If responses from all cells are required, each hop creates an
-        eventlet queue and waits for responses from its immediate
-        neighbor cells.  All responses are then aggregated into a
-        single list and are returned to the neighbor cell until the
-        source is reached.
+        eventlet queue, sends the message to its immediate neighbor cells
+        concurrently and waits for their responses.  All responses are
+        then aggregated into a single list and are returned to the
+        neighbor cell until the source is reached.  Neighbor cells that
+        don't respond within the timeout of the hop are left out, with
+        a CellTimeout failure in their place.
 
         When the source is reached, a list of Response instances are
         returned to the caller.
@@ -511,17 +612,9 @@ class _BroadcastMessage(_BaseMessage):
 
         # We'll need to aggregate all of the responses (from ourself
         # and our sibling cells) into 1 response
-        try:
-            self._setup_response_queue()
-            self._send_to_cells(next_hops)
-        except Exception as exc:
-            # Error just trying to send to cells.  Send a single response
-            # with the failure.
-            exc_info = sys.exc_info()
-            LOG.exception(_("Error sending message to next hops: %(exc)s"),
-                          locals())
-            self._cleanup_response_queue()
-            return self._send_response_from_exception(exc_info)
+        self._setup_response_queue()
+        for cell in next_hops:
+            greenthread.spawn_n(self._send_to_cell_for_response, cell)
 
         if self.run_locally:
             # Run locally and store the Response.
@@ -529,17 +622,7 @@ class _BroadcastMessage(_BaseMessage):
         else:
             local_response = None
 
-        try:
-            remote_responses = self._wait_for_json_responses(
-                    num_responses=len(next_hops))
-        except Exception as exc:
-            # Error waiting for responses, most likely a timeout.
-            # Send a single response back with the failure.
-            exc_info = sys.exc_info()
-            err_str = _("Error waiting for responses from neighbor cells: "
-                        "%(exc)s")
-            LOG.exception(err_str, locals())
-            return self._send_response_from_exception(exc_info)
+        remote_responses = self._wait_for_neighbor_responses(next_hops)
 
         if local_response:
             remote_responses.append(local_response.to_json())
@@ -624,8 +707,10 @@ class _ResponseMessageMethods(_BaseMessageMethods):
     eventlet queue to signal the caller that's waiting.
     """
     def parse_responses(self, message, orig_message, responses):
+        # The first part of the routing path is the cell responding
+        cell_name = message.routing_path.split(_PATH_CELL_SEP)[0]
         self.msg_runner._put_response(message.response_uuid,
-                responses)
+                responses, cell_name=cell_name)
 
 
 class _TargetedMessageMethods(_BaseMessageMethods):
@@ -674,12 +759,15 @@ class _TargetedMessageMethods(_BaseMessageMethods):
         # Go ahead and update our parents now that a child updated us
         self.msg_runner.tell_parents_our_capabilities(message.ctxt)
 
-    def update_capacities(self, message, cell_name, capacities):
-        """A child cell told us about their capacity."""
+    def update_capacities(self, message, cell_name, capacities,
+                          partial=False):
+        """A child cell told us about their capacity, or only about what
+        changed in it if partial is True.
+        """
         LOG.debug(_("Received capacities from child cell "
                 "%(cell_name)s: %(capacities)s"), locals())
         self.state_manager.update_cell_capacities(cell_name,
-                capacities)
+                capacities, partial=partial)
         # Go ahead and update our parents now that a child updated us
         self.msg_runner.tell_parents_our_capacities(message.ctxt)
 
@@ -691,9 +779,9 @@ class _TargetedMessageMethods(_BaseMessageMethods):
 
     def announce_capacities(self, message):
         """A parent cell has told us to send our capacity, so let's
-        do so.
+        do so.  Send all of it, as the parent may have none of it.
         """
-        self.msg_runner.tell_parents_our_capacities(message.ctxt)
+        self.msg_runner.tell_parents_our_capacities(message.ctxt, full=True)
 
     def service_get_by_compute_host(self, message, host_name):
         """Return the service entry for a compute host."""
@@ -722,16 +810,19 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
     """These are the methods that can be called as a part of a broadcast
     message.
     """
+    def __init__(self, *args, **kwargs):
+        super(_BroadcastMessageMethods, self).__init__(*args, **kwargs)
+        # Lag of the batches of instance updates received from each cell
+        self.instance_update_lags = {}
+
     def _at_the_top(self):
         """Are we the API level?"""
         return not self.state_manager.get_parent_cells()
 
-    def instance_update_at_top(self, message, instance, **kwargs):
-        """Update an instance in the DB if we're a top level cell."""
-        if not self._at_the_top():
-            return
-        instance_uuid = instance['uuid']
-
+    def _prepare_instance_update(self, message, instance):
+        """Turn an instance update from a child cell into values to
+        update our DB with.  Returns the info_cache to update, if any.
+        """
         # Remove things that we can't update in the top level cells.
         # 'metadata' is only updated in the API cell, so don't overwrite
         # it based on what child cells say.  Make sure to update
@@ -755,10 +846,11 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
             sys_metadata = dict([(md['key'], md['value'])
                     for md in instance['system_metadata']])
             instance['system_metadata'] = sys_metadata
+        return info_cache
 
-        LOG.debug(_("Got update for instance %(instance_uuid)s: "
-                "%(instance)s") % locals())
-
+    def _update_instance(self, message, instance, info_cache):
+        """Update an instance in the DB, creating it if it's missing."""
+        instance_uuid = instance['uuid']
         # It's possible due to some weird condition that the instance
         # was already set as deleted... so we'll attempt to update
         # it with permissions that allows us to read deleted.
@@ -774,6 +866,79 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
             self.db.instance_info_cache_update(message.ctxt, instance_uuid,
                     info_cache, update_cells=False)
 
+    def instance_update_at_top(self, message, instance, **kwargs):
+        """Update an instance in the DB if we're a top level cell."""
+        if not self._at_the_top():
+            return
+        instance_uuid = instance['uuid']
+        info_cache = self._prepare_instance_update(message, instance)
+        LOG.debug(_("Got update for instance %(instance_uuid)s: "
+                "%(instance)s") % locals())
+        self._update_instance(message, instance, info_cache)
+
+    def _record_instance_update_lag(self, message, buffered_at,
+                                    num_updates):
+        cell_name = _reverse_path(message.routing_path)
+        lag = timeutils.delta_seconds(timeutils.parse_strtime(buffered_at),
+                                      timeutils.utcnow())
+        lags = self.instance_update_lags.setdefault(cell_name,
+                {'batches': 0, 'updates': 0, 'last_lag': 0, 'max_lag': 0})
+        lags['batches'] += 1
+        lags['updates'] += num_updates
+        lags['last_lag'] = lag
+        lags['max_lag'] = max(lags['max_lag'], lag)
+        LOG.debug(_("Got %(num_updates)d instance updates from cell "
+                    "%(cell_name)s, %(lag).3f seconds after the first "
+                    "one"), locals())
+
+    def instance_update_batch_at_top(self, message, instance_updates,
+                                     instance_faults, buffered_at,
+                                     **kwargs):
+        """Apply a batch of instance updates, destroys and faults to the
+        DB if we're a top level cell.  The instance updates are applied
+        in one transaction.
+        """
+        if not self._at_the_top():
+            return
+        self._record_instance_update_lag(message, buffered_at,
+                len(instance_updates) + len(instance_faults))
+
+        updates = []
+        info_caches = {}
+        for update in instance_updates:
+            instance = update['instance']
+            if update['destroyed']:
+                self.instance_destroy_at_top(message, instance)
+                continue
+            info_caches[instance['uuid']] = self._prepare_instance_update(
+                    message, instance)
+            updates.append((instance['uuid'], instance))
+
+        updated = set()
+        if updates:
+            with utils.temporary_mutation(message.ctxt, read_deleted="yes"):
+                try:
+                    results = self.db.instance_update_many(message.ctxt,
+                            [(instance_uuid, dict(instance))
+                             for instance_uuid, instance in updates],
+                            update_cells=False)
+                    updated = set(instance_ref['uuid']
+                                  for old_ref, instance_ref in results)
+                except Exception:
+                    LOG.exception(_("Failed to update instances in one "
+                                    "transaction, updating them one by "
+                                    "one"))
+        for instance_uuid, instance in updates:
+            info_cache = info_caches[instance_uuid]
+            if instance_uuid not in updated:
+                self._update_instance(message, instance, info_cache)
+            elif info_cache:
+                self.db.instance_info_cache_update(message.ctxt,
+                        instance_uuid, info_cache, update_cells=False)
+
+        for instance_fault in instance_faults:
+            self.instance_fault_create_at_top(message, instance_fault)
+
     def instance_destroy_at_top(self, message, instance, **kwargs):
         """Destroy an instance from the DB if we're a top level cell."""
         if not self._at_the_top():
@@ -840,8 +1005,8 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
             self._sync_instance(message.ctxt, instance)
 
     def service_get_all(self, message, filters):
-        if filters is None:
-            filters = {}
+        # Copy these, as the message may still be sent to other cells.
+        filters = dict(filters or {})
         disabled = filters.pop('disabled', None)
         services = self.db.service_get_all(message.ctxt, disabled=disabled)
         ret_services = []
@@ -912,6 +1077,14 @@ class MessageRunner(object):
         self.our_name = CONF.cells.name
         for msg_type, cls in _CELL_MESSAGE_TYPE_TO_METHODS_CLS.iteritems():
             self.methods_by_type[msg_type] = cls(self)
+        # Instance updates and destroys waiting to be sent to the top
+        # cell, by instance uuid, the uuids in the order they were first
+        # updated, and instance faults
+        self._instance_updates = {}
+        self._instance_update_uuids = []
+        self._instance_faults = []
+        self._instance_updates_buffered_at = None
+        self._instance_updates_flush = None
 
     def _process_message_locally(self, message):
         """Message processing will call this when its determined that
@@ -924,17 +1097,18 @@ class MessageRunner(object):
         fn = getattr(methods, message.method_name)
         return fn(message, **message.method_kwargs)
 
-    def _put_response(self, response_uuid, response):
+    def _put_response(self, response_uuid, response, cell_name=None):
         """Put a response into a response queue.  This is called when
         a _ResponseMessage is processed in the cell that initiated a
-        'call' to another cell.
+        'call' to another cell.  'cell_name' is the neighbor cell the
+        response came from.
         """
         resp_queue = self.response_queues.get(response_uuid)
         if not resp_queue:
             # Response queue is gone.  We must have restarted or we
             # received a response after our timeout period.
             return
-        resp_queue.put(response)
+        resp_queue.put((cell_name, response))
 
     def _setup_response_queue(self, message):
         """Set up an eventlet queue to use to wait for replies.
@@ -1010,8 +1184,8 @@ class MessageRunner(object):
                 locals())
         # We have to turn the sets into lists so they can potentially
         # be json encoded when the raw message is sent.
-        for key, values in capabs.items():
-            capabs[key] = list(values)
+        capabs = dict((key, list(values))
+                      for key, values in capabs.iteritems())
         method_kwargs = {'cell_name': my_cell_info.name,
                          'capabilities': capabs}
         for cell in parent_cells:
@@ -1019,17 +1193,25 @@ class MessageRunner(object):
                     method_kwargs, 'up', cell, fanout=True)
             message.process()
 
-    def tell_parents_our_capacities(self, ctxt):
-        """Send our capacities to parent cells."""
+    def tell_parents_our_capacities(self, ctxt, full=False):
+        """Send our capacities to parent cells.  Only the capacities that
+        changed since the last time are sent, unless full is True or it
+        is time for a full update.
+        """
         parent_cells = self.state_manager.get_parent_cells()
         if not parent_cells:
             return
         my_cell_info = self.state_manager.get_my_state()
-        capacities = self.state_manager.get_our_capacities()
+        capacities, partial = self.state_manager.get_our_capacity_changes(
+                full=full)
+        if partial and not capacities:
+            return
         LOG.debug(_("Updating parents with our capacities: %(capacities)s"),
                 locals())
         method_kwargs = {'cell_name': my_cell_info.name,
                          'capacities': capacities}
+        if partial:
+            method_kwargs['partial'] = True
         for cell in parent_cells:
             message = _TargetedMessage(self, ctxt, 'update_capacities',
                     method_kwargs, 'up', cell, fanout=True)
@@ -1052,8 +1234,78 @@ class MessageRunner(object):
                                    cell_name, need_response=call)
         return message.process()
 
+    def _buffer_instance_update(self, instance=None, destroyed=False,
+                                instance_fault=None):
+        """Hold an instance update, destroy or fault to send to the top
+        level cell with the others received within
+        instance_update_batch_window seconds.
+        """
+        if instance is not None:
+            instance_uuid = instance['uuid']
+            pending = self._instance_updates.get(instance_uuid)
+            if pending is not None and not destroyed:
+                # Later values win over those of the pending update
+                merged = dict(pending['instance'])
+                merged.update(instance)
+                instance = merged
+                destroyed = pending['destroyed']
+            if pending is None:
+                self._instance_update_uuids.append(instance_uuid)
+            self._instance_updates[instance_uuid] = dict(instance=instance,
+                                                         destroyed=destroyed)
+        if instance_fault is not None:
+            self._instance_faults.append(instance_fault)
+
+        if self._instance_updates_buffered_at is None:
+            self._instance_updates_buffered_at = timeutils.utcnow()
+        num_buffered = len(self._instance_updates) + len(
+                self._instance_faults)
+        if num_buffered >= CONF.cells.instance_update_batch_size:
+            self.flush_instance_updates()
+        elif self._instance_updates_flush is None:
+            self._instance_updates_flush = greenthread.spawn_after(
+                    CONF.cells.instance_update_batch_window,
+                    self.flush_instance_updates)
+
+    def flush_instance_updates(self):
+        """Send the instance updates, destroys and faults held for the top
+        level cell in one message.
+        """
+        if self._instance_updates_flush is not None:
+            if self._instance_updates_flush is not greenthread.getcurrent():
+                self._instance_updates_flush.cancel()
+            self._instance_updates_flush = None
+        if self._instance_updates_buffered_at is None:
+            return
+        instance_updates = [self._instance_updates[instance_uuid]
+                            for instance_uuid in self._instance_update_uuids]
+        method_kwargs = dict(
+                instance_updates=instance_updates,
+                instance_faults=self._instance_faults,
+                buffered_at=timeutils.strtime(
+                    self._instance_updates_buffered_at))
+        self._instance_updates = {}
+        self._instance_update_uuids = []
+        self._instance_faults = []
+        self._instance_updates_buffered_at = None
+        ctxt = context.get_admin_context()
+        message = _BroadcastMessage(self, ctxt,
+                                    'instance_update_batch_at_top',
+                                    method_kwargs, 'up', run_locally=False)
+        message.process()
+
+    def get_instance_update_lags(self):
+        """Return the lag of the batches of instance updates received
+        from each child cell, by cell name.
+        """
+        methods = self.methods_by_type['broadcast']
+        return copy.deepcopy(methods.instance_update_lags)
+
     def instance_update_at_top(self, ctxt, instance):
         """Update an instance at the top level cell."""
+        if CONF.cells.instance_update_batch_window > 0:
+            self._buffer_instance_update(instance=instance)
+            return
         message = _BroadcastMessage(self, ctxt, 'instance_update_at_top',
                                     dict(instance=instance), 'up',
                                     run_locally=False)
@@ -1061,6 +1313,9 @@ class MessageRunner(object):
 
     def instance_destroy_at_top(self, ctxt, instance):
         """Destroy an instance at the top level cell."""
+        if CONF.cells.instance_update_batch_window > 0:
+            self._buffer_instance_update(instance=instance, destroyed=True)
+            return
         message = _BroadcastMessage(self, ctxt, 'instance_destroy_at_top',
                                     dict(instance=instance), 'up',
                                     run_locally=False)
@@ -1080,6 +1335,9 @@ class MessageRunner(object):
 
     def instance_fault_create_at_top(self, ctxt, instance_fault):
         """Create an instance fault at the top level cell."""
+        if CONF.cells.instance_update_batch_window > 0:
+            self._buffer_instance_update(instance_fault=instance_fault)
+            return
         message = _BroadcastMessage(self, ctxt,
                                     'instance_fault_create_at_top',
                                     dict(instance_fault=instance_fault),
@@ -46,6 +46,9 @@ class CellsAPI(rpc_proxy.RpcProxy):
         1.3 - Adds task_log_get_all()
         1.4 - Adds compute_node_get(), compute_node_get_all(), and
               compute_node_stats()
+        1.5 - Adds partial to service_get_all(), task_log_get_all(),
+              compute_node_get_all() and compute_node_stats()
+        1.6 - Adds get_instance_update_lags()
     '''
     BASE_RPC_API_VERSION = '1.0'
 
@@ -150,6 +153,15 @@ class CellsAPI(rpc_proxy.RpcProxy):
         return self.call(ctxt, self.make_msg('get_cell_info_for_neighbors'),
                          version='1.1')
 
+    def get_instance_update_lags(self, ctxt):
+        """Get the lag of the instance updates received from each
+        child cell.
+        """
+        if not CONF.cells.enable:
+            return {}
+        return self.call(ctxt, self.make_msg('get_instance_update_lags'),
+                         version='1.6')
+
     def sync_instances(self, ctxt, project_id=None, updated_since=None,
             deleted=False):
         """Ask all cells to sync instance data."""
@@ -161,8 +173,18 @@ class CellsAPI(rpc_proxy.RpcProxy):
                                              deleted=deleted),
                          version='1.1')
 
-    def service_get_all(self, ctxt, filters=None):
-        """Ask all cells for their list of services."""
+    def service_get_all(self, ctxt, filters=None, partial=False):
+        """Ask all cells for their list of services.
+
+        If partial is True, cells that don't respond in time are left out
+        and a dict of the services as 'result' and of the names of these
+        cells as 'missing_cells' is returned.
+        """
+        if partial:
+            return self.call(ctxt,
+                             self.make_msg('service_get_all',
+                                           filters=filters, partial=True),
+                             version='1.5')
         return self.call(ctxt,
                          self.make_msg('service_get_all',
                                        filters=filters),
@@ -190,8 +212,20 @@ class CellsAPI(rpc_proxy.RpcProxy):
                          version='1.2')
 
     def task_log_get_all(self, ctxt, task_name, period_beginning,
-                         period_ending, host=None, state=None):
-        """Get the task logs from the DB in child cells."""
+                         period_ending, host=None, state=None,
+                         partial=False):
+        """Get the task logs from the DB in child cells.
+
+        'partial' works as for service_get_all().
+        """
+        if partial:
+            return self.call(ctxt, self.make_msg('task_log_get_all',
+                                       task_name=task_name,
+                                       period_beginning=period_beginning,
+                                       period_ending=period_ending,
+                                       host=host, state=state,
+                                       partial=True),
+                             version='1.5')
         return self.call(ctxt, self.make_msg('task_log_get_all',
                                    task_name=task_name,
                                    period_beginning=period_beginning,
@@ -205,16 +239,32 @@ class CellsAPI(rpc_proxy.RpcProxy):
                                              compute_id=compute_id),
                          version='1.4')
 
-    def compute_node_get_all(self, ctxt, hypervisor_match=None):
+    def compute_node_get_all(self, ctxt, hypervisor_match=None,
+                             partial=False):
         """Return list of compute nodes in all cells, optionally
         filtering by hypervisor host.
+
+        'partial' works as for service_get_all().
         """
+        if partial:
+            return self.call(ctxt,
+                             self.make_msg('compute_node_get_all',
+                                           hypervisor_match=hypervisor_match,
+                                           partial=True),
+                             version='1.5')
         return self.call(ctxt,
                          self.make_msg('compute_node_get_all',
                                        hypervisor_match=hypervisor_match),
                          version='1.4')
 
-    def compute_node_stats(self, ctxt):
-        """Return compute node stats from all cells."""
+    def compute_node_stats(self, ctxt, partial=False):
+        """Return compute node stats from all cells.
+
+        'partial' works as for service_get_all().
+        """
+        if partial:
+            return self.call(ctxt, self.make_msg('compute_node_stats',
+                                                 partial=True),
+                             version='1.5')
         return self.call(ctxt, self.make_msg('compute_node_stats'),
                          version='1.4')
@@ -32,6 +32,17 @@ cell_state_manager_opts = [
         cfg.IntOpt('db_check_interval',
                 default=60,
                 help='Seconds between getting fresh cell info from db.'),
+        cfg.IntOpt('capacity_full_refresh_interval',
+                default=600,
+                help='Seconds between full recomputations of our capacity '
+                     'and full capacity updates to parent cells.  In '
+                     'between, only changes are computed and sent.'),
+        cfg.BoolOpt('send_capacity_changes',
+                default=False,
+                help='Only send what changed in our capacity to parent '
+                     'cells between full updates.  Enable this once all '
+                     'the parent cells have been upgraded to understand '
+                     'partial capacity updates.'),
 ]
 
 
@@ -68,10 +79,15 @@ class CellState(object):
         self.last_seen = timeutils.utcnow()
         self.capabilities = cell_metadata
 
-    def update_capacities(self, capacities):
-        """Update capacity information for a cell."""
+    def update_capacities(self, capacities, partial=False):
+        """Update capacity information for a cell.  If partial is True,
+        capacities only holds the values that changed.
+        """
         self.last_seen = timeutils.utcnow()
-        self.capacities = capacities
+        if partial:
+            _merge_dict(self.capacities, capacities)
+        else:
+            self.capacities = capacities
 
     def get_cell_info(self):
         """Return subset of cell information for OS API use."""
@@ -94,6 +110,43 @@ class CellState(object):
         return "Cell '%s' (%s)" % (self.name, me)
 
 
+def _merge_dict(target, src):
+    """Set the values of src in target, recursing into dicts."""
+    for key, value in src.iteritems():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_dict(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+def _dict_changes(old, new):
+    """Return the values of new that differ from old, recursing into
+    dicts, or None if new lacks some of the keys of old.
+    """
+    changes = {}
+    for key in old:
+        if key not in new:
+            return None
+    for key, value in new.iteritems():
+        old_value = old.get(key)
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            value_changes = _dict_changes(old_value, value)
+            if value_changes is None:
+                return None
+            if value_changes:
+                changes[key] = value_changes
+        elif key not in old or old_value != value:
+            changes[key] = value
+    return changes
+
+
+def _free_units(tot, per_inst):
+    if per_inst:
+        return max(0, int(tot / per_inst))
+    else:
+        return 0
+
+
 def sync_from_db(f):
     """Use as a decorator to wrap methods that use cell information to
     make sure they sync the latest information from the DB periodically.
@@ -115,7 +168,20 @@ class CellStateManager(base.Base):
         self.my_cell_state = cell_state_cls(CONF.cells.name, is_me=True)
         self.parent_cells = {}
         self.child_cells = {}
+        # Next hop of targeted messages, by direction, routing path and
+        # target cell, see get_routing_table()
+        self.routing_table = {}
+        # Our capabilities and capacities merged with those of our
+        # children, rebuilt when they change
+        self._our_capabilities = None
+        self._our_capacities = None
         self.last_cell_db_check = datetime.datetime.min
+        # Running totals of our capacity are (re)set up by
+        # _reset_our_capacity(), see _update_our_capacity()
+        self._capacity_refreshed_at = None
+        # What we last told our parents, see get_our_capacity_changes()
+        self._reported_capacities = None
+        self._capacities_reported_at = None
         self._cell_db_sync()
         my_cell_capabs = {}
         for cap in CONF.cells.capabilities:
@@ -133,6 +199,7 @@ class CellStateManager(base.Base):
         db_cells = self.db.cell_get_all(ctxt)
         db_cells_dict = dict([(cell['name'], cell) for cell in db_cells])
 
+        topology_changed = False
         # Update current cells.  Delete ones that disappeared
         for cells_dict in (self.parent_cells, self.child_cells):
             for cell_name, cell_info in cells_dict.items():
@@ -142,6 +209,7 @@ class CellStateManager(base.Base):
                     cell_info.update_db_info(db_dict)
                 else:
                     del cells_dict[cell_name]
+                    topology_changed = True
 
         # Add new cells
         for cell_name, db_info in db_cells_dict.items():
@@ -152,6 +220,18 @@ class CellStateManager(base.Base):
             if cell_name not in cells_dict:
                 cells_dict[cell_name] = self.cell_state_cls(cell_name)
                 cells_dict[cell_name].update_db_info(db_info)
+                topology_changed = True
+
+        if topology_changed:
+            self.topology_changed()
+
+    def topology_changed(self):
+        """Forget the routes and the merged capabilities and capacities,
+        which depend on our neighbor cells.
+        """
+        self.routing_table = {}
+        self._our_capabilities = None
+        self._our_capacities = None
 
     def _time_to_sync(self):
         """Is it time to sync the DB against our memory cache?"""
@@ -193,63 +273,86 @@ class CellStateManager(base.Base):
 
         NOTE(comstud): Perhaps we should only report a single number
         available per instance_type.
+
+        Rather than computing the units for every compute node and
+        instance_type each time, running totals are kept and only the
+        compute nodes whose free RAM or disk changed since the last call
+        are accounted for again.  Everything, including the list of
+        instance_types, is recomputed every
+        CONF.cells.capacity_full_refresh_interval seconds.
         """
 
         compute_hosts = {}
-
-        def _get_compute_hosts():
-            compute_nodes = self.db.compute_node_get_all(context)
-            for compute in compute_nodes:
-                service = compute['service']
-                if not service or service['disabled']:
-                    continue
-                host = service['host']
-                compute_hosts[host] = {
-                        'free_ram_mb': compute['free_ram_mb'],
-                        'free_disk_mb': compute['free_disk_gb'] * 1024}
-
-        _get_compute_hosts()
+        compute_nodes = self.db.compute_node_get_all(context)
+        for compute in compute_nodes:
+            service = compute['service']
+            if not service or service['disabled']:
+                continue
+            host = service['host']
+            compute_hosts[host] = {
+                    'free_ram_mb': compute['free_ram_mb'],
+                    'free_disk_mb': compute['free_disk_gb'] * 1024}
+
+        if (self._capacity_refreshed_at is None or
+                timeutils.is_older_than(self._capacity_refreshed_at,
+                        CONF.cells.capacity_full_refresh_interval)):
+            self._reset_our_capacity(context)
+
+        for host, compute_values in compute_hosts.iteritems():
+            old_values = self._host_capacities.get(host)
+            if old_values == compute_values:
+                continue
+            if old_values:
+                self._add_host_capacity(old_values, -1)
+            self._add_host_capacity(compute_values, 1)
+            self._host_capacities[host] = compute_values
+        for host in self._host_capacities.keys():
+            if host not in compute_hosts:
+                self._add_host_capacity(self._host_capacities.pop(host), -1)
+
+        self._our_capacities = None
         if not compute_hosts:
             self.my_cell_state.update_capacities({})
             return
 
-        ram_mb_free_units = {}
-        disk_mb_free_units = {}
-        total_ram_mb_free = 0
-        total_disk_mb_free = 0
-
-        def _free_units(tot, per_inst):
-            if per_inst:
-                return max(0, int(tot / per_inst))
-            else:
-                return 0
+        capacities = {'ram_free': {'total_mb': self._total_ram_mb_free,
+                                   'units_by_mb':
+                                        dict(self._ram_mb_free_units)},
+                      'disk_free': {'total_mb': self._total_disk_mb_free,
+                                    'units_by_mb':
+                                        dict(self._disk_mb_free_units)}}
+        self.my_cell_state.update_capacities(capacities)
 
-        def _update_from_values(values, instance_type):
+    def _reset_our_capacity(self, context):
+        """Start the running totals of our capacity over."""
+        self._capacity_refreshed_at = timeutils.utcnow()
+        self._capacity_instance_types = []
+        self._host_capacities = {}
+        self._ram_mb_free_units = {}
+        self._disk_mb_free_units = {}
+        self._total_ram_mb_free = 0
+        self._total_disk_mb_free = 0
+        for instance_type in self.db.instance_type_get_all(context):
             memory_mb = instance_type['memory_mb']
             disk_mb = (instance_type['root_gb'] +
                     instance_type['ephemeral_gb']) * 1024
-            ram_mb_free_units.setdefault(str(memory_mb), 0)
-            disk_mb_free_units.setdefault(str(disk_mb), 0)
-            ram_free_units = _free_units(compute_values['free_ram_mb'],
-                    memory_mb)
-            disk_free_units = _free_units(compute_values['free_disk_mb'],
-                    disk_mb)
-            ram_mb_free_units[str(memory_mb)] += ram_free_units
-            disk_mb_free_units[str(disk_mb)] += disk_free_units
-
-        instance_types = self.db.instance_type_get_all(context)
-
-        for compute_values in compute_hosts.values():
-            total_ram_mb_free += compute_values['free_ram_mb']
-            total_disk_mb_free += compute_values['free_disk_mb']
-            for instance_type in instance_types:
-                _update_from_values(compute_values, instance_type)
-
-        capacities = {'ram_free': {'total_mb': total_ram_mb_free,
-                                   'units_by_mb': ram_mb_free_units},
-                      'disk_free': {'total_mb': total_disk_mb_free,
-                                    'units_by_mb': disk_mb_free_units}}
-        self.my_cell_state.update_capacities(capacities)
+            self._capacity_instance_types.append((memory_mb, disk_mb))
+            self._ram_mb_free_units[str(memory_mb)] = 0
+            self._disk_mb_free_units[str(disk_mb)] = 0
+
+    def _add_host_capacity(self, compute_values, sign):
+        """Add (sign=1) or remove (sign=-1) the capacity of a compute node
+        to/from the running totals.
+        """
+        free_ram_mb = compute_values['free_ram_mb']
+        free_disk_mb = compute_values['free_disk_mb']
+        self._total_ram_mb_free += sign * free_ram_mb
+        self._total_disk_mb_free += sign * free_disk_mb
+        for memory_mb, disk_mb in self._capacity_instance_types:
+            self._ram_mb_free_units[str(memory_mb)] += sign * _free_units(
+                    free_ram_mb, memory_mb)
+            self._disk_mb_free_units[str(disk_mb)] += sign * _free_units(
+                    free_disk_mb, disk_mb)
 
     @lockutils.synchronized('cell-db-sync', 'nova-')
     def _cell_db_sync(self):
@@ -298,6 +401,18 @@ class CellStateManager(base.Base):
     def get_child_cell(self, cell_name):
         return self.child_cells.get(cell_name)
 
+    def get_routing_table(self):
+        """Return the dict of the neighbor cell to send targeted messages
+        to next, by (direction, routing path, target cell).  Routes are
+        added to it as they are first looked up, it is replaced by an
+        empty one when neighbor cells are added or removed.
+
+        This doesn't sync from the DB, so that looking a route up costs
+        no more than a dict lookup.  Working out a new route does, and
+        so do the periodic tasks of the manager.
+        """
+        return self.routing_table
+
     @sync_from_db
     def update_cell_capabilities(self, cell_name, capabilities):
         """Update capabilities for a cell."""
@@ -312,10 +427,13 @@ class CellStateManager(base.Base):
         for capab_name, values in capabilities.items():
             capabilities[capab_name] = set(values)
         cell.update_capabilities(capabilities)
+        self._our_capabilities = None
 
     @sync_from_db
-    def update_cell_capacities(self, cell_name, capacities):
-        """Update capacities for a cell."""
+    def update_cell_capacities(self, cell_name, capacities, partial=False):
+        """Update capacities for a cell.  If partial is True, capacities
+        only holds the values that changed.
+        """
         cell = self.child_cells.get(cell_name)
         if not cell:
             cell = self.parent_cells.get(cell_name)
@@ -323,18 +441,26 @@ class CellStateManager(base.Base):
             LOG.error(_("Unknown cell '%(cell_name)s' when trying to "
                         "update capacities"), locals())
             return
-        cell.update_capacities(capacities)
+        cell.update_capacities(capacities, partial=partial)
+        self._our_capacities = None
 
     @sync_from_db
     def get_our_capabilities(self, include_children=True):
-        capabs = copy.deepcopy(self.my_cell_state.capabilities)
-        if include_children:
+        """Return our capabilities, merged with those of our children if
+        include_children is True.  The merged capabilities are only
+        rebuilt when they change, so they must not be modified.
+        """
+        if not include_children:
+            return copy.deepcopy(self.my_cell_state.capabilities)
+        if self._our_capabilities is None:
+            capabs = copy.deepcopy(self.my_cell_state.capabilities)
             for cell in self.child_cells.values():
                 for capab_name, values in cell.capabilities.items():
                     if capab_name not in capabs:
                         capabs[capab_name] = set([])
                     capabs[capab_name] |= values
-        return capabs
+            self._our_capabilities = capabs
+        return self._our_capabilities
 
     def _add_to_dict(self, target, src):
         for key, value in src.items():
@@ -347,8 +473,39 @@ class CellStateManager(base.Base):
 
     @sync_from_db
     def get_our_capacities(self, include_children=True):
-        capacities = copy.deepcopy(self.my_cell_state.capacities)
-        if include_children:
+        """Return our capacities, added to those of our children if
+        include_children is True.  The added capacities are only
+        rebuilt when they change, so they must not be modified.
+        """
+        if not include_children:
+            return copy.deepcopy(self.my_cell_state.capacities)
+        if self._our_capacities is None:
+            capacities = copy.deepcopy(self.my_cell_state.capacities)
             for cell in self.child_cells.values():
                 self._add_to_dict(capacities, cell.capacities)
-        return capacities
+            self._our_capacities = capacities
+        return self._our_capacities
+
+    @sync_from_db
+    def get_our_capacity_changes(self, full=False):
+        """Return our capacities, including those of our children, to
+        report to our parents, and whether they only hold the values
+        that changed since the last call.
+
+        All capacities are returned if full is True, if
+        CONF.cells.send_capacity_changes is False, on the first call, if an
+        instance_type went away or if they were last all returned
+        CONF.cells.capacity_full_refresh_interval seconds ago or more.
+        """
+        capacities = self.get_our_capacities()
+        changes = None
+        if (not full and CONF.cells.send_capacity_changes and
+                self._reported_capacities is not None and
+                not timeutils.is_older_than(self._capacities_reported_at,
+                        CONF.cells.capacity_full_refresh_interval)):
+            changes = _dict_changes(self._reported_capacities, capacities)
+        self._reported_capacities = copy.deepcopy(capacities)
+        if changes is None:
+            self._capacities_reported_at = timeutils.utcnow()
+            return capacities, False
+        return changes, True
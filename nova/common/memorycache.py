@@ -16,15 +16,28 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-"""Super simple fake memcache client."""
+"""Super simple fake memcache client.
+
+Keys are kept in least recently used order and expire through a heap of
+expiry times, so that reads and writes don't depend on the number of
+cached keys.  At most memory_cache_size keys are kept, the least recently
+used ones are evicted first.
+"""
+
+import heapq
 
 from nova.openstack.common import cfg
 from nova.openstack.common import timeutils
+from nova import utils
 
 memcache_opts = [
     cfg.ListOpt('memcached_servers',
                 default=None,
                 help='Memcached servers or None for in process cache.'),
+    cfg.IntOpt('memory_cache_size',
+               default=10000,
+               help='Maximum number of keys kept by the in process cache, '
+                    '0 for no limit'),
 ]
 
 CONF = cfg.CONF
@@ -46,26 +59,55 @@ class Client(object):
 
     def __init__(self, *args, **kwargs):
         """Ignores the passed in args."""
-        self.cache = {}
+        self.cache = utils.LRUDict()
+        self.expiries = []
+        self.max_size = CONF.memory_cache_size
+        self.stats = {'get_hits': 0, 'get_misses': 0, 'evictions': 0,
+                      'expired': 0}
+
+    def _expire(self):
+        """Drops the keys whose time has come."""
+        now = timeutils.utcnow_ts()
+        while self.expiries and self.expiries[0][0] <= now:
+            timeout, key = heapq.heappop(self.expiries)
+            # NOTE: keys set again since are still in the heap with their
+            # old timeout, only drop the key if that's its current one.
+            item = self.cache.peek(key)
+            if item is not None and item[0] == timeout:
+                del self.cache[key]
+                self.stats['expired'] += 1
 
     def get(self, key):
         """Retrieves the value for a key or None.
 
         this expunges expired keys during each get"""
 
-        for k in self.cache.keys():
-            (timeout, _value) = self.cache[k]
-            if timeout and timeutils.utcnow_ts() >= timeout:
-                del self.cache[k]
-
-        return self.cache.get(key, (0, None))[1]
+        self._expire()
+        item = self.cache.get(key)
+        if item is None:
+            self.stats['get_misses'] += 1
+            return None
+        self.stats['get_hits'] += 1
+        return item[1]
 
     def set(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key."""
+        self._expire()
         timeout = 0
         if time != 0:
             timeout = timeutils.utcnow_ts() + time
+            heapq.heappush(self.expiries, (timeout, key))
         self.cache[key] = (timeout, value)
+
+        if self.max_size and len(self.cache) > self.max_size:
+            self.cache.popitem()
+            self.stats['evictions'] += 1
+        if len(self.expiries) > 2 * len(self.cache) + 64:
+            # Too many outdated entries, rebuild the heap from the keys.
+            self.expiries = [(item[0], k)
+                             for k, item in self.cache.iteritems()
+                             if item[0]]
+            heapq.heapify(self.expiries)
         return True
 
     def add(self, key, value, time=0, min_compress_len=0):
@@ -82,3 +124,16 @@ class Client(object):
         new_value = int(value) + delta
         self.cache[key] = (self.cache[key][0], str(new_value))
         return new_value
+
+    def delete(self, key, time=0):
+        """Deletes the value for a key."""
+        self._expire()
+        return self.cache.pop(key, None) is not None
+
+    def get_stats(self):
+        """Returns statistics like memcache.Client.get_stats() does."""
+        self._expire()
+        stats = dict(self.stats)
+        stats['curr_items'] = len(self.cache)
+        stats['limit_maxitems'] = self.max_size
+        return [('memorycache', stats)]
@@ -0,0 +1,77 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compact digest of the images cached on a compute host.
+
+Compute hosts report which images they have cached as a Bloom filter of the
+fingerprints of the image ids, in the 'image_cache_digest' stat of their
+compute node, so that the scheduler can prefer the hosts that won't have to
+download the image of an instance.  A digest may claim that an image is
+cached when it isn't, but never the other way around.
+
+The fingerprint of an image id is the sha1 hash that libvirt names the base
+images in its image cache after.
+"""
+
+import base64
+import hashlib
+import struct
+
+# Size of a digest, so that it fits in the 255 characters of the value of a
+# compute node stat once base64 encoded.  With 5 hashes, 100 images are
+# told apart from the others 99.6% of the time, 200 images 95% of the time.
+DIGEST_BYTES = 160
+NUM_HASHES = 5
+
+STAT_KEY = 'image_cache_digest'
+
+
+def image_fingerprint(image_id):
+    """Return the fingerprint of an image id."""
+    return hashlib.sha1(image_id).hexdigest()
+
+
+def _bit_positions(fingerprint):
+    hashed = hashlib.sha1(fingerprint).digest()
+    return [struct.unpack('>I', hashed[i * 4:i * 4 + 4])[0] %
+            (DIGEST_BYTES * 8) for i in xrange(NUM_HASHES)]
+
+
+def make_digest(fingerprints):
+    """Return the base64 encoded digest of image fingerprints."""
+    bits = bytearray(DIGEST_BYTES)
+    for fingerprint in fingerprints:
+        for position in _bit_positions(fingerprint):
+            bits[position // 8] |= 1 << (position % 8)
+    return base64.b64encode(bits)
+
+
+def digest_contains(digest, fingerprint):
+    """Return whether the image with the fingerprint is likely to be in
+    the digest.
+    """
+    try:
+        bits = bytearray(base64.b64decode(digest))
+    except TypeError:
+        return False
+    if len(bits) != DIGEST_BYTES:
+        return False
+    for position in _bit_positions(fingerprint):
+        if not bits[position // 8] & (1 << (position % 8)):
+            return False
+    return True
@@ -311,6 +311,9 @@ class ComputeVirtAPI(virtapi.VirtAPI):
         return self._compute.conductor_api.agent_build_get_by_triple(
             context, hypervisor, os, architecture)
 
+    def compute_node_get_all(self, context):
+        return self._compute.conductor_api.compute_node_get_all(context)
+
 
 class ComputeManager(manager.SchedulerDependentManager):
     """Manages the running instances from creation to destruction."""
@@ -365,6 +368,23 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         return instance_ref
 
+    def _instance_update_many(self, context, updates):
+        """Update many instances in the database.
+
+        :param updates: list of (instance_uuid, values) tuples
+        """
+        if not updates:
+            return []
+        instance_refs = self.conductor_api.instance_update_many(context,
+                                                                updates)
+        nodes = self.driver.get_available_nodes()
+        for instance_ref in instance_refs:
+            if (instance_ref['host'] == self.host and
+                instance_ref['node'] in nodes):
+                rt = self._get_resource_tracker(instance_ref.get('node'))
+                rt.update_usage(context, instance_ref)
+        return instance_refs
+
     def _set_instance_error_state(self, context, instance_uuid):
         try:
             self._instance_update(context, instance_uuid,
@@ -3205,6 +3225,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                 return
 
             refreshed = timeutils.utcnow()
+            usages = []
             for bw_ctr in bw_counters:
                 # Allow switching of greenthreads between queries.
                 greenthread.sleep(0)
@@ -3243,15 +3264,17 @@ class ComputeManager(manager.SchedulerDependentManager):
                     else:
                         bw_out += (bw_ctr['bw_out'] - last_ctr_out)
 
-                self.conductor_api.bw_usage_update(context,
-                                                   bw_ctr['uuid'],
-                                                   bw_ctr['mac_address'],
-                                                   start_time,
-                                                   bw_in,
-                                                   bw_out,
-                                                   bw_ctr['bw_in'],
-                                                   bw_ctr['bw_out'],
-                                                   last_refreshed=refreshed)
+                usages.append({'uuid': bw_ctr['uuid'],
+                               'mac': bw_ctr['mac_address'],
+                               'start_period': start_time,
+                               'bw_in': bw_in,
+                               'bw_out': bw_out,
+                               'last_ctr_in': bw_ctr['bw_in'],
+                               'last_ctr_out': bw_ctr['bw_out']})
+
+            if usages:
+                self.conductor_api.bw_usage_update_many(
+                    context, usages, last_refreshed=refreshed)
 
     def _get_host_volume_bdms(self, context, host):
         """Return all block device mappings on a compute host."""
@@ -3267,16 +3290,9 @@ class ComputeManager(manager.SchedulerDependentManager):
 
     def _update_volume_usage_cache(self, context, vol_usages, refreshed):
         """Updates the volume usage cache table with a list of stats."""
-        for usage in vol_usages:
-            # Allow switching of greenthreads between queries.
-            greenthread.sleep(0)
-            self.conductor_api.vol_usage_update(context, usage['volume'],
-                                                usage['rd_req'],
-                                                usage['rd_bytes'],
-                                                usage['wr_req'],
-                                                usage['wr_bytes'],
-                                                usage['instance'],
-                                                last_refreshed=refreshed)
+        if vol_usages:
+            self.conductor_api.vol_usage_update_many(
+                context, vol_usages, last_refreshed=refreshed)
 
     def _send_volume_usage_notifications(self, context, start_time):
         """Queries vol usage cache table and sends a vol usage notification."""
@@ -3343,9 +3359,10 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         To sync power state data we make a DB call to get the number of
         virtual machines known by the hypervisor and if the number matches the
-        number of virtual machines known by the database, we proceed in a lazy
-        loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        number of virtual machines known by the database, we get the power
+        state of each instance from the hypervisor, read the instances from
+        the database again and check if the hypervisor has the same power
+        state as is in the database.
 
         If the instance is not found on the hypervisor, but is in the database,
         then a stop() API will be called on the instance.
@@ -3360,8 +3377,19 @@ class ComputeManager(manager.SchedulerDependentManager):
             LOG.warn(_("Found %(num_db_instances)s in the database and "
                        "%(num_vm_instances)s on the hypervisor.") % locals())
 
+        # NOTE: power state corrections of instances that need no action
+        # are sent to the conductor at once when the loop is done.
+        power_state_updates = []
+        try:
+            self._sync_instance_power_states(context, db_instances,
+                                             power_state_updates)
+        finally:
+            self._instance_update_many(context, power_state_updates)
+
+    def _sync_instance_power_states(self, context, db_instances,
+                                    power_state_updates):
+        vm_power_states = {}
         for db_instance in db_instances:
-            db_power_state = db_instance['power_state']
             if db_instance['task_state'] is not None:
                 LOG.info(_("During sync_power_state the instance has a "
                            "pending task. Skip."), instance=db_instance)
@@ -3369,31 +3397,37 @@ class ComputeManager(manager.SchedulerDependentManager):
             # No pending tasks. Now try to figure out the real vm_power_state.
             try:
                 vm_instance = self.driver.get_info(db_instance)
-                vm_power_state = vm_instance['state']
+                vm_power_states[db_instance['uuid']] = vm_instance['state']
             except exception.InstanceNotFound:
-                vm_power_state = power_state.SHUTDOWN
-            # Note(maoy): the above get_info call might take a long time,
-            # for example, because of a broken libvirt driver.
-            # We re-query the DB to get the latest instance info to minimize
-            # (not eliminate) race condition.
-            u = self.conductor_api.instance_get_by_uuid(context,
-                                                        db_instance['uuid'])
-            db_power_state = u["power_state"]
-            vm_state = u['vm_state']
-            if self.host != u['host']:
+                vm_power_states[db_instance['uuid']] = power_state.SHUTDOWN
+        if not vm_power_states:
+            return
+
+        # Note(maoy): the above get_info calls might take a long time,
+        # for example, because of a broken libvirt driver.
+        # We re-query the DB to get the latest instance info to minimize
+        # (not eliminate) race condition.
+        latest_instances = dict(
+                (u['uuid'], u) for u in
+                self.conductor_api.instance_get_all_by_host(context,
+                                                            self.host))
+        for db_instance in db_instances:
+            if db_instance['uuid'] not in vm_power_states:
+                continue
+            vm_power_state = vm_power_states[db_instance['uuid']]
+            u = latest_instances.get(db_instance['uuid'])
+            if u is None:
                 # on the sending end of nova-compute _sync_power_state
                 # may have yielded to the greenthread performing a live
                 # migration; this in turn has changed the resident-host
                 # for the VM; However, the instance is still active, it
                 # is just in the process of migrating to another host.
                 # This implies that the compute source must relinquish
-                # control to the compute destination.
+                # control to the compute destination.  The instance may
+                # also have been deleted meanwhile.
                 LOG.info(_("During the sync_power process the "
-                           "instance has moved from "
-                           "host %(src)s to host %(dst)s") %
-                           {'src': self.host,
-                            'dst': u['host']},
-                         instance=db_instance)
+                           "instance has moved from host %s or was "
+                           "deleted"), self.host, instance=db_instance)
                 continue
             elif u['task_state'] is not None:
                 # on the receiving end of nova-compute, it could happen
@@ -3404,14 +3438,11 @@ class ComputeManager(manager.SchedulerDependentManager):
                 LOG.info(_("During sync_power_state the instance has a "
                            "pending task. Skip."), instance=db_instance)
                 continue
-            if vm_power_state != db_power_state:
-                # power_state is always updated from hypervisor to db
-                self._instance_update(context,
-                                      db_instance['uuid'],
-                                      power_state=vm_power_state)
-                db_power_state = vm_power_state
+            db_power_state = u["power_state"]
+            vm_state = u['vm_state']
             # Note(maoy): Now resolve the discrepancy between vm_state and
             # vm_power_state. We go through all possible vm_states.
+            stop = False
             if vm_state in (vm_states.BUILDING,
                             vm_states.RESCUED,
                             vm_states.RESIZED,
@@ -3426,28 +3457,11 @@ class ComputeManager(manager.SchedulerDependentManager):
                                       power_state.CRASHED):
                     LOG.warn(_("Instance shutdown by itself. Calling "
                                "the stop API."), instance=db_instance)
-                    try:
-                        # Note(maoy): here we call the API instead of
-                        # brutally updating the vm_state in the database
-                        # to allow all the hooks and checks to be performed.
-                        self.compute_api.stop(context, db_instance)
-                    except Exception:
-                        # Note(maoy): there is no need to propagate the error
-                        # because the same power_state will be retrieved next
-                        # time and retried.
-                        # For example, there might be another task scheduled.
-                        LOG.exception(_("error during stop() in "
-                                        "sync_power_state."),
-                                      instance=db_instance)
+                    stop = True
                 elif vm_power_state == power_state.SUSPENDED:
                     LOG.warn(_("Instance is suspended unexpectedly. Calling "
                                "the stop API."), instance=db_instance)
-                    try:
-                        self.compute_api.stop(context, db_instance)
-                    except Exception:
-                        LOG.exception(_("error during stop() in "
-                                        "sync_power_state."),
-                                      instance=db_instance)
+                    stop = True
                 elif vm_power_state == power_state.PAUSED:
                     # Note(maoy): a VM may get into the paused state not only
                     # because the user request via API calls, but also
@@ -3462,16 +3476,11 @@ class ComputeManager(manager.SchedulerDependentManager):
                 if vm_power_state not in (power_state.NOSTATE,
                                           power_state.SHUTDOWN,
                                           power_state.CRASHED):
+                    # Note(maoy): this assumes that the stop API is
+                    # idempotent.
                     LOG.warn(_("Instance is not stopped. Calling "
                                "the stop API."), instance=db_instance)
-                    try:
-                        # Note(maoy): this assumes that the stop API is
-                        # idempotent.
-                        self.compute_api.stop(context, db_instance)
-                    except Exception:
-                        LOG.exception(_("error during stop() in "
-                                        "sync_power_state."),
-                                      instance=db_instance)
+                    stop = True
             elif vm_state in (vm_states.SOFT_DELETED,
                               vm_states.DELETED):
                 if vm_power_state not in (power_state.NOSTATE,
@@ -3481,6 +3490,33 @@ class ComputeManager(manager.SchedulerDependentManager):
                     LOG.warn(_("Instance is not (soft-)deleted."),
                              instance=db_instance)
 
+            if vm_power_state != db_power_state:
+                # power_state is always updated from hypervisor to db
+                if stop:
+                    # NOTE: written before stopping, so that it can't land
+                    # after the power_state set by stop_instance.
+                    self._instance_update(context,
+                                          db_instance['uuid'],
+                                          power_state=vm_power_state)
+                else:
+                    power_state_updates.append(
+                            (db_instance['uuid'],
+                             {'power_state': vm_power_state}))
+            if stop:
+                try:
+                    # Note(maoy): here we call the API instead of
+                    # brutally updating the vm_state in the database
+                    # to allow all the hooks and checks to be performed.
+                    self.compute_api.stop(context, db_instance)
+                except Exception:
+                    # Note(maoy): there is no need to propagate the error
+                    # because the same power_state will be retrieved next
+                    # time and retried.
+                    # For example, there might be another task scheduled.
+                    LOG.exception(_("error during stop() in "
+                                    "sync_power_state."),
+                                  instance=db_instance)
+
     @manager.periodic_task
     def _reclaim_queued_deletes(self, context):
         """Reclaim instances that are queued for deletion."""
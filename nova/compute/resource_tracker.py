@@ -20,6 +20,7 @@ model.
 """
 
 from nova.compute import claims
+from nova.compute import image_digest
 from nova.compute import instance_types
 from nova.compute import task_states
 from nova.compute import vm_states
@@ -62,6 +63,7 @@ class ResourceTracker(object):
         self.stats = importutils.import_object(CONF.compute_stats_class)
         self.tracked_instances = {}
         self.tracked_migrations = {}
+        self.image_cache_digest = None
         self.conductor_api = conductor.API()
 
     @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-')
@@ -265,10 +267,32 @@ class ResourceTracker(object):
         orphans = self._find_orphaned_instances()
         self._update_usage_from_orphans(resources, orphans)
 
+        self._update_image_cache_digest(resources)
+
         self._report_final_resource_view(resources)
 
         self._sync_compute_node(context, resources)
 
+    def _update_image_cache_digest(self, resources):
+        """Report the digest of the images cached on this host in the
+        stats, for the scheduler to prefer hosts that have the image of
+        an instance.  The last digest is reported again when the driver
+        fails to list the cached images.
+        """
+        try:
+            fingerprints = self.driver.get_cached_image_fingerprints()
+        except Exception:
+            LOG.exception(_("Could not list the images cached on this "
+                            "host, reporting the last image cache digest"))
+        else:
+            if fingerprints is None:
+                return
+            self.image_cache_digest = image_digest.make_digest(fingerprints)
+        if self.image_cache_digest is None:
+            return
+        self.stats[image_digest.STAT_KEY] = self.image_cache_digest
+        resources['stats'] = self.stats
+
     def _sync_compute_node(self, context, resources):
         """Create or update the compute node DB record."""
         if not self.compute_node:
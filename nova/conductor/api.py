@@ -29,6 +29,10 @@ conductor_opts = [
     cfg.StrOpt('topic',
                default='conductor',
                help='the topic conductor nodes listen on'),
+    cfg.IntOpt('workers',
+               default=None,
+               help='Number of worker processes for the conductor service, '
+                    'all consuming from the same topic'),
     cfg.StrOpt('manager',
                default='nova.conductor.manager.ConductorManager',
                help='full class name for the Manager for conductor'),
@@ -63,6 +67,14 @@ class LocalAPI(object):
         return self._manager.instance_update(context, instance_uuid,
                                              updates, 'compute')
 
+    def instance_update_many(self, context, updates):
+        """Perform updates of many instances in the database.
+
+        :param updates: list of (instance_uuid, updates) tuples
+        """
+        return self._manager.instance_update_many(context, updates,
+                                                  'compute')
+
     def instance_get(self, context, instance_id):
         return self._manager.instance_get(context, instance_id)
 
@@ -170,6 +182,10 @@ class LocalAPI(object):
                                              last_ctr_in, last_ctr_out,
                                              last_refreshed)
 
+    def bw_usage_update_many(self, context, usages, last_refreshed=None):
+        return self._manager.bw_usage_update_many(context, usages,
+                                                  last_refreshed)
+
     def get_backdoor_port(self, context, host):
         raise exc.InvalidRequest
 
@@ -233,6 +249,10 @@ class LocalAPI(object):
                                               instance, last_refreshed,
                                               update_totals)
 
+    def vol_usage_update_many(self, context, usages, last_refreshed=None):
+        return self._manager.vol_usage_update_many(context, usages,
+                                                   last_refreshed)
+
     def service_get_all(self, context):
         return self._manager.service_get_all_by(context)
 
@@ -274,6 +294,9 @@ class LocalAPI(object):
         return self._manager.compute_node_update(context, node, values,
                                                  prune_stats)
 
+    def compute_node_get_all(self, context):
+        return self._manager.compute_node_get_all(context)
+
     def service_update(self, context, service, values):
         return self._manager.service_update(context, service, values)
 
@@ -352,6 +375,14 @@ class API(object):
         return self.conductor_rpcapi.instance_update(context, instance_uuid,
                                                      updates, 'conductor')
 
+    def instance_update_many(self, context, updates):
+        """Perform updates of many instances in the database.
+
+        :param updates: list of (instance_uuid, updates) tuples
+        """
+        return self.conductor_rpcapi.instance_update_many(context, updates,
+                                                          'conductor')
+
     def instance_destroy(self, context, instance):
         return self.conductor_rpcapi.instance_destroy(context, instance)
 
@@ -469,6 +500,10 @@ class API(object):
             bw_in, bw_out, last_ctr_in, last_ctr_out,
             last_refreshed)
 
+    def bw_usage_update_many(self, context, usages, last_refreshed=None):
+        return self.conductor_rpcapi.bw_usage_update_many(context, usages,
+                                                          last_refreshed)
+
     #NOTE(mtreinish): This doesn't work on multiple conductors without any
     # topic calculation in conductor_rpcapi. So the host param isn't used
     # currently.
@@ -538,6 +573,10 @@ class API(object):
                                                       instance, last_refreshed,
                                                       update_totals)
 
+    def vol_usage_update_many(self, context, usages, last_refreshed=None):
+        return self.conductor_rpcapi.vol_usage_update_many(context, usages,
+                                                           last_refreshed)
+
     def service_get_all(self, context):
         return self.conductor_rpcapi.service_get_all_by(context)
 
@@ -580,6 +619,9 @@ class API(object):
         return self.conductor_rpcapi.compute_node_update(context, node,
                                                          values, prune_stats)
 
+    def compute_node_get_all(self, context):
+        return self.conductor_rpcapi.compute_node_get_all(context)
+
     def service_update(self, context, service, values):
         return self.conductor_rpcapi.service_update(context, service, values)
 
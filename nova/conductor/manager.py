@@ -46,7 +46,7 @@ datetime_fields = ['launched_at', 'terminated_at']
 class ConductorManager(manager.SchedulerDependentManager):
     """Mission: TBD."""
 
-    RPC_API_VERSION = '1.40'
+    RPC_API_VERSION = '1.42'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
@@ -62,6 +62,25 @@ class ConductorManager(manager.SchedulerDependentManager):
                                   exception.UnexpectedTaskStateError)
     def instance_update(self, context, instance_uuid,
                         updates, service=None):
+        self._check_instance_updates(instance_uuid, updates)
+        old_ref, instance_ref = self.db.instance_update_and_get_original(
+            context, instance_uuid, updates)
+        notifications.send_update(context, old_ref, instance_ref, service)
+        return jsonutils.to_primitive(instance_ref)
+
+    @rpc_common.client_exceptions(KeyError, ValueError,
+                                  exception.InvalidUUID,
+                                  exception.UnexpectedTaskStateError)
+    def instance_update_many(self, context, updates, service=None):
+        for instance_uuid, values in updates:
+            self._check_instance_updates(instance_uuid, values)
+        results = self.db.instance_update_many(context, updates)
+        for old_ref, instance_ref in results:
+            notifications.send_update(context, old_ref, instance_ref, service)
+        return jsonutils.to_primitive([instance_ref
+                                       for old_ref, instance_ref in results])
+
+    def _check_instance_updates(self, instance_uuid, updates):
         for key, value in updates.iteritems():
             if key not in allowed_updates:
                 LOG.error(_("Instance update attempted for "
@@ -70,11 +89,6 @@ class ConductorManager(manager.SchedulerDependentManager):
             if key in datetime_fields and isinstance(value, basestring):
                 updates[key] = timeutils.parse_strtime(value)
 
-        old_ref, instance_ref = self.db.instance_update_and_get_original(
-            context, instance_uuid, updates)
-        notifications.send_update(context, old_ref, instance_ref, service)
-        return jsonutils.to_primitive(instance_ref)
-
     @rpc_common.client_exceptions(exception.InstanceNotFound)
     def instance_get(self, context, instance_id):
         return jsonutils.to_primitive(
@@ -174,6 +188,15 @@ class ConductorManager(manager.SchedulerDependentManager):
         usage = self.db.bw_usage_get(context, uuid, start_period, mac)
         return jsonutils.to_primitive(usage)
 
+    def bw_usage_update_many(self, context, usages, last_refreshed=None):
+        for usage in usages:
+            if isinstance(usage['start_period'], basestring):
+                usage['start_period'] = timeutils.parse_strtime(
+                    usage['start_period'])
+        if isinstance(last_refreshed, basestring):
+            last_refreshed = timeutils.parse_strtime(last_refreshed)
+        self.db.bw_usage_update_many(context, usages, last_refreshed)
+
     def get_backdoor_port(self, context):
         return self.backdoor_port
 
@@ -278,6 +301,18 @@ class ConductorManager(manager.SchedulerDependentManager):
                                  wr_bytes, instance['uuid'], last_refreshed,
                                  update_totals)
 
+    def vol_usage_update_many(self, context, usages, last_refreshed=None):
+        if isinstance(last_refreshed, basestring):
+            last_refreshed = timeutils.parse_strtime(last_refreshed)
+        db_usages = [{'id': usage['volume'],
+                      'rd_req': usage['rd_req'],
+                      'rd_bytes': usage['rd_bytes'],
+                      'wr_req': usage['wr_req'],
+                      'wr_bytes': usage['wr_bytes'],
+                      'instance_id': usage['instance']['uuid']}
+                     for usage in usages]
+        self.db.vol_usage_update_many(context, db_usages, last_refreshed)
+
     @rpc_common.client_exceptions(exception.HostBinaryNotFound)
     def service_get_all_by(self, context, topic=None, host=None, binary=None):
         if not any((topic, host, binary)):
@@ -324,6 +359,10 @@ class ConductorManager(manager.SchedulerDependentManager):
                                              prune_stats)
         return jsonutils.to_primitive(result)
 
+    def compute_node_get_all(self, context):
+        result = self.db.compute_node_get_all(context)
+        return jsonutils.to_primitive(result)
+
     @rpc_common.client_exceptions(exception.ServiceNotFound)
     def service_update(self, context, service, values):
         svc = self.db.service_update(context, service['id'], values)
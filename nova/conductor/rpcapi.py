@@ -74,6 +74,9 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     1.39 - Added notify_usage_exists
     1.40 - Added security_groups_trigger_handler and
                  security_groups_trigger_members_refresh
+    1.41 - Added instance_update_many, bw_usage_update_many and
+           vol_usage_update_many
+    1.42 - Added compute_node_get_all
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -98,6 +101,12 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                                        service=service),
                          version='1.38')
 
+    def instance_update_many(self, context, updates, service=None):
+        updates_p = jsonutils.to_primitive(updates)
+        msg = self.make_msg('instance_update_many', updates=updates_p,
+                            service=service)
+        return self.call(context, msg, version='1.41')
+
     def instance_get(self, context, instance_id):
         msg = self.make_msg('instance_get',
                             instance_id=instance_id)
@@ -183,6 +192,13 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                             last_refreshed=last_refreshed)
         return self.call(context, msg, version='1.5')
 
+    def bw_usage_update_many(self, context, usages, last_refreshed=None):
+        usages_p = jsonutils.to_primitive(usages)
+        last_refreshed_p = jsonutils.to_primitive(last_refreshed)
+        msg = self.make_msg('bw_usage_update_many', usages=usages_p,
+                            last_refreshed=last_refreshed_p)
+        return self.call(context, msg, version='1.41')
+
     def get_backdoor_port(self, context):
         msg = self.make_msg('get_backdoor_port')
         return self.call(context, msg, version='1.6')
@@ -289,6 +305,13 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                             update_totals=update_totals)
         return self.call(context, msg, version='1.19')
 
+    def vol_usage_update_many(self, context, usages, last_refreshed=None):
+        usages_p = jsonutils.to_primitive(usages)
+        last_refreshed_p = jsonutils.to_primitive(last_refreshed)
+        msg = self.make_msg('vol_usage_update_many', usages=usages_p,
+                            last_refreshed=last_refreshed_p)
+        return self.call(context, msg, version='1.41')
+
     def service_get_all_by(self, context, topic=None, host=None, binary=None):
         msg = self.make_msg('service_get_all_by', topic=topic, host=host,
                             binary=binary)
@@ -341,6 +364,10 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                             prune_stats=prune_stats)
         return self.call(context, msg, version='1.33')
 
+    def compute_node_get_all(self, context):
+        msg = self.make_msg('compute_node_get_all')
+        return self.call(context, msg, version='1.42')
+
     def service_update(self, context, service, values):
         service_p = jsonutils.to_primitive(service)
         msg = self.make_msg('service_update', service=service_p, values=values)
@@ -109,6 +109,15 @@ def not_equal(*values):
     return IMPL.not_equal(*values)
 
 
+def dispose_engine():
+    """Close the pooled database connections of this process, if any.
+
+    Done before forking worker processes, so that workers open their own
+    connections rather than sharing those of their parent.
+    """
+    return IMPL.dispose_engine()
+
+
 ###################
 
 
@@ -204,6 +213,11 @@ def compute_node_get_by_host(context, host):
     return IMPL.compute_node_get_by_host(context, host)
 
 
+def compute_node_get_by_hosts(context, hosts):
+    """Get the capacity entries of all the given hosts."""
+    return IMPL.compute_node_get_by_hosts(context, hosts)
+
+
 def compute_node_statistics(context):
     return IMPL.compute_node_statistics(context)
 
@@ -439,6 +453,17 @@ def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
                                         instance_uuid, host)
 
 
+def fixed_ip_associate_if_free(context, address, network_id,
+                               instance_uuid=None, host=None):
+    """Associate a fixed ip to an instance or host if it is still free.
+
+    This is a single conditional update, it returns whether it succeeded.
+
+    """
+    return IMPL.fixed_ip_associate_if_free(context, address, network_id,
+                                           instance_uuid, host)
+
+
 def fixed_ip_create(context, values):
     """Create a fixed ip from the values dictionary."""
     return IMPL.fixed_ip_create(context, values)
@@ -459,6 +484,11 @@ def fixed_ip_disassociate_all_by_timeout(context, host, time):
     return IMPL.fixed_ip_disassociate_all_by_timeout(context, host, time)
 
 
+def fixed_ip_get_free_addresses(context, network_id):
+    """Get the addresses of all unreserved, unassociated ips of a network."""
+    return IMPL.fixed_ip_get_free_addresses(context, network_id)
+
+
 def fixed_ip_get(context, id, get_network=False):
     """Get fixed ip by id or raise if it does not exist.
 
@@ -502,6 +532,17 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return IMPL.fixed_ips_by_virtual_interface(context, vif_id)
 
 
+def fixed_ip_get_all_by_address_filter(context, address_like=None,
+                                       address=None):
+    """Get the instance addresses matching a LIKE pattern or an address.
+
+    Returns a dict per fixed ip and floating ip pair, with the
+    instance_uuid, fixed address and floating address (or None).
+    """
+    return IMPL.fixed_ip_get_all_by_address_filter(context, address_like,
+                                                   address)
+
+
 def fixed_ip_update(context, address, values):
     """Create a fixed ip from the values dictionary."""
     return IMPL.fixed_ip_update(context, address, values)
@@ -588,6 +629,14 @@ def instance_get_by_uuid(context, uuid):
     return IMPL.instance_get_by_uuid(context, uuid)
 
 
+def instance_get_updated_at(context, uuid):
+    """Get when an instance was last updated, or created if it never was.
+
+    Raises if the instance does not exist.
+    """
+    return IMPL.instance_get_updated_at(context, uuid)
+
+
 def instance_get(context, instance_id):
     """Get an instance or raise if it does not exist."""
     return IMPL.instance_get(context, instance_id)
@@ -713,6 +762,27 @@ def instance_update_and_get_original(context, instance_uuid, values):
     return rv
 
 
+def instance_update_many(context, updates, update_cells=True):
+    """Set the given properties on many instances in one transaction.
+
+    :param updates: list of (instance_uuid, values) tuples
+
+    :returns: a list of (old_instance_ref, new_instance_ref) tuples like
+              instance_update_and_get_original(), instances that don't
+              exist anymore are skipped.
+    """
+    rv = IMPL.instance_update_many(context, updates)
+    if not update_cells:
+        return rv
+    for old_ref, instance_ref in rv:
+        try:
+            cells_rpcapi.CellsAPI().instance_update_at_top(context,
+                                                           instance_ref)
+        except Exception:
+            LOG.exception(_("Failed to notify cells of instance update"))
+    return rv
+
+
 def instance_add_security_group(context, instance_id, security_group_id):
     """Associate the given security group with the given instance."""
     return IMPL.instance_add_security_group(context, instance_id,
@@ -854,9 +924,14 @@ def network_in_use_on_host(context, network_id, host=None):
     return IMPL.network_in_use_on_host(context, network_id, host)
 
 
-def network_get_associated_fixed_ips(context, network_id, host=None):
-    """Get all network's ips that have been associated."""
-    return IMPL.network_get_associated_fixed_ips(context, network_id, host)
+def network_get_associated_fixed_ips(context, network_id, host=None,
+                                     address=None):
+    """Get all network's ips that have been associated.
+
+    If address is given, only that ip is returned, if it is associated.
+    """
+    return IMPL.network_get_associated_fixed_ips(context, network_id, host,
+                                                 address)
 
 
 def network_get_by_bridge(context, bridge):
@@ -1095,6 +1170,12 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                                                          instance_uuid)
 
 
+def block_device_mapping_get_all_by_instances(context, instance_uuids):
+    """Get all block device mapping belonging to several instances."""
+    return IMPL.block_device_mapping_get_all_by_instances(context,
+                                                          instance_uuids)
+
+
 def block_device_mapping_destroy(context, bdm_id):
     """Destroy the block device mapping."""
     return IMPL.block_device_mapping_destroy(context, bdm_id)
@@ -1464,6 +1545,29 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
     return rv
 
 
+def bw_usage_update_many(context, usages, last_refreshed=None,
+                         update_cells=True):
+    """Update cached bandwidth usage of many networks in one transaction.
+
+    :param usages: list of dicts with the uuid, mac, start_period, bw_in,
+                   bw_out, last_ctr_in and last_ctr_out arguments of
+                   bw_usage_update()
+    """
+    rv = IMPL.bw_usage_update_many(context, usages,
+                                   last_refreshed=last_refreshed)
+    if update_cells:
+        for usage in usages:
+            try:
+                cells_rpcapi.CellsAPI().bw_usage_update_at_top(context,
+                        usage['uuid'], usage['mac'], usage['start_period'],
+                        usage['bw_in'], usage['bw_out'],
+                        usage['last_ctr_in'], usage['last_ctr_out'],
+                        last_refreshed)
+            except Exception:
+                LOG.exception(_("Failed to notify cells of bw_usage update"))
+    return rv
+
+
 ####################
 
 
@@ -1503,6 +1607,16 @@ def vol_usage_update(context, id, rd_req, rd_bytes, wr_req, wr_bytes,
                                  update_totals=update_totals)
 
 
+def vol_usage_update_many(context, usages, last_refreshed=None):
+    """Update cached current usage of many volumes in one transaction.
+
+    :param usages: list of dicts with the id, rd_req, rd_bytes, wr_req,
+                   wr_bytes and instance_id arguments of vol_usage_update()
+    """
+    return IMPL.vol_usage_update_many(context, usages,
+                                      last_refreshed=last_refreshed)
+
+
 ###################
 
 
@@ -1516,6 +1630,11 @@ def s3_image_get_by_uuid(context, image_uuid):
     return IMPL.s3_image_get_by_uuid(context, image_uuid)
 
 
+def s3_image_get_by_uuids(context, image_uuids):
+    """Find the local s3 images represented by the provided uuids."""
+    return IMPL.s3_image_get_by_uuids(context, image_uuids)
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid."""
     return IMPL.s3_image_create(context, image_uuid)
@@ -1524,9 +1643,26 @@ def s3_image_create(context, image_uuid):
 ####################
 
 
+# NOTE: bumped each time this process changes aggregates, so that what is
+# derived from aggregate metadata can tell when it is out of date.
+_AGGREGATE_GENERATION = 0
+
+
+def _aggregates_changed():
+    global _AGGREGATE_GENERATION
+    _AGGREGATE_GENERATION += 1
+
+
+def aggregate_generation():
+    """Get a number that changes whenever this process changes aggregates."""
+    return _AGGREGATE_GENERATION
+
+
 def aggregate_create(context, values, metadata=None):
     """Create a new aggregate with metadata."""
-    return IMPL.aggregate_create(context, values, metadata)
+    aggregate = IMPL.aggregate_create(context, values, metadata)
+    _aggregates_changed()
+    return aggregate
 
 
 def aggregate_get(context, aggregate_id):
@@ -1561,12 +1697,15 @@ def aggregate_host_get_by_metadata_key(context, key):
 def aggregate_update(context, aggregate_id, values):
     """Update the attributes of an aggregates. If values contains a metadata
     key, it updates the aggregate metadata too."""
-    return IMPL.aggregate_update(context, aggregate_id, values)
+    aggregate = IMPL.aggregate_update(context, aggregate_id, values)
+    _aggregates_changed()
+    return aggregate
 
 
 def aggregate_delete(context, aggregate_id):
     """Delete an aggregate."""
-    return IMPL.aggregate_delete(context, aggregate_id)
+    IMPL.aggregate_delete(context, aggregate_id)
+    _aggregates_changed()
 
 
 def aggregate_get_all(context):
@@ -1577,6 +1716,7 @@ def aggregate_get_all(context):
 def aggregate_metadata_add(context, aggregate_id, metadata, set_delete=False):
     """Add/update metadata. If set_delete=True, it adds only."""
     IMPL.aggregate_metadata_add(context, aggregate_id, metadata, set_delete)
+    _aggregates_changed()
 
 
 def aggregate_metadata_get(context, aggregate_id):
@@ -1587,11 +1727,13 @@ def aggregate_metadata_get(context, aggregate_id):
 def aggregate_metadata_delete(context, aggregate_id, key):
     """Delete the given metadata key."""
     IMPL.aggregate_metadata_delete(context, aggregate_id, key)
+    _aggregates_changed()
 
 
 def aggregate_host_add(context, aggregate_id, host):
     """Add host to the aggregate."""
     IMPL.aggregate_host_add(context, aggregate_id, host)
+    _aggregates_changed()
 
 
 def aggregate_host_get_all(context, aggregate_id):
@@ -1602,6 +1744,7 @@ def aggregate_host_get_all(context, aggregate_id):
 def aggregate_host_delete(context, aggregate_id, host):
     """Delete the given host from the aggregate."""
     IMPL.aggregate_host_delete(context, aggregate_id, host)
+    _aggregates_changed()
 
 
 ####################
@@ -1672,6 +1815,11 @@ def get_ec2_instance_id_by_uuid(context, instance_id):
     return IMPL.get_ec2_instance_id_by_uuid(context, instance_id)
 
 
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    """Get a dict of the ec2 ids of several instances, keyed by uuid."""
+    return IMPL.get_ec2_instance_ids_by_uuids(context, instance_uuids)
+
+
 def get_instance_uuid_by_ec2_id(context, ec2_id):
     """Get uuid through ec2 id from instance_id_mappings table."""
     return IMPL.get_instance_uuid_by_ec2_id(context, ec2_id)
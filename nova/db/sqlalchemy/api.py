@@ -31,6 +31,7 @@ from sqlalchemy import or_
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql.expression import asc
+from sqlalchemy.sql.expression import bindparam
 from sqlalchemy.sql.expression import desc
 from sqlalchemy.sql import func
 
@@ -293,6 +294,18 @@ def not_equal(*values):
     return InequalityCondition(values)
 
 
+def dispose_engine():
+    # NOTE: don't connect to the database just to close the connection.
+    if db_session._ENGINE is None:
+        return
+    engine = db_session.get_engine()
+    # NOTE: an in-memory sqlite database goes away with its connection.
+    if engine.name == 'sqlite' and engine.url.database in (None, '',
+                                                           ':memory:'):
+        return
+    engine.dispose()
+
+
 class Constraint(object):
 
     def __init__(self, conditions):
@@ -551,6 +564,17 @@ def compute_node_get_by_host(context, host):
     return result
 
 
+def compute_node_get_by_hosts(context, hosts):
+    """Get all capacity entries for the given hosts."""
+    if not hosts:
+        return []
+    return model_query(context, models.ComputeNode, read_deleted="no").\
+            join('service').\
+            options(joinedload('service')).\
+            filter(models.Service.host.in_(hosts)).\
+            all()
+
+
 def compute_node_statistics(context):
     """Compute statistics over all compute nodes."""
     result = model_query(context,
@@ -1046,6 +1070,27 @@ def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
     return fixed_ip_ref['address']
 
 
+@require_admin_context
+def fixed_ip_associate_if_free(context, address, network_id,
+                               instance_uuid=None, host=None):
+    if instance_uuid and not uuidutils.is_uuid_like(instance_uuid):
+        raise exception.InvalidUUID(uuid=instance_uuid)
+
+    values = {'updated_at': timeutils.utcnow()}
+    if instance_uuid:
+        values['instance_uuid'] = instance_uuid
+    if host:
+        values['host'] = host
+    result = model_query(context, models.FixedIp, read_deleted="no").\
+                     filter_by(network_id=network_id).\
+                     filter_by(address=address).\
+                     filter_by(reserved=False).\
+                     filter_by(instance_uuid=None).\
+                     filter_by(host=None).\
+                     update(values, synchronize_session=False)
+    return result == 1
+
+
 @require_context
 def fixed_ip_create(context, values):
     fixed_ip_ref = models.FixedIp()
@@ -1109,6 +1154,18 @@ def fixed_ip_disassociate_all_by_timeout(context, host, time):
         return result
 
 
+@require_admin_context
+def fixed_ip_get_free_addresses(context, network_id):
+    result = model_query(context, models.FixedIp.address,
+                         base_model=models.FixedIp, read_deleted="no").\
+                     filter_by(network_id=network_id).\
+                     filter_by(reserved=False).\
+                     filter_by(instance_uuid=None).\
+                     filter_by(host=None).\
+                     all()
+    return [row[0] for row in result]
+
+
 @require_context
 def fixed_ip_get(context, id, get_network=False):
     query = model_query(context, models.FixedIp).filter_by(id=id)
@@ -1230,6 +1287,48 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return result
 
 
+def _ip_address_like(column, pattern):
+    db_string = CONF.sql_connection.split(':')[0].split('+')[0]
+    if db_string == 'postgresql':
+        # NOTE: addresses are stored as inet, which LIKE can't match.
+        column = func.host(column)
+    return column.like(pattern)
+
+
+@require_context
+def fixed_ip_get_all_by_address_filter(context, address_like=None,
+                                       address=None):
+    query = model_query(context, models.FixedIp.address,
+                        models.VirtualInterface.instance_uuid,
+                        models.FloatingIp.address,
+                        base_model=models.FixedIp, read_deleted="no").\
+                join(models.VirtualInterface,
+                     models.FixedIp.virtual_interface_id ==
+                     models.VirtualInterface.id).\
+                outerjoin(models.FloatingIp,
+                          and_(models.FloatingIp.fixed_ip_id ==
+                               models.FixedIp.id,
+                               models.FloatingIp.deleted == 0)).\
+                filter(models.VirtualInterface.instance_uuid != None)
+
+    conditions = []
+    if address_like is not None:
+        conditions.append(_ip_address_like(models.FixedIp.address,
+                                           address_like))
+        conditions.append(_ip_address_like(models.FloatingIp.address,
+                                           address_like))
+    if address is not None:
+        conditions.append(models.FixedIp.address == address)
+    if conditions:
+        query = query.filter(or_(*conditions))
+
+    return [{'address': fixed_address,
+             'instance_uuid': instance_uuid,
+             'floating_address': floating_address}
+            for fixed_address, instance_uuid, floating_address
+            in query.order_by(models.FixedIp.id).all()]
+
+
 @require_context
 def fixed_ip_update(context, address, values):
     session = get_session()
@@ -1498,6 +1597,20 @@ def instance_get_by_uuid(context, uuid):
     return _instance_get_by_uuid(context, uuid)
 
 
+@require_context
+def instance_get_updated_at(context, uuid):
+    result = model_query(context, models.Instance.updated_at,
+                         models.Instance.created_at,
+                         base_model=models.Instance, project_only=True).\
+                filter(models.Instance.uuid == uuid).\
+                first()
+
+    if not result:
+        raise exception.InstanceNotFound(instance_id=uuid)
+
+    return result[0] or result[1]
+
+
 @require_context
 def _instance_get_by_uuid(context, uuid, session=None):
     result = _build_instance_get(context, session=session).\
@@ -1815,6 +1928,61 @@ def instance_update_and_get_original(context, instance_uuid, values):
                             copy_old_instance=True)
 
 
+# Values that _instance_update() has to check or write to other tables,
+# anything else is a plain column of the instances table.
+_INSTANCE_UPDATE_SPECIAL_KEYS = set(['expected_task_state', 'hostname',
+                                     'metadata', 'system_metadata',
+                                     'instance_type_id'])
+
+
+@require_context
+def instance_update_many(context, updates):
+    if not updates:
+        return []
+    session = get_session()
+    results = []
+    with session.begin():
+        # Read all the instances and their instance types at once and
+        # write the plain column updates in one flush.  Only updates with
+        # values that need more work go through _instance_update().
+        uuids = [instance_uuid for instance_uuid, values in updates]
+        instance_refs = _build_instance_get(context, session=session).\
+                filter(models.Instance.uuid.in_(uuids)).\
+                all()
+        instances = dict((instance_ref['uuid'], instance_ref)
+                         for instance_ref in instance_refs)
+        type_ids = set(instance_ref['instance_type_id']
+                       for instance_ref in instances.itervalues())
+        extra_specs = {}
+        if type_ids:
+            inst_type_refs = _instance_type_get_query(context,
+                                                      session=session).\
+                    filter(models.InstanceTypes.id.in_(type_ids)).\
+                    all()
+            for inst_type_ref in inst_type_refs:
+                extra_specs[inst_type_ref['id']] = _dict_with_extra_specs(
+                        inst_type_ref).get('extra_specs', {})
+        for instance_uuid, values in updates:
+            instance_ref = instances.get(instance_uuid)
+            if instance_ref is None:
+                LOG.debug(_("Instance %s went away before it could be "
+                            "updated"), instance_uuid)
+                continue
+            if _INSTANCE_UPDATE_SPECIAL_KEYS.intersection(values):
+                results.append(_instance_update(context, instance_uuid,
+                                                values,
+                                                copy_old_instance=True,
+                                                session=session))
+                continue
+            instance_ref['extra_specs'] = extra_specs.get(
+                    instance_ref['instance_type_id'], {})
+            old_instance_ref = copy.copy(instance_ref)
+            instance_ref.update(values)
+            results.append((old_instance_ref, instance_ref))
+        session.flush()
+    return results
+
+
 # NOTE(danms): This updates the instance's metadata list in-place and in
 # the database to avoid stale data and refresh issues. It assumes the
 # delete=True behavior of instance_metadata_update(...)
@@ -1839,13 +2007,15 @@ def _instance_metadata_update_in_place(context, instance, metadata_type, model,
         instance[metadata_type].append(newitem)
 
 
-def _instance_update(context, instance_uuid, values, copy_old_instance=False):
-    session = get_session()
+def _instance_update(context, instance_uuid, values, copy_old_instance=False,
+                     session=None):
+    if not session:
+        session = get_session()
 
     if not uuidutils.is_uuid_like(instance_uuid):
         raise exception.InvalidUUID(instance_uuid)
 
-    with session.begin():
+    with session.begin(subtransactions=True):
         instance_ref = _instance_get_by_uuid(context, instance_uuid,
                                              session=session)
         # TODO(deva): remove extra_specs from here after it is included
@@ -2204,7 +2374,8 @@ def network_get_all_by_uuids(context, network_uuids,
 
 
 @require_admin_context
-def network_get_associated_fixed_ips(context, network_id, host=None):
+def network_get_associated_fixed_ips(context, network_id, host=None,
+                                     address=None):
     # FIXME(sirp): since this returns fixed_ips, this would be better named
     # fixed_ip_get_all_by_network.
     # NOTE(vish): The ugly joins here are to solve a performance issue and
@@ -2235,6 +2406,8 @@ def network_get_associated_fixed_ips(context, network_id, host=None):
                           filter(models.FixedIp.virtual_interface_id != None)
     if host:
         query = query.filter(models.Instance.host == host)
+    if address:
+        query = query.filter(models.FixedIp.address == address)
     result = query.all()
     data = []
     for datum in result:
@@ -3004,6 +3177,16 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instances(context, instance_uuids):
+    if not instance_uuids:
+        return []
+    return _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                        instance_uuids)).\
+                 all()
+
+
 @require_context
 def block_device_mapping_destroy(context, bdm_id):
     session = get_session()
@@ -4035,6 +4218,72 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
         bwusage.save(session=session)
 
 
+def _bulk_update(session, table, key_column, rows):
+    """Update many records of a table with one executemany() statement.
+
+    All rows are dicts of the same columns, including key_column that
+    selects the record each of them updates.
+    """
+    # NOTE: bind parameters can't be named like the columns they set.
+    columns = [column for column in rows[0] if column != key_column]
+    statement = table.update().\
+            where(table.c[key_column] == bindparam('b_' + key_column)).\
+            values(**dict((column, bindparam('b_' + column))
+                          for column in columns))
+    session.execute(statement, [dict(('b_' + column, value)
+                                     for column, value in row.iteritems())
+                                for row in rows])
+
+
+@require_context
+def bw_usage_update_many(context, usages, last_refreshed=None, session=None):
+    if not usages:
+        return
+    if not session:
+        session = get_session()
+
+    if last_refreshed is None:
+        last_refreshed = timeutils.utcnow()
+
+    # NOTE: rather than an update (and maybe an insert) per usage, look up
+    # the existing records at once and update or create them with one
+    # executemany() statement each.
+    table = models.BandwidthUsage.__table__
+    with session.begin():
+        uuids = set(usage['uuid'] for usage in usages)
+        periods = set(usage['start_period'] for usage in usages)
+        rows = model_query(context, models.BandwidthUsage,
+                           session=session, read_deleted="yes").\
+                       filter(models.BandwidthUsage.uuid.in_(uuids)).\
+                       filter(models.BandwidthUsage.start_period.in_(
+                           periods)).\
+                       all()
+        existing = dict(((row['uuid'], row['mac'], row['start_period']),
+                         row['id']) for row in rows)
+
+        updates = []
+        inserts = []
+        for usage in usages:
+            values = {'last_refreshed': last_refreshed,
+                      'last_ctr_in': usage['last_ctr_in'],
+                      'last_ctr_out': usage['last_ctr_out'],
+                      'bw_in': usage['bw_in'],
+                      'bw_out': usage['bw_out']}
+            key = (usage['uuid'], usage['mac'], usage['start_period'])
+            if key in existing:
+                values['id'] = existing[key]
+                updates.append(values)
+            else:
+                values.update(uuid=usage['uuid'], mac=usage['mac'],
+                              start_period=usage['start_period'])
+                inserts.append(values)
+
+        if updates:
+            _bulk_update(session, table, 'id', updates)
+        if inserts:
+            session.execute(table.insert(), inserts)
+
+
 ####################
 
 
@@ -4208,6 +4457,51 @@ def vol_usage_update(context, id, rd_req, rd_bytes, wr_req, wr_bytes,
     return
 
 
+@require_context
+def vol_usage_update_many(context, usages, last_refreshed=None,
+                          session=None):
+    if not usages:
+        return
+    if not session:
+        session = get_session()
+
+    if last_refreshed is None:
+        last_refreshed = timeutils.utcnow()
+
+    # NOTE: like bw_usage_update_many(), one executemany() statement for
+    # the existing records and one for the new ones.
+    table = models.VolumeUsage.__table__
+    with session.begin():
+        volume_ids = set(str(usage['id']) for usage in usages)
+        rows = model_query(context, models.VolumeUsage.volume_id,
+                           base_model=models.VolumeUsage,
+                           session=session, read_deleted="yes").\
+                       filter(models.VolumeUsage.volume_id.in_(volume_ids)).\
+                       all()
+        existing = set(row[0] for row in rows)
+
+        updates = []
+        inserts = []
+        for usage in usages:
+            values = {'curr_last_refreshed': last_refreshed,
+                      'curr_reads': usage['rd_req'],
+                      'curr_read_bytes': usage['rd_bytes'],
+                      'curr_writes': usage['wr_req'],
+                      'curr_write_bytes': usage['wr_bytes'],
+                      'instance_id': usage['instance_id']}
+            values['volume_id'] = str(usage['id'])
+            if values['volume_id'] in existing:
+                updates.append(values)
+            else:
+                values['tot_last_refreshed'] = last_refreshed
+                inserts.append(values)
+
+        if updates:
+            _bulk_update(session, table, 'volume_id', updates)
+        if inserts:
+            session.execute(table.insert(), inserts)
+
+
 ####################
 
 
@@ -4235,6 +4529,15 @@ def s3_image_get_by_uuid(context, image_uuid):
     return result
 
 
+def s3_image_get_by_uuids(context, image_uuids):
+    """Find the local s3 images represented by the provided uuids."""
+    if not image_uuids:
+        return []
+    return model_query(context, models.S3Image, read_deleted="yes").\
+                 filter(models.S3Image.uuid.in_(image_uuids)).\
+                 all()
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid."""
     try:
@@ -4718,6 +5021,17 @@ def get_ec2_instance_id_by_uuid(context, instance_id, session=None):
     return result['id']
 
 
+@require_context
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return {}
+    result = _ec2_instance_get_query(context).\
+                    filter(models.InstanceIdMapping.uuid.in_(
+                           instance_uuids)).\
+                    all()
+    return dict((row['uuid'], row['id']) for row in result)
+
+
 @require_context
 def get_instance_uuid_by_ec2_id(context, ec2_id, session=None):
     result = _ec2_instance_get_query(context,
@@ -0,0 +1,151 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-memory allocation of fixed ips.
+
+Rather than asking the database for the first free row of a network on
+every allocation, the network manager keeps a map of the free addresses
+of each network it allocates from.  Candidates are picked from a random
+starting point, so that concurrent allocations (in this process or in
+other network hosts) rarely want the same address, and each pick is
+confirmed with a single conditional update of its row.
+
+The map is only a hint: addresses taken by other network hosts are found
+out when the conditional update fails, and addresses freed by other hosts
+are picked up when the map of a network is reloaded after running dry.
+"""
+
+import random
+
+import netaddr
+
+from nova import exception
+from nova.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+FREE = '\x01'
+USED = '\x00'
+
+
+class FixedIpPool(object):
+    """Map of the free fixed ips of one network.
+
+    Each address of the network's cidr is one byte in a bytearray, so
+    finding the next free address is a single bytearray.find().
+
+    """
+
+    def __init__(self, cidr):
+        self.cidr = netaddr.IPNetwork(cidr)
+        self.first = self.cidr.first
+        self.free = bytearray(USED * self.cidr.size)
+        self.free_count = 0
+
+    def _index(self, address):
+        index = int(netaddr.IPAddress(address)) - self.first
+        if index < 0 or index >= len(self.free):
+            return None
+        return index
+
+    def __contains__(self, address):
+        return self._index(address) is not None
+
+    def mark_free(self, address):
+        index = self._index(address)
+        if index is not None and self.free[index] != ord(FREE):
+            self.free[index] = FREE
+            self.free_count += 1
+
+    def take(self):
+        """Take a free address out of the pool, or return None.
+
+        The search starts at a random offset and wraps around, so that
+        callers spread over the whole free range.
+
+        """
+        if not self.free_count:
+            return None
+        start = random.randint(0, len(self.free) - 1)
+        index = self.free.find(FREE, start)
+        if index == -1:
+            index = self.free.find(FREE, 0, start)
+        if index == -1:
+            return None
+        self.free[index] = USED
+        self.free_count -= 1
+        return str(netaddr.IPAddress(self.first + index))
+
+
+class FixedIpAllocator(object):
+    """Allocates fixed ips from the in-memory pools of the networks."""
+
+    def __init__(self, db):
+        self.db = db
+        self.pools = {}
+
+    def add_network(self, network, addresses):
+        """Set up the pool of a network from its free addresses."""
+        pool = FixedIpPool(network['cidr'])
+        for address in addresses:
+            pool.mark_free(address)
+        self.pools[network['id']] = pool
+        return pool
+
+    def _load_network(self, context, network):
+        addresses = self.db.fixed_ip_get_free_addresses(context,
+                                                        network['id'])
+        return self.add_network(network, addresses)
+
+    def allocate(self, context, network, instance_uuid=None, host=None):
+        """Associate a free fixed ip of network to an instance or host.
+
+        Raises NoMoreFixedIps if the network has no free address left.
+
+        """
+        pool = self.pools.get(network['id'])
+        if pool is None:
+            pool = self._load_network(context, network)
+
+        for attempt in (0, 1):
+            if attempt:
+                # Other network hosts may have freed addresses since we
+                # last looked, so have another look before giving up.
+                pool = self._load_network(context, network)
+            address = pool.take()
+            while address:
+                if self.db.fixed_ip_associate_if_free(context, address,
+                                                      network['id'],
+                                                      instance_uuid, host):
+                    return address
+                LOG.debug(_('Fixed ip %s was already taken, trying another'),
+                          address)
+                address = pool.take()
+
+        raise exception.NoMoreFixedIps()
+
+    def release(self, address):
+        """Return a disassociated address to the pool it belongs to."""
+        for pool in self.pools.values():
+            if address in pool:
+                pool.mark_free(address)
+                return
+
+    def invalidate(self):
+        """Forget all pools, they are reloaded when next needed."""
+        self.pools = {}
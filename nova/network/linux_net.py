@@ -23,6 +23,10 @@ import calendar
 import inspect
 import netaddr
 import os
+import time
+
+from eventlet import event
+from eventlet import greenthread
 
 from nova import db
 from nova import exception
@@ -97,6 +101,23 @@ linux_net_opts = [
     cfg.IntOpt('metadata_port',
                default=8775,
                help='the port for the metadata api port'),
+    cfg.BoolOpt('iptables_incremental_apply',
+                default=False,
+                help='Only reprogram the wrapped iptables chains that '
+                     'changed since the last apply, using iptables-restore '
+                     '--noflush, instead of saving and restoring the whole '
+                     'ruleset every time'),
+    cfg.FloatOpt('iptables_apply_coalesce_interval',
+                 default=0.0,
+                 help='Seconds to wait before applying iptables changes so '
+                      'that applies requested within this window are '
+                      'performed once. 0 disables coalescing'),
+    cfg.FloatOpt('dhcp_update_delay',
+                 default=0.0,
+                 help='Seconds to wait before writing out a changed dnsmasq '
+                      'hosts file and reloading dnsmasq, so that changes '
+                      'made within this window cause a single reload. 0 '
+                      'writes and reloads on every change'),
     ]
 
 CONF = cfg.CONF
@@ -300,6 +321,17 @@ class IptablesManager(object):
 
         self.iptables_apply_deferred = False
 
+        # The state of our tables as of the last successful apply, keyed
+        # by command ('iptables' or 'ip6tables') and then table name.  It
+        # is used by the incremental applier to work out which wrapped
+        # chains need to be reprogrammed.
+        self._applied_state = {}
+        self._pending_apply = None
+        self.apply_stats = {'full': 0,
+                            'incremental': 0,
+                            'last_duration': 0.0,
+                            'total_duration': 0.0}
+
         # Add a nova-filter-top chain. It's intended to be shared
         # among the various nova components. It sits at the very top
         # of FORWARD and OUTPUT.
@@ -361,7 +393,34 @@ class IptablesManager(object):
         if self.iptables_apply_deferred:
             return
 
-        self._apply()
+        if CONF.iptables_apply_coalesce_interval > 0:
+            self._coalesced_apply()
+        else:
+            self._apply()
+
+    def _coalesced_apply(self):
+        """Wait for an apply shared by all callers within the window.
+
+        The first caller schedules an apply to run once the coalescing
+        interval has passed, later callers simply wait for that one. Any
+        error raised by the apply is re-raised in every waiting caller.
+
+        """
+        if self._pending_apply is None:
+            self._pending_apply = event.Event()
+            greenthread.spawn_after(CONF.iptables_apply_coalesce_interval,
+                                    self._run_pending_apply)
+        self._pending_apply.wait()
+
+    def _run_pending_apply(self):
+        done = self._pending_apply
+        self._pending_apply = None
+        try:
+            self._apply()
+        except Exception as exc:
+            done.send_exception(exc)
+        else:
+            done.send(None)
 
     @lockutils.synchronized('iptables', 'nova-', external=True)
     def _apply(self):
@@ -371,24 +430,132 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        If iptables_incremental_apply is set and only wrapped chains have
+        changed since the last apply, just those chains are reprogrammed.
+
         """
+        start_time = time.time()
+        modes = set()
+
         s = [('iptables', self.ipv4)]
         if CONF.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
-            all_tables, _err = self.execute('%s-save' % (cmd,), '-c',
-                                                run_as_root=True,
-                                                attempts=5)
-            all_lines = all_tables.split('\n')
-            for table in tables:
-                start, end = self._find_table(all_lines, table)
-                all_lines[start:end] = self._modify_rules(
-                        all_lines[start:end], tables[table], table_name=table)
-            self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
-                         process_input='\n'.join(all_lines),
-                         attempts=5)
-        LOG.debug(_("IPTablesManager.apply completed with success"))
+            if (CONF.iptables_incremental_apply and
+                    self._apply_incremental(cmd, tables)):
+                modes.add('incremental')
+                continue
+            self._apply_full(cmd, tables)
+            modes.add('full')
+
+        duration = time.time() - start_time
+        mode = 'full' if 'full' in modes else 'incremental'
+        self.apply_stats[mode] += 1
+        self.apply_stats['last_duration'] = duration
+        self.apply_stats['total_duration'] += duration
+        LOG.debug(_("IPTablesManager.apply completed with success "
+                    "(%(mode)s, %(duration).3f seconds)"),
+                  {'mode': mode, 'duration': duration})
+
+    def _apply_full(self, cmd, tables):
+        all_tables, _err = self.execute('%s-save' % (cmd,), '-c',
+                                        run_as_root=True,
+                                        attempts=5)
+        all_lines = all_tables.split('\n')
+        for table in tables:
+            start, end = self._find_table(all_lines, table)
+            all_lines[start:end] = self._modify_rules(
+                    all_lines[start:end], tables[table], table_name=table)
+        self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
+                     process_input='\n'.join(all_lines),
+                     attempts=5)
+        self._applied_state[cmd] = dict((name, self._table_state(table))
+                                        for name, table in tables.items())
+
+    def _apply_incremental(self, cmd, tables):
+        """Reprogram only the wrapped chains that changed since last apply.
+
+        Returns False if a full apply is needed instead; that is the case
+        before the first full apply, when unwrapped chains or rules have
+        changed, or when iptables-restore rejects the partial ruleset.
+
+        """
+        applied = self._applied_state.get(cmd)
+        if applied is None or set(applied) != set(tables):
+            return False
+
+        new_state = {}
+        lines = []
+        for name, table in tables.items():
+            if table.remove_chains or table.remove_rules:
+                return False
+            state = self._table_state(table)
+            old_chains, old_unwrapped = applied[name]
+            new_chains, new_unwrapped = state
+            if old_unwrapped != new_unwrapped:
+                return False
+            new_state[name] = state
+
+            changed = sorted(chain for chain in new_chains
+                             if new_chains[chain] != old_chains.get(chain))
+            removed = sorted(set(old_chains) - set(new_chains))
+            if not changed and not removed:
+                continue
+
+            lines.append('*%s' % name)
+            lines += [':%s-%s - [0:0]' % (binary_name, chain)
+                      for chain in changed]
+            for chain in changed:
+                lines += new_chains[chain]
+            for chain in removed:
+                lines.append('-F %s-%s' % (binary_name, chain))
+                lines.append('-X %s-%s' % (binary_name, chain))
+            lines.append('COMMIT')
+
+        if lines:
+            try:
+                self.execute('%s-restore' % (cmd,), '-c', '--noflush',
+                             run_as_root=True,
+                             process_input='\n'.join(lines + ['']),
+                             attempts=5)
+            except exception.ProcessExecutionError:
+                LOG.warn(_('Incremental %s apply failed, falling back to '
+                           'a full apply'), cmd)
+                return False
+        self._applied_state[cmd] = new_state
+        return True
+
+    def _table_state(self, table):
+        """Return a snapshot of the rules of an IptablesTable.
+
+        The snapshot is a tuple of a dict mapping each wrapped chain to its
+        rules, in the order _modify_rules would program them, and a tuple
+        describing everything that is not wrapped.
+
+        """
+        chains = dict((chain, []) for chain in table.chains)
+        for top in (True, False):
+            for rule in table.rules:
+                if rule.wrap and rule.top == top and rule.chain in chains:
+                    chains[rule.chain].append(str(rule))
+
+        # Duplicates are weeded out letting the *last* occurrence win,
+        # just like _modify_rules does.
+        for chain, rules in chains.items():
+            seen = set()
+            deduped = []
+            for rule in reversed(rules):
+                if rule not in seen:
+                    seen.add(rule)
+                    deduped.append(rule)
+            deduped.reverse()
+            chains[chain] = tuple(deduped)
+
+        unwrapped = (tuple(sorted(table.unwrapped_chains)),
+                     tuple((str(rule), rule.top) for rule in table.rules
+                           if not rule.wrap))
+        return chains, unwrapped
 
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
@@ -537,6 +704,56 @@ class IptablesManager(object):
         return new_filter
 
 
+class IpsetManager(object):
+    """Wrapper for kernel ipsets of IP addresses.
+
+    The members of each set we manage are tracked in memory, so updating
+    a set only sends the addresses that were added or removed to ipset.
+
+    """
+
+    def __init__(self, execute=None):
+        if not execute:
+            self.execute = _execute
+        else:
+            self.execute = execute
+
+        self.sets = {}
+
+    def set_members(self, name, ips, ip_version=4):
+        """Make the set called name contain exactly the given ips.
+
+        The set is created first if needed.  Returns True if the members
+        of the set changed.
+
+        """
+        if name not in self.sets:
+            family = 'inet6' if ip_version == 6 else 'inet'
+            self.execute('ipset', 'create', name, 'hash:ip',
+                         'family', family, '-exist', run_as_root=True)
+            self.execute('ipset', 'flush', name, run_as_root=True)
+            self.sets[name] = set()
+
+        members = self.sets[name]
+        ips = set(ips)
+        lines = ['add %s %s' % (name, ip) for ip in sorted(ips - members)]
+        lines += ['del %s %s' % (name, ip) for ip in sorted(members - ips)]
+        if not lines:
+            return False
+
+        self.execute('ipset', 'restore', '-exist', run_as_root=True,
+                     process_input='\n'.join(lines + ['']))
+        self.sets[name] = ips
+        return True
+
+    def destroy_set(self, name):
+        """Destroy a set; no rule may reference it any more."""
+        if self.sets.pop(name, None) is None:
+            return
+        self.execute('ipset', 'destroy', name, run_as_root=True,
+                     check_exit_code=[0, 1])
+
+
 # NOTE(jkoelker) This is just a nice little stub point since mocking
 #                builtins with mox is a nightmare
 def write_to_file(file, data, mode='w'):
@@ -782,6 +999,75 @@ def get_dhcp_hosts(context, network_ref):
     return '\n'.join(hosts)
 
 
+class DhcpHostManager(object):
+    """Keeps the dhcp-host table of each dnsmasq we run in memory.
+
+    The table of a device is read from the database once, after which
+    allocations and deallocations only look up the fixed ip that changed.
+    Writing out the hosts file and reloading dnsmasq can be delayed by
+    dhcp_update_delay, so that a burst of changes causes a single reload.
+
+    """
+
+    def __init__(self):
+        self.hosts = {}
+        self._pending = {}
+
+    def load(self, context, dev, network_ref):
+        """Read the complete dhcp-host table of a device from the db."""
+        host = None
+        if network_ref['multi_host']:
+            host = CONF.host
+        self.hosts[dev] = db.network_get_associated_fixed_ips(
+                context, network_ref['id'], host=host)
+
+    def update_host(self, context, dev, network_ref, address):
+        """Refresh the entry of a single fixed ip in a device's table.
+
+        The entry is dropped if the fixed ip is no longer associated.
+        """
+        host = None
+        if network_ref['multi_host']:
+            host = CONF.host
+        data = db.network_get_associated_fixed_ips(
+                context, network_ref['id'], host=host, address=address)
+        hosts = [datum for datum in self.hosts[dev]
+                 if datum['address'] != address]
+        self.hosts[dev] = hosts + data
+
+    def forget(self, dev):
+        self.hosts.pop(dev, None)
+
+    def get_hosts_text(self, dev):
+        return '\n'.join(_host_dhcp(data) for data in self.hosts[dev])
+
+    def write(self, context, dev, network_ref):
+        """Write out a device's hosts file and reload its dnsmasq."""
+        if CONF.dhcp_update_delay <= 0:
+            self._write(context, dev, network_ref)
+            return
+
+        if dev not in self._pending:
+            greenthread.spawn_after(CONF.dhcp_update_delay,
+                                    self._write_pending, dev)
+        self._pending[dev] = (context, network_ref)
+
+    def _write_pending(self, dev):
+        context, network_ref = self._pending.pop(dev)
+        try:
+            self._write(context, dev, network_ref)
+        except Exception:
+            LOG.exception(_('Failed to update dhcp hosts of %s'), dev)
+
+    def _write(self, context, dev, network_ref):
+        if dev not in self.hosts:
+            # dnsmasq was killed while the write was pending
+            return
+        conffile = _dhcp_file(dev, 'conf')
+        write_to_file(conffile, self.get_hosts_text(dev))
+        restart_dhcp(context, dev, network_ref)
+
+
 def get_dns_hosts(context, network_ref):
     """Get network's DNS hosts in hosts format."""
     hosts = []
@@ -866,10 +1152,17 @@ def release_dhcp(dev, address, mac_address):
     utils.execute('dhcp_release', dev, address, mac_address, run_as_root=True)
 
 
-def update_dhcp(context, dev, network_ref):
-    conffile = _dhcp_file(dev, 'conf')
-    write_to_file(conffile, get_dhcp_hosts(context, network_ref))
-    restart_dhcp(context, dev, network_ref)
+def update_dhcp(context, dev, network_ref, address=None):
+    """Update the dnsmasq hosts file of a network and reload dnsmasq.
+
+    If address is given, only the entry of that fixed ip is refreshed
+    from the database.
+    """
+    if address and dev in dhcp_host_manager.hosts:
+        dhcp_host_manager.update_host(context, dev, network_ref, address)
+    else:
+        dhcp_host_manager.load(context, dev, network_ref)
+    dhcp_host_manager.write(context, dev, network_ref)
 
 
 def update_dns(context, dev, network_ref):
@@ -894,6 +1187,7 @@ def kill_dhcp(dev):
             _execute('kill', '-9', pid, run_as_root=True)
         else:
             LOG.debug(_('Pid %d is stale, skip killing dnsmasq'), pid)
+    dhcp_host_manager.forget(dev)
     _remove_dnsmasq_accept_rules(dev)
     _remove_dhcp_mangle_rule(dev)
 
@@ -901,7 +1195,6 @@ def kill_dhcp(dev):
 # NOTE(ja): Sending a HUP only reloads the hostfile, so any
 #           configuration options (like dchp-range, vlan, ...)
 #           aren't reloaded.
-@lockutils.synchronized('dnsmasq_start', 'nova-')
 def restart_dhcp(context, dev, network_ref):
     """(Re)starts a dnsmasq server for a given network.
 
@@ -909,6 +1202,13 @@ def restart_dhcp(context, dev, network_ref):
     signal causing it to reload, otherwise spawn a new instance.
 
     """
+    @lockutils.synchronized('dnsmasq-%s' % dev, 'nova-')
+    def do_restart_dhcp():
+        _restart_dhcp(context, dev, network_ref)
+    do_restart_dhcp()
+
+
+def _restart_dhcp(context, dev, network_ref):
     conffile = _dhcp_file(dev, 'conf')
 
     if CONF.use_single_default_gateway:
@@ -1648,3 +1948,4 @@ class QuantumLinuxBridgeInterfaceDriver(LinuxNetInterfaceDriver):
         return bridge
 
 iptables_manager = IptablesManager()
+dhcp_host_manager = DhcpHostManager()
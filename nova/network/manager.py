@@ -58,6 +58,7 @@ from nova import ipv6
 from nova import manager
 from nova.network import api as network_api
 from nova.network import driver
+from nova.network import fixed_ip_pool
 from nova.network import floating_ips
 from nova.network import model as network_model
 from nova.network import rpcapi as network_rpcapi
@@ -161,6 +162,11 @@ network_opts = [
     cfg.StrOpt('l3_lib',
                default='nova.network.l3.LinuxNetL3',
                help="Indicates underlying L3 management library"),
+    cfg.BoolOpt('use_fixed_ip_pool',
+                default=False,
+                help='Allocate fixed ips from an in-memory map of the free '
+                     'addresses of each network instead of locking the '
+                     'first free row of the fixed_ips table'),
     ]
 
 CONF = cfg.CONF
@@ -170,6 +176,37 @@ CONF.import_opt('my_ip', 'nova.netconf')
 CONF.import_opt('network_topic', 'nova.network.rpcapi')
 
 
+def _ip_filter_to_like(ip_filter):
+    """Turn the literal start of an ip regex into a LIKE pattern.
+
+    Every address matched by the regex is also matched by the returned
+    pattern, which is '%' if the regex can't be narrowed down.
+    """
+    if '|' in ip_filter:
+        return '%'
+
+    like = []
+    i = 1 if ip_filter.startswith('^') else 0
+    while i < len(ip_filter):
+        char = ip_filter[i]
+        if char == '\\' and ip_filter[i + 1:i + 2] in ('.', ':'):
+            like.append(ip_filter[i + 1])
+            i += 2
+        elif char == '.':
+            like.append('_')
+            i += 1
+        elif char.isalnum() or char == ':':
+            like.append(char)
+            i += 1
+        else:
+            break
+
+    # The last character is optional if a quantifier follows it.
+    if ip_filter[i:i + 1] in ('*', '?', '{'):
+        like = like[:-1]
+    return ''.join(like) + '%'
+
+
 class RPCAllocateFixedIP(object):
     """Mixin class originally for FlatDCHP and VLAN network managers.
 
@@ -299,6 +336,7 @@ class NetworkManager(manager.SchedulerDependentManager):
 
         super(NetworkManager, self).__init__(service_name='network',
                                                 *args, **kwargs)
+        self.fixed_ip_allocator = fixed_ip_pool.FixedIpAllocator(self.db)
 
     def _import_ipam_lib(self, ipam_lib):
         self.ipam = importutils.import_module(ipam_lib).get_ipam_lib(self)
@@ -320,6 +358,10 @@ class NetworkManager(manager.SchedulerDependentManager):
             return fip['address']
         except exception.FixedIpNotFoundForNetworkHost:
             elevated = context.elevated()
+            if CONF.use_fixed_ip_pool:
+                return self.fixed_ip_allocator.allocate(elevated,
+                                                        network_ref,
+                                                        host=host)
             return self.db.fixed_ip_associate_pool(elevated,
                                                    network_id,
                                                    host=host)
@@ -352,6 +394,7 @@ class NetworkManager(manager.SchedulerDependentManager):
                                                                time)
             if num:
                 LOG.debug(_('Disassociated %s stale fixed ip(s)'), num)
+                self.fixed_ip_allocator.invalidate()
 
     def set_network_host(self, context, network_ref):
         """Safely sets the host of the network."""
@@ -402,51 +445,68 @@ class NetworkManager(manager.SchedulerDependentManager):
         fixed_ip_filter = filters.get('fixed_ip')
         ip_filter = re.compile(str(filters.get('ip')))
         ipv6_filter = re.compile(str(filters.get('ip6')))
+        results = []
 
-        # NOTE(jkoelker) Should probably figure out a better way to do
-        #                this. But for now it "works", this could suck on
-        #                large installs.
+        if 'ip6' in filters:
+            results.extend(self._get_instance_uuids_by_ipv6_filter(
+                    context, ipv6_filter))
+
+        # NOTE: the database only narrows the candidates down using the
+        #       literal start of the regex, the regex itself is still
+        #       matched below.
+        if 'ip' in filters:
+            address_like = _ip_filter_to_like(str(filters['ip']))
+            if address_like == '%':
+                rows = self.db.fixed_ip_get_all_by_address_filter(context)
+            else:
+                rows = self.db.fixed_ip_get_all_by_address_filter(
+                        context, address_like, fixed_ip_filter)
+        elif fixed_ip_filter:
+            rows = self.db.fixed_ip_get_all_by_address_filter(
+                    context, address=fixed_ip_filter)
+        else:
+            rows = []
 
-        vifs = self.db.virtual_interface_get_all(context)
-        results = []
+        matched_fixed_ips = set()
+        for row in rows:
+            address = row['address']
+            if not address:
+                continue
+            if address == fixed_ip_filter or ip_filter.match(address):
+                # A fixed ip is listed once, whatever floating ips it has.
+                if address not in matched_fixed_ips:
+                    matched_fixed_ips.add(address)
+                    results.append({'instance_uuid': row['instance_uuid'],
+                                    'ip': address})
+                continue
+            floating_address = row['floating_address']
+            if floating_address and ip_filter.match(floating_address):
+                results.append({'instance_uuid': row['instance_uuid'],
+                                'ip': floating_address})
 
-        for vif in vifs:
+        return results
+
+    def _get_instance_uuids_by_ipv6_filter(self, context, ipv6_filter):
+        """Match the ipv6 addresses computed from the vifs' macs."""
+        results = []
+        cidrs_v6 = {}
+        for vif in self.db.virtual_interface_get_all(context):
             if vif['instance_uuid'] is None:
                 continue
 
-            network = self._get_network_by_id(context, vif['network_id'])
-            fixed_ipv6 = None
-            if network['cidr_v6'] is not None:
-                fixed_ipv6 = ipv6.to_global(network['cidr_v6'],
-                                            vif['address'],
-                                            context.project_id)
+            network_id = vif['network_id']
+            if network_id not in cidrs_v6:
+                network = self._get_network_by_id(context, network_id)
+                cidrs_v6[network_id] = network['cidr_v6']
+            if cidrs_v6[network_id] is None:
+                continue
 
+            fixed_ipv6 = ipv6.to_global(cidrs_v6[network_id],
+                                        vif['address'],
+                                        context.project_id)
             if fixed_ipv6 and ipv6_filter.match(fixed_ipv6):
                 results.append({'instance_uuid': vif['instance_uuid'],
                                 'ip': fixed_ipv6})
-
-            vif_id = vif['id']
-            fixed_ips = self.db.fixed_ips_by_virtual_interface(context,
-                                                               vif_id)
-            for fixed_ip in fixed_ips:
-                if not fixed_ip or not fixed_ip['address']:
-                    continue
-                if fixed_ip['address'] == fixed_ip_filter:
-                    results.append({'instance_uuid': vif['instance_uuid'],
-                                    'ip': fixed_ip['address']})
-                    continue
-                if ip_filter.match(fixed_ip['address']):
-                    results.append({'instance_uuid': vif['instance_uuid'],
-                                    'ip': fixed_ip['address']})
-                    continue
-                for floating_ip in fixed_ip.get('floating_ips', []):
-                    if not floating_ip or not floating_ip['address']:
-                        continue
-                    if ip_filter.match(floating_ip['address']):
-                        results.append({'instance_uuid': vif['instance_uuid'],
-                                        'ip': floating_ip['address']})
-                        continue
-
         return results
 
     def _get_networks_for_instance(self, context, instance_id, project_id,
@@ -807,6 +867,9 @@ class NetworkManager(manager.SchedulerDependentManager):
                                                      address,
                                                      instance_ref['uuid'],
                                                      network['id'])
+            elif CONF.use_fixed_ip_pool:
+                address = self.fixed_ip_allocator.allocate(
+                        context.elevated(), network, instance_ref['uuid'])
             else:
                 address = self.db.fixed_ip_associate_pool(context.elevated(),
                                                           network['id'],
@@ -831,7 +894,7 @@ class NetworkManager(manager.SchedulerDependentManager):
             self.instance_dns_manager.create_entry(uuid, address,
                                                    "A",
                                                    self.instance_dns_domain)
-        self._setup_network_on_host(context, network)
+        self._setup_network_on_host(context, network, address)
         return address
 
     def deallocate_fixed_ip(self, context, address, host=None, teardown=True):
@@ -882,7 +945,7 @@ class NetworkManager(manager.SchedulerDependentManager):
                 #             callback will get called by nova-dhcpbridge.
                 self.driver.release_dhcp(dev, address, vif['address'])
 
-            self._teardown_network_on_host(context, network)
+            self._teardown_network_on_host(context, network, address)
 
     def lease_fixed_ip(self, context, address):
         """Called by dhcp-bridge when ip is leased."""
@@ -917,6 +980,7 @@ class NetworkManager(manager.SchedulerDependentManager):
                                 {'leased': False})
         if not fixed_ip['allocated']:
             self.db.fixed_ip_disassociate(context, address)
+            self.fixed_ip_allocator.release(address)
 
     @staticmethod
     def _convert_int_args(kwargs):
@@ -1180,6 +1244,9 @@ class NetworkManager(manager.SchedulerDependentManager):
                         'address': address,
                         'reserved': reserved})
         self.db.fixed_ip_bulk_create(context, ips)
+        if CONF.use_fixed_ip_pool:
+            self.fixed_ip_allocator.add_network(network,
+                    [ip['address'] for ip in ips if not ip['reserved']])
 
     def _allocate_fixed_ips(self, context, instance_id, host, networks,
                             **kwargs):
@@ -1229,12 +1296,20 @@ class NetworkManager(manager.SchedulerDependentManager):
         network = self.db.network_get(context, network_id)
         call_func(context, network)
 
-    def _setup_network_on_host(self, context, network):
-        """Sets up network on this host."""
+    def _setup_network_on_host(self, context, network, address=None):
+        """Sets up network on this host.
+
+        If address is given, it is the fixed ip that was just allocated
+        and the only one whose configuration needs updating.
+        """
         raise NotImplementedError()
 
-    def _teardown_network_on_host(self, context, network):
-        """Sets up network on this host."""
+    def _teardown_network_on_host(self, context, network, address=None):
+        """Sets up network on this host.
+
+        If address is given, it is the fixed ip that was just deallocated
+        and the only one whose configuration needs updating.
+        """
         raise NotImplementedError()
 
     def validate_networks(self, context, networks):
@@ -1411,8 +1486,9 @@ class FlatManager(NetworkManager):
         super(FlatManager, self).deallocate_fixed_ip(context, address, host,
                                                      teardown)
         self.db.fixed_ip_disassociate(context, address)
+        self.fixed_ip_allocator.release(address)
 
-    def _setup_network_on_host(self, context, network):
+    def _setup_network_on_host(self, context, network, address=None):
         """Setup Network on this host."""
         # NOTE(tr3buchet): this does not need to happen on every ip
         # allocation, this functionality makes more sense in create_network
@@ -1421,7 +1497,7 @@ class FlatManager(NetworkManager):
         net['injected'] = CONF.flat_injected
         self.db.network_update(context, network['id'], net)
 
-    def _teardown_network_on_host(self, context, network):
+    def _teardown_network_on_host(self, context, network, address=None):
         """Tear down network on this host."""
         pass
 
@@ -1504,7 +1580,7 @@ class FlatDHCPManager(RPCAllocateFixedIP, floating_ips.FloatingIP,
         super(FlatDHCPManager, self).init_host()
         self.init_host_floating_ips()
 
-    def _setup_network_on_host(self, context, network):
+    def _setup_network_on_host(self, context, network, address=None):
         """Sets up network on this host."""
         network['dhcp_server'] = self._get_dhcp_ip(context, network)
 
@@ -1514,20 +1590,20 @@ class FlatDHCPManager(RPCAllocateFixedIP, floating_ips.FloatingIP,
             dev = self.driver.get_dev(network)
             # NOTE(dprince): dhcp DB queries require elevated context
             elevated = context.elevated()
-            self.driver.update_dhcp(elevated, dev, network)
+            self.driver.update_dhcp(elevated, dev, network, address)
             if(CONF.use_ipv6):
                 self.driver.update_ra(context, dev, network)
                 gateway = utils.get_my_linklocal(dev)
                 self.db.network_update(context, network['id'],
                                        {'gateway_v6': gateway})
 
-    def _teardown_network_on_host(self, context, network):
+    def _teardown_network_on_host(self, context, network, address=None):
         if not CONF.fake_network:
             network['dhcp_server'] = self._get_dhcp_ip(context, network)
             dev = self.driver.get_dev(network)
             # NOTE(dprince): dhcp DB queries require elevated context
             elevated = context.elevated()
-            self.driver.update_dhcp(elevated, dev, network)
+            self.driver.update_dhcp(elevated, dev, network, address)
 
     def _get_network_dict(self, network):
         """Returns the dict representing necessary and meta network fields."""
@@ -1592,6 +1668,9 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
                 address = self.db.fixed_ip_associate(context, address,
                                                      instance['uuid'],
                                                      network['id'])
+            elif CONF.use_fixed_ip_pool:
+                address = self.fixed_ip_allocator.allocate(
+                        context, network, instance['uuid'])
             else:
                 address = self.db.fixed_ip_associate_pool(context,
                                                           network['id'],
@@ -1615,7 +1694,7 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
                                                    "A",
                                                    self.instance_dns_domain)
 
-        self._setup_network_on_host(context, network)
+        self._setup_network_on_host(context, network, address)
         return address
 
     def add_network_to_project(self, context, project_id, network_uuid=None):
@@ -1700,7 +1779,7 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
             self, context, vpn=True, **kwargs)
 
     @lockutils.synchronized('setup_network', 'nova-', external=True)
-    def _setup_network_on_host(self, context, network):
+    def _setup_network_on_host(self, context, network, address=None):
         """Sets up network on this host."""
         if not network['vpn_public_address']:
             net = {}
@@ -1724,7 +1803,7 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
             dev = self.driver.get_dev(network)
             # NOTE(dprince): dhcp DB queries require elevated context
             elevated = context.elevated()
-            self.driver.update_dhcp(elevated, dev, network)
+            self.driver.update_dhcp(elevated, dev, network, address)
             if(CONF.use_ipv6):
                 self.driver.update_ra(context, dev, network)
                 gateway = utils.get_my_linklocal(dev)
@@ -1732,13 +1811,13 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
                                        {'gateway_v6': gateway})
 
     @lockutils.synchronized('setup_network', 'nova-', external=True)
-    def _teardown_network_on_host(self, context, network):
+    def _teardown_network_on_host(self, context, network, address=None):
         if not CONF.fake_network:
             network['dhcp_server'] = self._get_dhcp_ip(context, network)
             dev = self.driver.get_dev(network)
             # NOTE(dprince): dhcp DB queries require elevated context
             elevated = context.elevated()
-            self.driver.update_dhcp(elevated, dev, network)
+            self.driver.update_dhcp(elevated, dev, network, address)
 
             # NOTE(ethuleau): For multi hosted networks, if the network is no
             # more used on this host and if VPN forwarding rule aren't handed
@@ -1757,7 +1836,7 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
                     self.db.fixed_ip_update(context, network['dhcp_server'],
                                             values)
             else:
-                self.driver.update_dhcp(context, dev, network)
+                self.driver.update_dhcp(context, dev, network, address)
 
     def _get_network_dict(self, network):
         """Returns the dict representing necessary and meta network fields."""
@@ -15,9 +15,22 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-"""Policy Engine For Nova."""
+"""Policy Engine For Nova.
+
+Rules are parsed into Check trees by the common policy engine.  Those
+trees are compiled here into plain closures the first time a rule is
+enforced after the rules were (re)loaded, the common engine's interpreter
+is only used for checks that can't be compiled, like http checks.
+
+The result of a compiled rule only depends on the credentials and target
+keys the rule mentions, so it is remembered on the context for the rest
+of the request: listing many instances of one project enforces each rule
+once rather than once per instance.
+"""
 
 import os.path
+import re
+import time
 
 from nova import exception
 from nova.openstack.common import cfg
@@ -32,6 +45,10 @@ policy_opts = [
     cfg.StrOpt('policy_default_rule',
                default='default',
                help=_('Rule checked when requested rule is not found')),
+    cfg.IntOpt('policy_recheck_interval',
+               default=5,
+               help=_('Seconds between checks of policy_file for '
+                      'modifications')),
     ]
 
 CONF = cfg.CONF
@@ -40,12 +57,26 @@ CONF.register_opts(policy_opts)
 _POLICY_PATH = None
 _POLICY_CACHE = {}
 
+# Compiled rules by action name, for the rules in _COMPILED_FROM.
+_COMPILED = {}
+_COMPILED_FROM = None
+_GENERATION = 0
+
+# Keeps results memoized on a context from growing without bounds when
+# the context is a long lived one, like those of periodic tasks.
+_MAX_RESULTS = 1000
+
+_MISSING = object()
+_TARGET_KEY_RE = re.compile(r'%\(([^)]*)\)')
+
 
 def reset():
     global _POLICY_PATH
     global _POLICY_CACHE
+    global _COMPILED_FROM
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _COMPILED_FROM = None
     policy.reset()
 
 
@@ -58,8 +89,16 @@ def init():
             _POLICY_PATH = CONF.find_file(_POLICY_PATH)
         if not _POLICY_PATH:
             raise exception.ConfigNotFound(path=CONF.policy_file)
+    # NOTE: the check time lives in _POLICY_CACHE so that clearing the
+    # cache forces a check of the file.
+    now = time.time()
+    checked_at = _POLICY_CACHE.get('checked_at')
+    if (checked_at is not None and
+        0 <= now - checked_at < CONF.policy_recheck_interval):
+        return
     utils.read_cached_file(_POLICY_PATH, _POLICY_CACHE,
                            reload_func=_set_rules)
+    _POLICY_CACHE['checked_at'] = now
 
 
 def _set_rules(data):
@@ -67,6 +106,139 @@ def _set_rules(data):
     policy.set_rules(policy.Rules.load_json(data, default_rule))
 
 
+def _compile_check(check, rules, compiling=()):
+    """Compile a Check tree into a function of (target, creds).
+
+    Returns the function and the set of ('target', key) and ('creds', key)
+    pairs its result depends on, or None instead of the set if the result
+    depends on anything else.
+    """
+    check_type = type(check)
+    if check_type is policy.TrueCheck:
+        return lambda target, creds: True, set()
+    if check_type is policy.FalseCheck:
+        return lambda target, creds: False, set()
+
+    if check_type is policy.NotCheck:
+        func, deps = _compile_check(check.rule, rules, compiling)
+        return lambda target, creds: not func(target, creds), deps
+
+    if check_type in (policy.AndCheck, policy.OrCheck):
+        funcs = []
+        deps = set()
+        for rule in check.rules:
+            func, rule_deps = _compile_check(rule, rules, compiling)
+            funcs.append(func)
+            if deps is not None and rule_deps is not None:
+                deps |= rule_deps
+            else:
+                deps = None
+
+        if check_type is policy.AndCheck:
+            def and_check(target, creds):
+                for func in funcs:
+                    if not func(target, creds):
+                        return False
+                return True
+            return and_check, deps
+
+        def or_check(target, creds):
+            for func in funcs:
+                if func(target, creds):
+                    return True
+            return False
+        return or_check, deps
+
+    if check_type is policy.RuleCheck and check.match not in compiling:
+        try:
+            rule = rules[check.match]
+        except KeyError:
+            # We don't have any matching rule; fail closed
+            return lambda target, creds: False, set()
+        return _compile_check(rule, rules,
+                              tuple(compiling) + (check.match,))
+
+    if check_type is policy.RoleCheck:
+        role = check.match.lower()
+
+        def role_check(target, creds):
+            return role in [x.lower() for x in creds['roles']]
+        return role_check, set([('creds', 'roles')])
+
+    if check_type is IsAdminCheck:
+        expected = check.expected
+        return (lambda target, creds: creds['is_admin'] == expected,
+                set([('creds', 'is_admin')]))
+
+    if check_type is policy.GenericCheck:
+        kind = check.kind
+        match = check.match
+        deps = set([('creds', kind)])
+        deps.update(('target', key) for key in _TARGET_KEY_RE.findall(match))
+
+        def generic_check(target, creds):
+            if kind in creds:
+                return match % target == unicode(creds[kind])
+            return False
+        return generic_check, deps
+
+    # Leave anything else to the common policy engine.
+    return check, None
+
+
+def _compiled_rule(action):
+    """Returns the compiled rule for action and its dependencies."""
+    global _COMPILED_FROM
+    global _COMPILED
+    global _GENERATION
+
+    rules = policy._rules
+    if rules is not _COMPILED_FROM:
+        _COMPILED = {}
+        _COMPILED_FROM = rules
+        _GENERATION += 1
+
+    compiled = _COMPILED.get(action)
+    if compiled is None:
+        try:
+            rule = rules[action]
+        except (KeyError, TypeError):
+            # No rules or no such rule; fail closed
+            rule = policy.FalseCheck()
+        compiled = _compile_check(rule, rules or {})
+        _COMPILED[action] = compiled
+    return compiled
+
+
+def _results_key(action, context, target, deps):
+    """Key of the result of action on target in context, or None."""
+    values = []
+    for source, key in sorted(deps):
+        if source == 'target':
+            value = target.get(key, _MISSING)
+        else:
+            value = getattr(context, key, _MISSING)
+        if isinstance(value, list):
+            value = tuple(value)
+        values.append(value)
+    key = (action, tuple(values))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _context_results(context):
+    """Results memoized on context for the current rules."""
+    results = getattr(context, '_policy_results', None)
+    if (results is None or results[0] != _GENERATION or
+        len(results[1]) >= _MAX_RESULTS):
+        results = (_GENERATION, {})
+        context._policy_results = results
+    return results[1]
+
+
 def enforce(context, action, target, do_raise=True):
     """Verifies that the action is valid on the target in this context.
 
@@ -91,14 +263,22 @@ def enforce(context, action, target, do_raise=True):
     """
     init()
 
-    credentials = context.to_dict()
+    func, deps = _compiled_rule(action)
+    key = None
+    if deps is not None:
+        key = _results_key(action, context, target, deps)
 
-    # Add the exception arguments if asked to do a raise
-    extra = {}
-    if do_raise:
-        extra.update(exc=exception.PolicyNotAuthorized, action=action)
+    results = _context_results(context)
+    if key is not None and key in results:
+        result = results[key]
+    else:
+        result = func(target, context.to_dict())
+        if key is not None:
+            results[key] = result
 
-    return policy.check(action, target, credentials, **extra)
+    if do_raise and result is False:
+        raise exception.PolicyNotAuthorized(action=action)
+    return result
 
 
 def check_is_admin(roles):
@@ -110,7 +290,8 @@ def check_is_admin(roles):
     target = {}
     credentials = {'roles': roles}
 
-    return policy.check('context_is_admin', target, credentials)
+    func, _deps = _compiled_rule('context_is_admin')
+    return func(target, credentials)
 
 
 @policy.register('is_admin')
@@ -0,0 +1,183 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Long-lived root wrapper serving commands over a UNIX socket.
+
+nova-rootwrap-daemon is started once per service with sudo and keeps the
+filters loaded, instead of starting nova-rootwrap (and a new Python
+interpreter re-reading every filter file) for each command.  It only runs
+commands allowed by the same filters as nova-rootwrap.
+
+The socket lives in a private directory owned by the user that started
+the daemon, its path is the first line the daemon writes to stdout.  The
+daemon exits when its stdin is closed, i.e. when the service that
+started it goes away.
+
+Each connection carries one command: the client sends a JSON object with
+'cmd' (argument list) and 'stdin' (string or None) and shuts down its
+side of the socket, the daemon answers with a JSON object holding
+'returncode', 'stdout' and 'stderr' and closes the connection.  Strings
+are latin-1 decoded so that any byte makes it through JSON untouched.
+
+This module must not import anything that isn't needed to run as root.
+"""
+
+import json
+import logging
+import os
+import pwd
+import shutil
+import signal
+import SocketServer
+import subprocess
+import sys
+import tempfile
+import threading
+
+from nova.openstack.common.rootwrap import wrapper
+
+
+RC_UNAUTHORIZED = 99
+RC_NOEXECFOUND = 96
+
+
+def _subprocess_setup():
+    # Python installs a SIGPIPE handler by default. This is usually not what
+    # non-Python subprocesses expect.
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+def encode(data):
+    """Serialize a request or reply, keeping its strings byte for byte."""
+    def _decode(value):
+        if isinstance(value, str):
+            return value.decode('latin-1')
+        if isinstance(value, (list, tuple)):
+            return [_decode(item) for item in value]
+        return value
+
+    return json.dumps(dict((key, _decode(value))
+                           for key, value in data.iteritems()))
+
+
+def decode(data):
+    """Deserialize a request or reply made by encode()."""
+    def _encode(value):
+        if isinstance(value, unicode):
+            return value.encode('latin-1')
+        if isinstance(value, list):
+            return [_encode(item) for item in value]
+        return value
+
+    return dict((str(key), _encode(value))
+                for key, value in json.loads(data).iteritems())
+
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        request = decode(self.rfile.read())
+        reply = self.server.daemon.run_command(request['cmd'],
+                                               request.get('stdin'))
+        self.wfile.write(encode(reply))
+
+
+class _Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class RootwrapDaemon(object):
+    """Runs the commands allowed by filters for the clients of a socket."""
+
+    def __init__(self, config, filters, execname='nova-rootwrap-daemon'):
+        self.config = config
+        self.filters = filters
+        self.execname = execname
+
+    def run_command(self, userargs, process_input=None):
+        """Run a command if it matches a filter, like nova-rootwrap does."""
+        try:
+            filtermatch = wrapper.match_filter(self.filters, userargs,
+                                               exec_dirs=self.config.exec_dirs)
+            command = filtermatch.get_command(userargs,
+                                              exec_dirs=self.config.exec_dirs)
+        except wrapper.FilterMatchNotExecutable as exc:
+            msg = ("Executable not found: %s (filter match = %s)"
+                   % (exc.match.exec_path, exc.match.name))
+            return self._error(msg, RC_NOEXECFOUND)
+        except wrapper.NoFilterMatched:
+            msg = ("Unauthorized command: %s (no filter matched)"
+                   % ' '.join(userargs))
+            return self._error(msg, RC_UNAUTHORIZED)
+
+        if self.config.use_syslog:
+            logging.info("(%s > %s) Executing %s (filter match = %s)" % (
+                 self.execname, pwd.getpwuid(os.getuid())[0],
+                 command, filtermatch.name))
+
+        obj = subprocess.Popen(command,
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               close_fds=True,
+                               preexec_fn=_subprocess_setup,
+                               env=filtermatch.get_environment(userargs))
+        stdout, stderr = obj.communicate(process_input)
+        return {'returncode': obj.returncode,
+                'stdout': stdout,
+                'stderr': stderr}
+
+    def _error(self, msg, returncode):
+        if self.config.use_syslog:
+            logging.error(msg)
+        return {'returncode': returncode,
+                'stdout': "%s: %s\n" % (self.execname, msg),
+                'stderr': ''}
+
+    def _make_socket_dir(self):
+        socket_dir = tempfile.mkdtemp(prefix='nova-rootwrap-')
+        # NOTE: only the user that started us through sudo may connect.
+        uid = int(os.environ.get('SUDO_UID', os.getuid()))
+        gid = int(os.environ.get('SUDO_GID', os.getgid()))
+        os.chown(socket_dir, uid, gid)
+        os.chmod(socket_dir, 0700)
+        return socket_dir
+
+    def serve(self, stdin=None, stdout=None):
+        """Serve until stdin is closed."""
+        stdin = stdin or sys.stdin
+        stdout = stdout or sys.stdout
+
+        socket_dir = self._make_socket_dir()
+        try:
+            socket_path = os.path.join(socket_dir, 'rootwrap.sock')
+            server = _Server(socket_path, _RequestHandler)
+            server.daemon = self
+            os.chown(socket_path, *os.stat(socket_dir)[4:6])
+
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+
+            stdout.write(socket_path + '\n')
+            stdout.flush()
+            while stdin.read(4096):
+                pass
+
+            server.shutdown()
+            server.server_close()
+        finally:
+            shutil.rmtree(socket_dir, ignore_errors=True)
@@ -19,6 +19,7 @@ Manage hosts in the current zone.
 
 import UserDict
 
+from nova.compute import image_digest
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import db
@@ -122,6 +123,8 @@ class HostState(object):
         self.num_instances_by_project = {}
         self.num_instances_by_os_type = {}
         self.num_io_ops = 0
+        # Digest of the images cached on the host
+        self.image_cache_digest = None
 
         # Resource oversubscription values for the compute host:
         self.limits = {}
@@ -195,6 +198,8 @@ class HostState(object):
 
         self.num_io_ops = int(statmap.get('io_workload', 0))
 
+        self.image_cache_digest = statmap.get(image_digest.STAT_KEY)
+
     def consume_from_instance(self, instance):
         """Incrementally update host state from an instance."""
         disk_mb = (instance['root_gb'] + instance['ephemeral_gb']) * 1024
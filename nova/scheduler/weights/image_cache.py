@@ -0,0 +1,66 @@
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Image Cache Weigher.  Weigh hosts by whether they have the image of the
+instance cached.
+
+Compute hosts report a digest of the images they have cached, see
+nova.compute.image_digest.  Hosts that have the image get the
+'image_cache_weight_multiplier' option as their weight, which is added to
+the free RAM in MB the RAM weigher gives them by default, so that they win
+over hosts with up to that much more free RAM.  Setting it to 0 disables
+this weigher.
+"""
+
+from nova.compute import image_digest
+from nova.openstack.common import cfg
+from nova.scheduler import weights
+
+
+image_cache_weight_opts = [
+        cfg.FloatOpt('image_cache_weight_multiplier',
+                     default=1024.0,
+                     help='Weight of hosts that have the image of the '
+                          'instance cached.  With the RAM weigher at its '
+                          'default, these hosts win over hosts with up to '
+                          'that many more MB of free RAM.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(image_cache_weight_opts)
+
+
+def _image_id(weight_properties):
+    request_spec = weight_properties.get('request_spec') or {}
+    image = request_spec.get('image') or {}
+    instance_properties = request_spec.get('instance_properties') or {}
+    return image.get('id') or instance_properties.get('image_ref')
+
+
+class ImageCacheWeigher(weights.BaseHostWeigher):
+    def _weight_multiplier(self):
+        """Override the weight multiplier."""
+        return CONF.image_cache_weight_multiplier
+
+    def _weigh_object(self, host_state, weight_properties):
+        """1 if the host is likely to have the image cached, else 0."""
+        image_id = _image_id(weight_properties)
+        if not image_id or not host_state.image_cache_digest:
+            return 0
+        fingerprint = image_digest.image_fingerprint(image_id)
+        if image_digest.digest_contains(host_state.image_cache_digest,
+                                        fingerprint):
+            return 1
+        return 0
@@ -32,6 +32,7 @@ import greenlet
 
 from nova import conductor
 from nova import context
+from nova import db
 from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common import eventlet_backdoor
@@ -297,6 +298,10 @@ class ProcessLauncher(object):
 
         wrap.forktimes.append(time.time())
 
+        # NOTE: a database connection must not be shared between processes,
+        # close ours so that the child opens its own.
+        db.dispose_engine()
+
         pid = os.fork()
         if pid == 0:
             # NOTE(johannes): All exceptions are caught to ensure this
@@ -428,13 +433,7 @@ class Service(object):
         self.basic_config_check()
         self.manager.init_host()
         self.model_disconnected = False
-        ctxt = context.get_admin_context()
-        try:
-            self.service_ref = self.conductor_api.service_get_by_args(ctxt,
-                    self.host, self.binary)
-            self.service_id = self.service_ref['id']
-        except exception.NotFound:
-            self.service_ref = self._create_service_ref(ctxt)
+        self.ensure_service_ref()
 
         if self.backdoor_port is not None:
             self.manager.backdoor_port = self.backdoor_port
@@ -478,6 +477,20 @@ class Service(object):
                            periodic_interval_max=self.periodic_interval_max)
             self.timers.append(periodic)
 
+    def ensure_service_ref(self):
+        """Look the service record up, creating it if there is none.
+
+        Also called before forking workers, so that they don't all create
+        a record for the service the first time it is started on a host.
+        """
+        ctxt = context.get_admin_context()
+        try:
+            self.service_ref = self.conductor_api.service_get_by_args(ctxt,
+                    self.host, self.binary)
+            self.service_id = self.service_ref['id']
+        except exception.NotFound:
+            self.service_ref = self._create_service_ref(ctxt)
+
     def _create_service_ref(self, context):
         svc_values = {
             'host': self.host,
@@ -678,6 +691,8 @@ def serve(server, workers=None):
         raise RuntimeError(_('serve() can only be called once'))
 
     if workers:
+        if isinstance(server, Service):
+            server.ensure_service_ref()
         _launcher = ProcessLauncher()
         _launcher.launch_server(server, workers=workers)
     else:
@@ -34,6 +34,8 @@ import mox
 import stubout
 import testtools
 
+from nova.api.ec2 import ec2utils
+from nova import availability_zones
 from nova import context
 from nova import db
 from nova.db import migration
@@ -220,6 +222,8 @@ class TestCase(testtools.TestCase):
                                     sqlite_db=CONF.sqlite_db,
                                     sqlite_clean_db=CONF.sqlite_clean_db)
         self.useFixture(_DB_CACHE)
+        availability_zones.reset_cache()
+        ec2utils.reset_cache()
 
         mox_fixture = self.useFixture(MoxStubout())
         self.mox = mox_fixture.mox
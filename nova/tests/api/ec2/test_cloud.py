@@ -53,6 +53,7 @@ from nova import volume
 
 CONF = cfg.CONF
 CONF.import_opt('compute_driver', 'nova.virt.driver')
+CONF.import_opt('default_availability_zone', 'nova.availability_zones')
 CONF.import_opt('default_instance_type', 'nova.compute.instance_types')
 CONF.import_opt('use_ipv6', 'nova.netconf')
 LOG = logging.getLogger(__name__)
@@ -825,6 +826,55 @@ class CloudTestCase(test.TestCase):
                           self.cloud.describe_instances, self.context,
                           instance_id=[instance_id])
 
+    def test_describe_instances_batches_lookups(self):
+        # Makes sure describe_instances doesn't query per instance.
+        self._stub_instance_get_with_fixed_ips('get_all')
+
+        image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
+        image_id = ec2utils.glance_id_to_ec2_id(self.context, image_uuid)
+        inst1 = db.instance_create(self.context, {'reservation_id': 'a',
+                                                  'image_ref': image_uuid,
+                                                  'instance_type_id': 1,
+                                                  'host': 'host1',
+                                                  'vm_state': 'active'})
+        inst2 = db.instance_create(self.context, {'reservation_id': 'a',
+                                                  'image_ref': image_uuid,
+                                                  'instance_type_id': 1,
+                                                  'host': 'host2',
+                                                  'vm_state': 'active'})
+        db.service_create(self.context, {'host': 'host1',
+                                         'topic': "compute"})
+        ec2utils.reset_cache()
+
+        def fail(*args, **kwargs):
+            self.fail('lookup should have been batched')
+
+        for name in ('get_ec2_instance_id_by_uuid', 's3_image_get_by_uuid',
+                     'block_device_mapping_get_all_by_instance',
+                     'service_get_all_by_host'):
+            self.stubs.Set(db, name, fail)
+
+        result = self.cloud.describe_instances(self.context)
+        instances = result['reservationSet'][0]['instancesSet']
+        self.assertEqual(
+            sorted((i['instanceId'], i['imageId'],
+                    i['placement']['availabilityZone']) for i in instances),
+            sorted([(ec2utils.id_to_ec2_inst_id(inst1['uuid']),
+                     image_id, CONF.default_availability_zone),
+                    (ec2utils.id_to_ec2_inst_id(inst2['uuid']),
+                     image_id, 'unknown zone')]))
+
+    def test_ec2_id_cache_keeps_recently_used(self):
+        self.flags(ec2_id_cache_size=2)
+        cache = ec2utils._LRUCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
     def test_describe_instances_with_filters(self):
         # Makes sure describe_instances works and filters results.
         filters = {'filter': [{'name': 'test',
@@ -25,6 +25,7 @@ from nova.api import ec2
 from nova import context
 from nova import exception
 from nova.openstack.common import cfg
+from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
 from nova import test
 
@@ -87,6 +88,124 @@ class LockoutTestCase(test.TestCase):
         self.assertFalse(self._is_locked_out('test'))
 
 
+class FakeKeystoneConnection(object):
+    """Answers like keystone's ec2tokens, records what was asked."""
+    created = []
+
+    def __init__(self, netloc):
+        self.requests = []
+        self.closed = False
+        self.created.append(self)
+
+    def request(self, method, path, body=None, headers=None):
+        self.requests.append(jsonutils.loads(body))
+
+    def getresponse(self):
+        creds = self.requests[-1]['ec2Credentials']
+        response = FakeKeystoneResponse()
+        if creds['access'] == 'bad':
+            response.status = 401
+            response.reason = 'Invalid credentials'
+            response.body = ''
+        else:
+            response.body = jsonutils.dumps({'access': {
+                'token': {'id': 'token', 'tenant': {'id': 'project'}},
+                'user': {'id': creds['access'], 'roles': []},
+                'serviceCatalog': []}})
+        return response
+
+    def close(self):
+        self.closed = True
+
+
+class FakeKeystoneResponse(object):
+    status = 200
+    reason = 'OK'
+    will_close = False
+
+    def read(self):
+        return self.body
+
+
+@webob.dec.wsgify
+def context_user(req):
+    return req.environ['nova.context'].user_id
+
+
+class EC2KeystoneAuthTestCase(test.TestCase):
+    def setUp(self):
+        super(EC2KeystoneAuthTestCase, self).setUp()
+        timeutils.set_time_override()
+        FakeKeystoneConnection.created = []
+        self.stubs.Set(ec2.httplib, 'HTTPConnection', FakeKeystoneConnection)
+        self.auth = ec2.EC2KeystoneAuth(context_user)
+
+    def tearDown(self):
+        timeutils.clear_time_override()
+        super(EC2KeystoneAuthTestCase, self).tearDown()
+
+    def _request(self, access, signature='sig', **params):
+        params.update({'AWSAccessKeyId': access, 'Signature': signature})
+        req = webob.Request.blank('/', POST=params)
+        return req.get_response(self.auth)
+
+    def _keystone_requests(self):
+        return sum([len(conn.requests)
+                    for conn in FakeKeystoneConnection.created])
+
+    def test_accepted_credentials_are_cached(self):
+        self.assertEqual(self._request('user').body, 'user')
+        self.assertEqual(self._request('user').body, 'user')
+        self.assertEqual(self._keystone_requests(), 1)
+        self.assertEqual(self.auth.stats['hits'], 1)
+        self.assertEqual(self.auth.stats['misses'], 1)
+
+        timeutils.advance_time_seconds(CONF.keystone_ec2_cache_ttl)
+        self.assertEqual(self._request('user').body, 'user')
+        self.assertEqual(self._keystone_requests(), 2)
+
+    def test_cache_key_covers_signed_request(self):
+        self._request('user')
+        self._request('user', signature='other')
+        self._request('user', Action='DescribeInstances')
+        self.assertEqual(self._keystone_requests(), 3)
+
+    def test_rejected_credentials_are_cached(self):
+        self.assertEqual(self._request('bad').status_int, 400)
+        self.assertEqual(self._request('bad').status_int, 400)
+        self.assertEqual(self._keystone_requests(), 1)
+
+        timeutils.advance_time_seconds(CONF.keystone_ec2_negative_cache_ttl)
+        self.assertEqual(self._request('bad').status_int, 400)
+        self.assertEqual(self._keystone_requests(), 2)
+
+    def test_caching_disabled(self):
+        self.flags(keystone_ec2_cache_ttl=0)
+        self._request('user')
+        self._request('user')
+        self.assertEqual(self._keystone_requests(), 2)
+
+    def test_connection_is_reused(self):
+        self.flags(keystone_ec2_cache_ttl=0)
+        self._request('user1')
+        self._request('user2')
+        self.assertEqual(len(FakeKeystoneConnection.created), 1)
+        self.assertFalse(FakeKeystoneConnection.created[0].closed)
+
+    def test_stale_connection_is_replaced(self):
+        self.flags(keystone_ec2_cache_ttl=0)
+        self._request('user1')
+
+        def broken_request(*args, **kwargs):
+            raise ec2.httplib.BadStatusLine('')
+        stale = FakeKeystoneConnection.created[0]
+        stale.request = broken_request
+
+        self.assertEqual(self._request('user2').body, 'user2')
+        self.assertTrue(stale.closed)
+        self.assertEqual(len(FakeKeystoneConnection.created), 2)
+
+
 class ExecutorTestCase(test.TestCase):
     def setUp(self):
         super(ExecutorTestCase, self).setUp()
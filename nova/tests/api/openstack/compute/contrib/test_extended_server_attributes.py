@@ -44,6 +44,11 @@ def fake_cn_get(context, host):
     return {"hypervisor_hostname": host}
 
 
+def fake_cn_get_by_hosts(context, hosts):
+    return [{"hypervisor_hostname": host, "service": {"host": host}}
+            for host in hosts]
+
+
 class ExtendedServerAttributesTest(test.TestCase):
     content_type = 'application/json'
     prefix = 'OS-EXT-SRV-ATTR:'
@@ -54,6 +59,7 @@ class ExtendedServerAttributesTest(test.TestCase):
         self.stubs.Set(compute.api.API, 'get', fake_compute_get)
         self.stubs.Set(compute.api.API, 'get_all', fake_compute_get_all)
         self.stubs.Set(db, 'compute_node_get_by_host', fake_cn_get)
+        self.stubs.Set(db, 'compute_node_get_by_hosts', fake_cn_get_by_hosts)
         self.flags(
             osapi_compute_extension=[
                 'nova.api.openstack.compute.contrib.select_extensions'],
@@ -97,6 +103,25 @@ class ExtendedServerAttributesTest(test.TestCase):
                                     host='host-%s' % (i + 1),
                                     instance_name='instance-%s' % (i + 1))
 
+    def test_detail_fetches_compute_nodes_at_once(self):
+        calls = []
+
+        def fake_cn_get_by_hosts_counted(context, hosts):
+            calls.append(sorted(hosts))
+            return fake_cn_get_by_hosts(context, hosts)
+
+        def fake_cn_get_fail(context, host):
+            self.fail('compute nodes should have been prefetched')
+
+        self.stubs.Set(db, 'compute_node_get_by_hosts',
+                       fake_cn_get_by_hosts_counted)
+        self.stubs.Set(db, 'compute_node_get_by_host', fake_cn_get_fail)
+        url = '/v2/fake/servers/detail'
+        res = self._make_request(url)
+
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(calls, [['host-1', 'host-2']])
+
     def test_no_instance_passthrough_404(self):
 
         def fake_compute_get(*args, **kwargs):
@@ -752,6 +752,37 @@ class ResourceTest(test.TestCase):
         self.assertEqual(called, [2])
         self.assertEqual(response, 'foo')
 
+    def test_prefetch_extension_data(self):
+        class Controller(object):
+            def index(self, req, pants=None):
+                return pants
+
+        controller = Controller()
+        resource = wsgi.Resource(controller)
+
+        called = []
+
+        def prefetch1(req):
+            called.append((1, req))
+
+        def prefetch2(req):
+            called.append((2, req))
+
+        @wsgi.prefetch(prefetch1)
+        def extension1(req, resp_obj):
+            return None
+
+        @wsgi.prefetch(prefetch1, prefetch2)
+        def extension2(req, resp_obj):
+            return None
+
+        def extension3(req, resp_obj):
+            return None
+
+        resource.prefetch_extension_data([extension1, extension2,
+                                          extension3], 'req')
+        self.assertEqual(called, [(1, 'req'), (2, 'req')])
+
     def test_resource_exception_handler_type_error(self):
         # A TypeError should be translated to a Fault/HTTP 400.
         def foo(a,):
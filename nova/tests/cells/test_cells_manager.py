@@ -21,6 +21,7 @@ import datetime
 from nova.cells import messaging
 from nova.cells import utils as cells_utils
 from nova import context
+from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common import rpc
 from nova.openstack.common import timeutils
@@ -69,6 +70,13 @@ class CellsManagerClassTestCase(test.TestCase):
         self.mox.ReplayAll()
         self.cells_manager.get_cell_info_for_neighbors(self.ctxt)
 
+    def test_get_instance_update_lags(self):
+        self.mox.StubOutWithMock(self.msg_runner, 'get_instance_update_lags')
+        self.msg_runner.get_instance_update_lags().AndReturn('fake-lags')
+        self.mox.ReplayAll()
+        self.assertEqual('fake-lags',
+                self.cells_manager.get_instance_update_lags(self.ctxt))
+
     def test_post_start_hook_child_cell(self):
         self.mox.StubOutWithMock(self.driver, 'start_consumers')
         self.mox.StubOutWithMock(context, 'get_admin_context')
@@ -275,6 +283,39 @@ class CellsManagerClassTestCase(test.TestCase):
                                                       filters='fake-filters')
         self.assertEqual(expected_response, response)
 
+    def _stub_service_get_all_with_timed_out_cell(self):
+        services = [copy.deepcopy(service) for service in FAKE_SERVICES]
+        timeout = exception.CellTimeout()
+        response = messaging.Response('path!to!cell0',
+                                      (type(timeout), timeout, None), True)
+        # As the response of a cell that did not respond in time arrives
+        responses = [messaging.Response.from_json(response.to_json()),
+                     messaging.Response('path!to!cell1', services, False)]
+
+        self.mox.StubOutWithMock(self.msg_runner,
+                                 'service_get_all')
+        self.msg_runner.service_get_all(self.ctxt,
+                                        'fake-filters').AndReturn(responses)
+        self.mox.ReplayAll()
+        return services
+
+    def test_service_get_all_partial(self):
+        services = self._stub_service_get_all_with_timed_out_cell()
+        expected_services = copy.deepcopy(services)
+        for service in expected_services:
+            cells_utils.add_cell_to_service(service, 'path!to!cell1')
+        response = self.cells_manager.service_get_all(self.ctxt,
+                                                      filters='fake-filters',
+                                                      partial=True)
+        self.assertEqual({'result': expected_services,
+                          'missing_cells': ['path!to!cell0']}, response)
+
+    def test_service_get_all_with_timed_out_cells(self):
+        self._stub_service_get_all_with_timed_out_cell()
+        self.assertRaises(exception.CellTimeout,
+                          self.cells_manager.service_get_all, self.ctxt,
+                          filters='fake-filters')
+
     def test_service_get_by_compute_host(self):
         self.mox.StubOutWithMock(self.msg_runner,
                                  'service_get_by_compute_host')
@@ -412,6 +453,22 @@ class CellsManagerClassTestCase(test.TestCase):
         response = self.cells_manager.compute_node_stats(self.ctxt)
         self.assertEqual(expected_resp, response)
 
+    def test_compute_node_stats_partial(self):
+        timeout = exception.CellTimeout()
+        response = messaging.Response('cell2',
+                                      (type(timeout), timeout, None), True)
+        responses = [messaging.Response('cell1', {'key1': 1}, False),
+                     messaging.Response.from_json(response.to_json())]
+
+        self.mox.StubOutWithMock(self.msg_runner,
+                                 'compute_node_stats')
+        self.msg_runner.compute_node_stats(self.ctxt).AndReturn(responses)
+        self.mox.ReplayAll()
+        response = self.cells_manager.compute_node_stats(self.ctxt,
+                                                         partial=True)
+        self.assertEqual({'result': {'key1': 1},
+                          'missing_cells': ['cell2']}, response)
+
     def test_compute_node_get(self):
         fake_cell = 'fake-cell'
         fake_response = messaging.Response(fake_cell,
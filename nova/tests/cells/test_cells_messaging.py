@@ -14,6 +14,8 @@
 """
 Tests For Cells Messaging module
 """
+import mox
+
 from nova.cells import messaging
 from nova.cells import utils as cells_utils
 from nova import context
@@ -155,6 +157,23 @@ class CellsMessageClassesTestCase(test.TestCase):
         next_hop = tgt_message._get_next_hop()
         self.assertEqual(target_cell, next_hop)
 
+    def test_targeted_message_route_is_looked_up(self):
+        target_cell = 'api-cell!child-cell2!grandchild-cell1'
+        tgt_message = messaging._TargetedMessage(self.msg_runner,
+                                                  self.ctxt, 'fake_method',
+                                                  {}, 'down', target_cell)
+        next_hop = tgt_message._get_next_hop()
+        self.assertEqual(self.state_manager.get_child_cell('child-cell2'),
+                         next_hop)
+
+        # The route is in the routing table now
+        self.mox.StubOutWithMock(self.state_manager, 'get_child_cell')
+        self.mox.ReplayAll()
+        tgt_message = messaging._TargetedMessage(self.msg_runner,
+                                                  self.ctxt, 'fake_method',
+                                                  {}, 'down', target_cell)
+        self.assertEqual(next_hop, tgt_message._get_next_hop())
+
     def test_create_broadcast_message(self):
         self.flags(max_hop_count=99, group='cells')
         self.flags(name='api-cell', max_hop_count=99, group='cells')
@@ -690,13 +709,36 @@ class CellsTargetedMethodsTestCase(test.TestCase):
                                  'tell_parents_our_capacities')
         self.src_state_manager.get_our_capacities().AndReturn(capacs)
         self.tgt_state_manager.update_cell_capacities('child-cell2',
-                                                      capacs)
+                                                      capacs, partial=False)
         self.tgt_msg_runner.tell_parents_our_capacities(self.ctxt)
 
         self.mox.ReplayAll()
 
         self.src_msg_runner.tell_parents_our_capacities(self.ctxt)
 
+    def test_update_capacities_partial(self):
+        self._setup_attrs('child-cell2', 'child-cell2!api-cell')
+        changes = {'ram_free': {'total_mb': 1024}}
+        self.mox.StubOutWithMock(self.src_state_manager,
+                                 'get_our_capacity_changes')
+        self.mox.StubOutWithMock(self.tgt_state_manager,
+                                 'update_cell_capacities')
+        self.mox.StubOutWithMock(self.tgt_msg_runner,
+                                 'tell_parents_our_capacities')
+        self.src_state_manager.get_our_capacity_changes(
+                full=False).AndReturn((changes, True))
+        self.tgt_state_manager.update_cell_capacities('child-cell2',
+                                                      changes, partial=True)
+        self.tgt_msg_runner.tell_parents_our_capacities(self.ctxt)
+        # Nothing is sent when nothing changed
+        self.src_state_manager.get_our_capacity_changes(
+                full=False).AndReturn(({}, True))
+
+        self.mox.ReplayAll()
+
+        self.src_msg_runner.tell_parents_our_capacities(self.ctxt)
+        self.src_msg_runner.tell_parents_our_capacities(self.ctxt)
+
     def test_announce_capabilities(self):
         self._setup_attrs('api-cell', 'api-cell!child-cell1')
         # To make this easier to test, make us only have 1 child cell.
@@ -719,7 +761,7 @@ class CellsTargetedMethodsTestCase(test.TestCase):
 
         self.mox.StubOutWithMock(self.tgt_msg_runner,
                                  'tell_parents_our_capacities')
-        self.tgt_msg_runner.tell_parents_our_capacities(self.ctxt)
+        self.tgt_msg_runner.tell_parents_our_capacities(self.ctxt, full=True)
 
         self.mox.ReplayAll()
 
@@ -835,6 +877,7 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
     def setUp(self):
         super(CellsBroadcastMethodsTestCase, self).setUp()
         fakes.init(self)
+        self.flags(instance_update_batch_window=0, group='cells')
         self.ctxt = context.RequestContext('fake', 'fake')
         self._setup_attrs()
 
@@ -1020,6 +1063,99 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         self.src_msg_runner.bw_usage_update_at_top(self.ctxt,
                                                    fake_bw_update_info)
 
+    def test_instance_updates_batched_to_top(self):
+        self.flags(instance_update_batch_window=60, group='cells')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        expected_cell_name = 'api-cell!child-cell2!grandchild-cell1'
+
+        self.mox.StubOutWithMock(self.mid_db_inst, 'instance_update_many')
+        self.mox.StubOutWithMock(self.tgt_db_inst, 'instance_update_many')
+        self.mox.StubOutWithMock(self.tgt_db_inst, 'instance_destroy')
+        self.mox.StubOutWithMock(self.tgt_db_inst, 'instance_fault_create')
+        self.tgt_db_inst.instance_update_many(mox.IgnoreArg(),
+                [('fake_uuid1', {'uuid': 'fake_uuid1',
+                                 'vm_state': 'active',
+                                 'task_state': None,
+                                 'cell_name': expected_cell_name})],
+                update_cells=False).AndReturn(
+                        [({'uuid': 'fake_uuid1'}, {'uuid': 'fake_uuid1'})])
+        self.tgt_db_inst.instance_destroy(mox.IgnoreArg(), 'fake_uuid2',
+                                          update_cells=False)
+        self.tgt_db_inst.instance_fault_create(mox.IgnoreArg(),
+                                               {'code': 500})
+        self.mox.ReplayAll()
+
+        self.src_msg_runner.instance_update_at_top(self.ctxt,
+                {'uuid': 'fake_uuid1', 'vm_state': 'building',
+                 'task_state': 'spawning'})
+        self.src_msg_runner.instance_update_at_top(self.ctxt,
+                {'uuid': 'fake_uuid1', 'vm_state': 'active',
+                 'task_state': None})
+        self.src_msg_runner.instance_update_at_top(self.ctxt,
+                {'uuid': 'fake_uuid2', 'vm_state': 'active'})
+        self.src_msg_runner.instance_destroy_at_top(self.ctxt,
+                {'uuid': 'fake_uuid2'})
+        self.src_msg_runner.instance_fault_create_at_top(self.ctxt,
+                {'id': 1, 'code': 500})
+        self.assertEqual(['fake_uuid1', 'fake_uuid2'],
+                         self.src_msg_runner._instance_update_uuids)
+
+        timeutils.advance_time_seconds(5)
+        self.src_msg_runner.flush_instance_updates()
+        self.assertEqual({}, self.src_msg_runner._instance_updates)
+        self.assertEqual({expected_cell_name: {'batches': 1,
+                                               'updates': 3,
+                                               'last_lag': 5,
+                                               'max_lag': 5}},
+                         self.tgt_msg_runner.get_instance_update_lags())
+        self.assertEqual({}, self.mid_msg_runner.get_instance_update_lags())
+
+    def test_instance_updates_sent_when_batch_is_full(self):
+        self.flags(instance_update_batch_window=60,
+                   instance_update_batch_size=2, group='cells')
+        self.mox.StubOutWithMock(self.tgt_db_inst, 'instance_update_many')
+        self.tgt_db_inst.instance_update_many(mox.IgnoreArg(),
+                mox.IgnoreArg(), update_cells=False).AndReturn(
+                        [({'uuid': 'fake_uuid1'}, {'uuid': 'fake_uuid1'}),
+                         ({'uuid': 'fake_uuid2'}, {'uuid': 'fake_uuid2'})])
+        self.mox.ReplayAll()
+
+        self.src_msg_runner.instance_update_at_top(self.ctxt,
+                {'uuid': 'fake_uuid1'})
+        self.assertNotEqual(None, self.src_msg_runner._instance_updates_flush)
+        self.src_msg_runner.instance_update_at_top(self.ctxt,
+                {'uuid': 'fake_uuid2'})
+        self.assertEqual({}, self.src_msg_runner._instance_updates)
+        self.assertEqual(None, self.src_msg_runner._instance_updates_flush)
+
+    def test_instance_update_batch_falls_back_to_single_updates(self):
+        self.flags(instance_update_batch_window=60, group='cells')
+        expected_cell_name = 'api-cell!child-cell2!grandchild-cell1'
+
+        self.mox.StubOutWithMock(self.tgt_db_inst, 'instance_update_many')
+        self.mox.StubOutWithMock(self.tgt_db_inst, 'instance_update')
+        self.mox.StubOutWithMock(self.tgt_db_inst, 'instance_create')
+        self.mox.StubOutWithMock(self.tgt_db_inst,
+                                 'instance_info_cache_update')
+        self.tgt_db_inst.instance_update_many(mox.IgnoreArg(),
+                mox.IgnoreArg(), update_cells=False).AndRaise(
+                        test.TestingException())
+        expected_instance = {'uuid': 'fake_uuid',
+                             'cell_name': expected_cell_name}
+        self.tgt_db_inst.instance_update(mox.IgnoreArg(), 'fake_uuid',
+                expected_instance, update_cells=False).AndRaise(
+                        exception.InstanceNotFound(instance_id='fake_uuid'))
+        self.tgt_db_inst.instance_create(mox.IgnoreArg(), expected_instance)
+        self.tgt_db_inst.instance_info_cache_update(mox.IgnoreArg(),
+                'fake_uuid', {'network_info': '[]'}, update_cells=False)
+        self.mox.ReplayAll()
+
+        self.src_msg_runner.instance_update_at_top(self.ctxt,
+                {'uuid': 'fake_uuid',
+                 'info_cache': {'id': 1, 'network_info': '[]'}})
+        self.src_msg_runner.flush_instance_updates()
+
     def test_sync_instances(self):
         # Reset this, as this is a broadcast down.
         self._setup_attrs(up=False)
@@ -1121,6 +1257,60 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
                     ('api-cell', [1, 2])]
         self.assertEqual(expected, response_values)
 
+    def test_broadcast_call_leaves_out_cells_timing_out(self):
+        # Reset this, as this is a broadcast down.
+        self._setup_attrs(up=False)
+        self.flags(call_timeout=1, group='cells')
+        ctxt = self.ctxt.elevated()
+
+        # The grandchild cell never gets the message
+        cell = fakes.get_cell_state('child-cell2', 'grandchild-cell1')
+        self.stubs.Set(cell, 'send_message', lambda message: None)
+
+        self.mox.StubOutWithMock(self.src_db_inst, 'service_get_all')
+        self.mox.StubOutWithMock(self.mid_db_inst, 'service_get_all')
+        self.src_db_inst.service_get_all(ctxt,
+                disabled=None).AndReturn([1, 2])
+        self.mid_db_inst.service_get_all(ctxt,
+                disabled=None).AndReturn([3])
+        self.mox.ReplayAll()
+
+        responses = self.src_msg_runner.service_get_all(ctxt,
+                                                        filters={})
+        # The child cell gave up on the grandchild cell before we gave up
+        # on the child cell.
+        self.assertEqual(['api-cell!child-cell2!grandchild-cell1',
+                          'api-cell!child-cell2', 'api-cell'],
+                         [resp.cell_name for resp in responses])
+        self.assertTrue(responses[0].failure)
+        self.assertTrue(isinstance(responses[0].value,
+                                   exception.CellTimeout))
+        self.assertEqual([3], responses[1].value_or_raise())
+        self.assertEqual([1, 2], responses[2].value_or_raise())
+
+    def test_broadcast_call_with_failure_to_send(self):
+        # Reset this, as this is a broadcast down.
+        self._setup_attrs(up=False)
+        ctxt = self.ctxt.elevated()
+
+        def fake_send_message(message):
+            raise test.TestingException()
+
+        cell = fakes.get_cell_state('api-cell', 'child-cell2')
+        self.stubs.Set(cell, 'send_message', fake_send_message)
+
+        self.mox.StubOutWithMock(self.src_db_inst, 'service_get_all')
+        self.src_db_inst.service_get_all(ctxt,
+                disabled=None).AndReturn([1, 2])
+        self.mox.ReplayAll()
+
+        responses = self.src_msg_runner.service_get_all(ctxt,
+                                                        filters={})
+        self.assertEqual(['api-cell!child-cell2', 'api-cell'],
+                         [resp.cell_name for resp in responses])
+        self.assertTrue(responses[0].failure)
+        self.assertEqual([1, 2], responses[1].value_or_raise())
+
     def test_task_log_get_all_broadcast(self):
         # Reset this, as this is a broadcast down.
         self._setup_attrs(up=False)
@@ -213,6 +213,14 @@ class CellsAPITestCase(test.TestCase):
                            version='1.1')
         self.assertEqual(result, 'fake_response')
 
+    def test_get_instance_update_lags(self):
+        call_info = self._stub_rpc_method('call', 'fake_response')
+        result = self.cells_rpcapi.get_instance_update_lags(
+                self.fake_context)
+        self._check_result(call_info, 'get_instance_update_lags', {},
+                           version='1.6')
+        self.assertEqual(result, 'fake_response')
+
     def test_sync_instances(self):
         call_info = self._stub_rpc_method('cast', None)
         self.cells_rpcapi.sync_instances(self.fake_context,
@@ -236,6 +244,17 @@ class CellsAPITestCase(test.TestCase):
                            version='1.2')
         self.assertEqual(result, 'fake_response')
 
+    def test_service_get_all_partial(self):
+        call_info = self._stub_rpc_method('call', 'fake_response')
+        fake_filters = {'key1': 'val1', 'key2': 'val2'}
+        result = self.cells_rpcapi.service_get_all(self.fake_context,
+                filters=fake_filters, partial=True)
+
+        expected_args = {'filters': fake_filters, 'partial': True}
+        self._check_result(call_info, 'service_get_all', expected_args,
+                           version='1.5')
+        self.assertEqual(result, 'fake_response')
+
     def test_service_get_by_compute_host(self):
         call_info = self._stub_rpc_method('call', 'fake_response')
         result = self.cells_rpcapi.service_get_by_compute_host(
@@ -278,6 +297,24 @@ class CellsAPITestCase(test.TestCase):
                            version='1.3')
         self.assertEqual(result, 'fake_response')
 
+    def test_task_log_get_all_partial(self):
+        call_info = self._stub_rpc_method('call', 'fake_response')
+        result = self.cells_rpcapi.task_log_get_all(self.fake_context,
+                task_name='fake_name',
+                period_beginning='fake_begin',
+                period_ending='fake_end',
+                partial=True)
+
+        expected_args = {'task_name': 'fake_name',
+                         'period_beginning': 'fake_begin',
+                         'period_ending': 'fake_end',
+                         'host': None,
+                         'state': None,
+                         'partial': True}
+        self._check_result(call_info, 'task_log_get_all', expected_args,
+                           version='1.5')
+        self.assertEqual(result, 'fake_response')
+
     def test_compute_node_get_all(self):
         call_info = self._stub_rpc_method('call', 'fake_response')
         result = self.cells_rpcapi.compute_node_get_all(self.fake_context,
@@ -296,6 +333,25 @@ class CellsAPITestCase(test.TestCase):
                            expected_args, version='1.4')
         self.assertEqual(result, 'fake_response')
 
+    def test_compute_node_get_all_partial(self):
+        call_info = self._stub_rpc_method('call', 'fake_response')
+        result = self.cells_rpcapi.compute_node_get_all(self.fake_context,
+                hypervisor_match='fake-match', partial=True)
+
+        expected_args = {'hypervisor_match': 'fake-match', 'partial': True}
+        self._check_result(call_info, 'compute_node_get_all', expected_args,
+                           version='1.5')
+        self.assertEqual(result, 'fake_response')
+
+    def test_compute_node_stats_partial(self):
+        call_info = self._stub_rpc_method('call', 'fake_response')
+        result = self.cells_rpcapi.compute_node_stats(self.fake_context,
+                                                      partial=True)
+        expected_args = {'partial': True}
+        self._check_result(call_info, 'compute_node_stats',
+                           expected_args, version='1.5')
+        self.assertEqual(result, 'fake_response')
+
     def test_compute_node_get(self):
         call_info = self._stub_rpc_method('call', 'fake_response')
         result = self.cells_rpcapi.compute_node_get(self.fake_context,
@@ -0,0 +1,203 @@
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For CellStateManager
+"""
+from nova.cells import state
+from nova import context
+from nova import db
+from nova.openstack.common import cfg
+from nova.openstack.common import timeutils
+from nova import test
+
+CONF = cfg.CONF
+
+
+def _compute_node(host, free_ram_mb, free_disk_gb, disabled=False):
+    return {'service': {'host': host, 'disabled': disabled},
+            'free_ram_mb': free_ram_mb,
+            'free_disk_gb': free_disk_gb}
+
+
+class CellStateManagerCapacityTestCase(test.TestCase):
+    """Test case for the capacity accounting of CellStateManager."""
+
+    def setUp(self):
+        super(CellStateManagerCapacityTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.compute_nodes = [_compute_node('host1', 4096, 100),
+                              _compute_node('host2', 2048, 50)]
+        self.instance_types = [
+                {'memory_mb': 1024, 'root_gb': 10, 'ephemeral_gb': 0},
+                {'memory_mb': 2048, 'root_gb': 20, 'ephemeral_gb': 10}]
+        self.instance_type_get_all_calls = 0
+
+        def fake_instance_type_get_all(ctxt):
+            self.instance_type_get_all_calls += 1
+            return self.instance_types
+
+        self.stubs.Set(db, 'cell_get_all', lambda ctxt: [])
+        self.stubs.Set(db, 'compute_node_get_all',
+                       lambda ctxt: self.compute_nodes)
+        self.stubs.Set(db, 'instance_type_get_all',
+                       fake_instance_type_get_all)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.state_manager = state.CellStateManager()
+
+    def _capacities(self):
+        return self.state_manager.my_cell_state.capacities
+
+    def _full_capacities(self):
+        return state.CellStateManager().my_cell_state.capacities
+
+    def test_initial_capacities(self):
+        expected = {'ram_free': {'total_mb': 6144,
+                                 'units_by_mb': {'1024': 6, '2048': 3}},
+                    'disk_free': {'total_mb': 153600,
+                                  'units_by_mb': {'10240': 15,
+                                                  '30720': 4}}}
+        self.assertEqual(expected, self._capacities())
+
+    def test_changed_compute_nodes(self):
+        self.compute_nodes = [_compute_node('host1', 1024, 100),
+                              _compute_node('host2', 2048, 50, True),
+                              _compute_node('host3', 8192, 200)]
+        self.state_manager._update_our_capacity(self.ctxt)
+        self.assertEqual(1, self.instance_type_get_all_calls)
+        self.assertEqual(self._full_capacities(), self._capacities())
+        self.assertEqual(9216, self._capacities()['ram_free']['total_mb'])
+
+    def test_no_compute_nodes(self):
+        self.compute_nodes = []
+        self.state_manager._update_our_capacity(self.ctxt)
+        self.assertEqual({}, self._capacities())
+
+    def test_full_refresh(self):
+        self.flags(capacity_full_refresh_interval=60, group='cells')
+        self.instance_types = self.instance_types[:1]
+        self.state_manager._update_our_capacity(self.ctxt)
+        self.assertTrue('2048' in
+                        self._capacities()['ram_free']['units_by_mb'])
+
+        timeutils.advance_time_seconds(61)
+        self.state_manager._update_our_capacity(self.ctxt)
+        self.assertEqual(2, self.instance_type_get_all_calls)
+        self.assertEqual({'1024': 6},
+                         self._capacities()['ram_free']['units_by_mb'])
+
+    def test_capacity_changes(self):
+        self.flags(send_capacity_changes=True, group='cells')
+        capacities, partial = self.state_manager.get_our_capacity_changes()
+        self.assertFalse(partial)
+        self.assertEqual(self._capacities(), capacities)
+
+        self.compute_nodes = [_compute_node('host1', 3072, 100),
+                              _compute_node('host2', 2048, 50)]
+        self.state_manager._update_our_capacity(self.ctxt)
+        capacities, partial = self.state_manager.get_our_capacity_changes()
+        self.assertTrue(partial)
+        self.assertEqual({'ram_free': {'total_mb': 5120,
+                                       'units_by_mb': {'1024': 5,
+                                                       '2048': 2}}},
+                         capacities)
+
+        capacities, partial = self.state_manager.get_our_capacity_changes()
+        self.assertEqual(({}, True), (capacities, partial))
+
+        capacities, partial = self.state_manager.get_our_capacity_changes(
+                full=True)
+        self.assertFalse(partial)
+        self.assertEqual(self._capacities(), capacities)
+
+    def test_capacity_changes_disabled(self):
+        self.state_manager.get_our_capacity_changes()
+        self.compute_nodes = [_compute_node('host1', 3072, 100),
+                              _compute_node('host2', 2048, 50)]
+        self.state_manager._update_our_capacity(self.ctxt)
+        capacities, partial = self.state_manager.get_our_capacity_changes()
+        self.assertFalse(partial)
+        self.assertEqual(self._capacities(), capacities)
+
+    def test_partial_capacities_update(self):
+        cell = state.CellState('child')
+        cell.update_capacities({'ram_free': {'total_mb': 2048,
+                                             'units_by_mb': {'1024': 2}}})
+        cell.update_capacities({'ram_free': {'units_by_mb': {'1024': 1}}},
+                               partial=True)
+        self.assertEqual({'ram_free': {'total_mb': 2048,
+                                       'units_by_mb': {'1024': 1}}},
+                         cell.capacities)
+
+
+def _cell(name, is_parent=False):
+    return {'name': name, 'is_parent': is_parent}
+
+
+class CellStateManagerCacheTestCase(test.TestCase):
+    """Test case for what CellStateManager rebuilds when cells change."""
+
+    def setUp(self):
+        super(CellStateManagerCacheTestCase, self).setUp()
+        self.flags(capabilities=['hypervisor=kvm'], group='cells')
+        self.cells = [_cell('child1'), _cell('parent', is_parent=True)]
+        self.stubs.Set(db, 'cell_get_all', lambda ctxt: self.cells)
+        self.stubs.Set(db, 'compute_node_get_all', lambda ctxt: [])
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.state_manager = state.CellStateManager()
+
+    def _sync_from_db(self):
+        timeutils.advance_time_seconds(CONF.cells.db_check_interval)
+        self.state_manager.get_child_cells()
+
+    def test_capabilities_rebuilt_on_update(self):
+        capabs = self.state_manager.get_our_capabilities()
+        self.assertEqual({'hypervisor': set(['kvm'])}, capabs)
+        self.assertTrue(capabs is self.state_manager.get_our_capabilities())
+
+        self.state_manager.update_cell_capabilities('child1',
+                {'hypervisor': ['xenserver']})
+        self.assertEqual({'hypervisor': set(['kvm', 'xenserver'])},
+                         self.state_manager.get_our_capabilities())
+        self.assertEqual({'hypervisor': set(['kvm'])},
+                         self.state_manager.get_our_capabilities(
+                             include_children=False))
+
+    def test_capacities_rebuilt_on_update(self):
+        self.assertEqual({}, self.state_manager.get_our_capacities())
+        self.state_manager.update_cell_capacities('child1',
+                {'ram_free': {'total_mb': 1024}})
+        capacities = self.state_manager.get_our_capacities()
+        self.assertEqual({'ram_free': {'total_mb': 1024}}, capacities)
+        self.assertTrue(capacities is
+                        self.state_manager.get_our_capacities())
+
+    def test_topology_changes(self):
+        self.state_manager.update_cell_capabilities('child1',
+                {'hypervisor': ['xenserver']})
+        routing_table = self.state_manager.get_routing_table()
+        routing_table['fake_route'] = 'fake_cell'
+
+        # Same cells, nothing is forgotten
+        self._sync_from_db()
+        self.assertTrue(routing_table is
+                        self.state_manager.get_routing_table())
+
+        self.cells = [_cell('child2'), _cell('parent', is_parent=True)]
+        self._sync_from_db()
+        self.assertEqual({}, self.state_manager.get_routing_table())
+        self.assertEqual({'hypervisor': set(['kvm'])},
+                         self.state_manager.get_our_capabilities())
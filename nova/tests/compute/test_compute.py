@@ -2778,6 +2778,59 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(len(instances), 1)
         self.assertEqual(task_states.POWERING_OFF, instances[0]['task_state'])
 
+    def test_sync_power_states_updates_instances_at_once(self):
+        uuids = [self._create_fake_instance(
+                     {'host': self.compute.host,
+                      'power_state': power_state.RUNNING,
+                      'vm_state': vm_states.BUILDING})['uuid']
+                 for i in xrange(2)]
+
+        self.stubs.Set(self.compute.driver, 'get_info',
+                       lambda instance: {'state': power_state.PAUSED})
+        calls = []
+        update_many = self.compute.conductor_api.instance_update_many
+
+        def fake_update_many(context, updates):
+            calls.append(updates)
+            return update_many(context, updates)
+        self.stubs.Set(self.compute.conductor_api, 'instance_update_many',
+                       fake_update_many)
+
+        self.compute._sync_power_states(context.get_admin_context())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(uuid for uuid, values in calls[0]),
+                         sorted(uuids))
+        for uuid in uuids:
+            instance = db.instance_get_by_uuid(self.context, uuid)
+            self.assertEqual(instance['power_state'], power_state.PAUSED)
+
+    def test_sync_power_states_updates_before_stopping(self):
+        uuid = self._create_fake_instance(
+                {'host': self.compute.host,
+                 'power_state': power_state.RUNNING,
+                 'vm_state': vm_states.ACTIVE})['uuid']
+
+        def fake_get_info(instance):
+            raise exception.InstanceNotFound(instance_id=instance['uuid'])
+
+        power_states_when_stopped = []
+
+        def fake_stop(context, instance):
+            instance = db.instance_get_by_uuid(context, instance['uuid'])
+            power_states_when_stopped.append(instance['power_state'])
+
+        calls = []
+        self.stubs.Set(self.compute.driver, 'get_info', fake_get_info)
+        self.stubs.Set(self.compute.compute_api, 'stop', fake_stop)
+        self.stubs.Set(self.compute.conductor_api, 'instance_update_many',
+                       lambda context, updates: calls.append(updates))
+
+        self.compute._sync_power_states(context.get_admin_context())
+        self.assertEqual([power_state.SHUTDOWN], power_states_when_stopped)
+        self.assertEqual([], calls)
+        instance = db.instance_get_by_uuid(self.context, uuid)
+        self.assertEqual(power_state.SHUTDOWN, instance['power_state'])
+
     def test_add_instance_fault(self):
         instance = self._create_fake_instance()
         exc_info = None
@@ -0,0 +1,55 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the digest of cached images."""
+
+from nova.compute import image_digest
+from nova import test
+
+
+class ImageDigestTestCase(test.TestCase):
+    def _fingerprints(self, num):
+        return [image_digest.image_fingerprint('image%d' % i)
+                for i in xrange(num)]
+
+    def test_fits_in_a_stat(self):
+        digest = image_digest.make_digest(self._fingerprints(100))
+        self.assertTrue(len(digest) <= 255)
+
+    def test_contains_its_images(self):
+        fingerprints = self._fingerprints(100)
+        digest = image_digest.make_digest(fingerprints)
+        for fingerprint in fingerprints:
+            self.assertTrue(image_digest.digest_contains(digest,
+                                                         fingerprint))
+
+    def test_few_false_positives(self):
+        digest = image_digest.make_digest(self._fingerprints(100))
+        others = [image_digest.image_fingerprint('other%d' % i)
+                  for i in xrange(1000)]
+        false_positives = [fingerprint for fingerprint in others
+                           if image_digest.digest_contains(digest,
+                                                           fingerprint)]
+        self.assertTrue(len(false_positives) < 20)
+
+    def test_empty_or_invalid_digest(self):
+        fingerprint = image_digest.image_fingerprint('image')
+        self.assertFalse(image_digest.digest_contains(
+                image_digest.make_digest([]), fingerprint))
+        self.assertFalse(image_digest.digest_contains('invalid',
+                                                      fingerprint))
+        self.assertFalse(image_digest.digest_contains('!', fingerprint))
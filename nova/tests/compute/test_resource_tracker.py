@@ -19,6 +19,7 @@
 
 import uuid
 
+from nova.compute import image_digest
 from nova.compute import instance_types
 from nova.compute import resource_tracker
 from nova.compute import task_states
@@ -891,3 +892,35 @@ class OrphanTestCase(BaseTrackerTestCase):
         orphans = self.tracker._find_orphaned_instances()
 
         self.assertEqual(2, len(orphans))
+
+
+class ImageCacheDigestTestCase(BaseTrackerTestCase):
+
+    def _driver(self):
+        class ImageCacheVirtDriver(FakeVirtDriver):
+            def get_cached_image_fingerprints(self):
+                return [image_digest.image_fingerprint('fake-image')]
+
+        return ImageCacheVirtDriver()
+
+    def test_digest_in_stats(self):
+        digest = self.tracker.stats[image_digest.STAT_KEY]
+        fingerprint = image_digest.image_fingerprint('fake-image')
+        self.assertTrue(image_digest.digest_contains(digest, fingerprint))
+
+    def test_last_digest_kept_on_driver_error(self):
+        digest = self.tracker.stats[image_digest.STAT_KEY]
+
+        def fake_get_cached_image_fingerprints():
+            raise test.TestingException()
+
+        self.stubs.Set(self.tracker.driver, 'get_cached_image_fingerprints',
+                       fake_get_cached_image_fingerprints)
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(digest, self.tracker.stats[image_digest.STAT_KEY])
+
+    def test_no_digest_without_support(self):
+        tracker = BaseTrackerTestCase._tracker(self)
+        tracker.driver = FakeVirtDriver()
+        tracker.update_available_resource(self.context)
+        self.assertFalse(image_digest.STAT_KEY in tracker.stats)
@@ -77,6 +77,9 @@ class VirtAPIBaseTest(test.TestCase, test.APICoverage):
         self.assertExpected('agent_build_get_by_triple',
                             'fake-hv', 'gnu/hurd', 'fake-arch')
 
+    def test_compute_node_get_all(self):
+        self.assertExpected('compute_node_get_all')
+
 
 class FakeVirtAPITest(VirtAPIBaseTest):
 
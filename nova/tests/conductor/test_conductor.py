@@ -107,6 +107,19 @@ class _BaseTestCase(object):
         self.mox.ReplayAll()
         self.conductor.action_event_finish(self.context, {})
 
+    def test_instance_update_many(self):
+        instance1 = self._create_fake_instance()
+        instance2 = self._create_fake_instance()
+        result = self.conductor.instance_update_many(self.context, [
+            (instance1['uuid'], {'vm_state': vm_states.STOPPED}),
+            (instance2['uuid'], {'power_state': 4})])
+        self.assertEqual([inst['uuid'] for inst in result],
+                         [instance1['uuid'], instance2['uuid']])
+        instance1 = db.instance_get_by_uuid(self.context, instance1['uuid'])
+        instance2 = db.instance_get_by_uuid(self.context, instance2['uuid'])
+        self.assertEqual(instance1['vm_state'], vm_states.STOPPED)
+        self.assertEqual(instance2['power_state'], 4)
+
     def test_instance_update_invalid_key(self):
         # NOTE(danms): the real DB API call ignores invalid keys
         if self.db == None:
@@ -254,6 +267,18 @@ class _BaseTestCase(object):
         result = self.conductor.bw_usage_update(*update_args)
         self.assertEqual(result, 'foo')
 
+    def test_bw_usage_update_many(self):
+        self.mox.StubOutWithMock(db, 'bw_usage_update_many')
+        start_period = timeutils.utcnow().replace(microsecond=0)
+        usage = {'uuid': 'uuid', 'mac': 'mac', 'start_period': start_period,
+                 'bw_in': 10, 'bw_out': 20, 'last_ctr_in': 5,
+                 'last_ctr_out': 10}
+        db.bw_usage_update_many(self.context, [usage], start_period)
+
+        self.mox.ReplayAll()
+        self.conductor.bw_usage_update_many(self.context, [dict(usage)],
+                                            start_period)
+
     def test_get_backdoor_port(self):
         backdoor_port = 59697
 
@@ -405,6 +430,20 @@ class _BaseTestCase(object):
                                         {'uuid': 'fake-id'}, 'fake-refr',
                                         'fake-bool')
 
+    def test_vol_usage_update_many(self):
+        self.mox.StubOutWithMock(db, 'vol_usage_update_many')
+        db.vol_usage_update_many(self.context,
+                                 [{'id': 'fake-vol', 'rd_req': 'rd-req',
+                                   'rd_bytes': 'rd-bytes', 'wr_req': 'wr-req',
+                                   'wr_bytes': 'wr-bytes',
+                                   'instance_id': 'fake-id'}],
+                                 None)
+        self.mox.ReplayAll()
+        usage = {'volume': 'fake-vol', 'rd_req': 'rd-req',
+                 'rd_bytes': 'rd-bytes', 'wr_req': 'wr-req',
+                 'wr_bytes': 'wr-bytes', 'instance': {'uuid': 'fake-id'}}
+        self.conductor.vol_usage_update_many(self.context, [usage])
+
     def test_ping(self):
         result = self.conductor.ping(self.context, 'foo')
         self.assertEqual(result, {'service': 'conductor', 'arg': 'foo'})
@@ -428,6 +467,13 @@ class _BaseTestCase(object):
                                                     'fake-values', False)
         self.assertEqual(result, 'fake-result')
 
+    def test_compute_node_get_all(self):
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(self.context).AndReturn('fake-result')
+        self.mox.ReplayAll()
+        result = self.conductor.compute_node_get_all(self.context)
+        self.assertEqual(result, 'fake-result')
+
     def test_instance_fault_create(self):
         self.mox.StubOutWithMock(db, 'instance_fault_create')
         db.instance_fault_create(self.context, 'fake-values').AndReturn(
@@ -54,6 +54,10 @@ def copy_image(src, dest):
     pass
 
 
+def clone_image(src, dest):
+    pass
+
+
 def resize2fs(path):
     pass
 
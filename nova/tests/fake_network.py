@@ -148,6 +148,22 @@ class FakeNetworkManager(network_manager.NetworkManager):
             return [ip for ip in self.fixed_ips
                     if ip['virtual_interface_id'] == vif_id]
 
+        def fixed_ip_get_all_by_address_filter(self, context,
+                                               address_like=None,
+                                               address=None):
+            # NOTE: returns every row, the manager matches the regex.
+            rows = []
+            for fixed_ip in self.fixed_ips:
+                vif = self.vifs[fixed_ip['virtual_interface_id']]
+                floating_addresses = [ip['address'] for ip in
+                                      self.floating_ips
+                                      if ip['fixed_ip_id'] == fixed_ip['id']]
+                for floating_address in floating_addresses or [None]:
+                    rows.append({'address': fixed_ip['address'],
+                                 'instance_uuid': vif['instance_uuid'],
+                                 'floating_address': floating_address})
+            return rows
+
     def __init__(self):
         self.db = self.FakeDB()
         self.deallocate_called = None
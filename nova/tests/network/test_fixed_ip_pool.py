@@ -0,0 +1,97 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova import context
+from nova import exception
+from nova.network import fixed_ip_pool
+from nova import test
+
+
+class FakeDb(object):
+    def __init__(self, free):
+        self.free = set(free)
+        self.loads = 0
+
+    def fixed_ip_get_free_addresses(self, context, network_id):
+        self.loads += 1
+        return list(self.free)
+
+    def fixed_ip_associate_if_free(self, context, address, network_id,
+                                   instance_uuid=None, host=None):
+        if address not in self.free:
+            return False
+        self.free.remove(address)
+        return True
+
+
+class FixedIpPoolTestCase(test.TestCase):
+    def test_take_returns_every_free_address_once(self):
+        pool = fixed_ip_pool.FixedIpPool('10.0.0.0/29')
+        for address in ('10.0.0.2', '10.0.0.5', '10.0.0.7'):
+            pool.mark_free(address)
+        pool.mark_free('10.0.0.5')
+        self.assertEqual(pool.free_count, 3)
+        taken = set([pool.take(), pool.take(), pool.take()])
+        self.assertEqual(taken, set(['10.0.0.2', '10.0.0.5', '10.0.0.7']))
+        self.assertEqual(pool.free_count, 0)
+        self.assertEqual(pool.take(), None)
+
+    def test_mark_free_ignores_addresses_outside_cidr(self):
+        pool = fixed_ip_pool.FixedIpPool('10.0.0.0/30')
+        pool.mark_free('10.0.1.1')
+        self.assertFalse('10.0.1.1' in pool)
+        self.assertEqual(pool.free_count, 0)
+
+
+class FixedIpAllocatorTestCase(test.TestCase):
+    def setUp(self):
+        super(FixedIpAllocatorTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.network = {'id': 1, 'cidr': '10.0.0.0/29'}
+
+    def test_allocate_skips_addresses_taken_elsewhere(self):
+        db = FakeDb(['10.0.0.2', '10.0.0.3'])
+        allocator = fixed_ip_pool.FixedIpAllocator(db)
+        allocator.add_network(self.network, ['10.0.0.2', '10.0.0.3'])
+        # Another host took one of the addresses behind our back.
+        db.free.remove('10.0.0.2')
+        address = allocator.allocate(self.context, self.network, 'uuid')
+        self.assertEqual(address, '10.0.0.3')
+        self.assertEqual(db.loads, 0)
+
+    def test_allocate_reloads_when_pool_runs_dry(self):
+        db = FakeDb([])
+        allocator = fixed_ip_pool.FixedIpAllocator(db)
+        allocator.add_network(self.network, [])
+        db.free.add('10.0.0.4')
+        address = allocator.allocate(self.context, self.network, host='h')
+        self.assertEqual(address, '10.0.0.4')
+        self.assertEqual(db.loads, 1)
+
+    def test_allocate_raises_when_network_is_full(self):
+        allocator = fixed_ip_pool.FixedIpAllocator(FakeDb([]))
+        self.assertRaises(exception.NoMoreFixedIps, allocator.allocate,
+                          self.context, self.network, 'uuid')
+
+    def test_release_returns_address_to_pool(self):
+        db = FakeDb(['10.0.0.2'])
+        allocator = fixed_ip_pool.FixedIpAllocator(db)
+        address = allocator.allocate(self.context, self.network, 'uuid')
+        db.free.add(address)
+        allocator.release(address)
+        self.assertEqual(allocator.pools[1].free_count, 1)
+        self.assertEqual(db.loads, 1)
@@ -18,6 +18,7 @@
 import calendar
 import os
 
+from eventlet import greenthread
 import mox
 
 from nova import context
@@ -285,6 +286,61 @@ class LinuxNetworkTestCase(test.TestCase):
 
         self.driver.update_dhcp(self.context, "eth0", networks[0])
 
+    def _stub_dhcp_writes(self):
+        self.stubs.Set(linux_net, 'dhcp_host_manager',
+                       linux_net.DhcpHostManager())
+        written = []
+        restarts = []
+        self.stubs.Set(linux_net, 'write_to_file',
+                       lambda path, data: written.append(data))
+        self.stubs.Set(linux_net, 'restart_dhcp',
+                       lambda context, dev, network_ref: restarts.append(dev))
+        return written, restarts
+
+    def test_update_dhcp_single_address(self):
+        written, restarts = self._stub_dhcp_writes()
+
+        self.driver.update_dhcp(self.context, "eth0", networks[0])
+        self.assertEqual(written,
+                         [self.driver.get_dhcp_hosts(self.context,
+                                                     networks[0])])
+
+        queried = []
+
+        def get_associated_released(context, network_id, host=None,
+                                    address=None):
+            queried.append(address)
+            return [datum for datum in get_associated(context, network_id,
+                                                      host, address)
+                    if datum['address'] != '192.168.0.102']
+
+        self.stubs.Set(db, 'network_get_associated_fixed_ips',
+                       get_associated_released)
+        self.driver.update_dhcp(self.context, "eth0", networks[0],
+                                '192.168.0.102')
+
+        self.assertEqual(queried, ['192.168.0.102'])
+        self.assertEqual(written[-1],
+                         "DE:AD:BE:EF:00:00,fake_instance00.novalocal,"
+                         "192.168.0.100\n"
+                         "DE:AD:BE:EF:00:03,fake_instance01.novalocal,"
+                         "192.168.1.101")
+        self.assertEqual(restarts, ['eth0', 'eth0'])
+
+    def test_update_dhcp_delayed(self):
+        self.flags(dhcp_update_delay=0.01)
+        written, restarts = self._stub_dhcp_writes()
+
+        self.driver.update_dhcp(self.context, "eth0", networks[0])
+        for address in ['192.168.0.100', '192.168.1.101']:
+            self.driver.update_dhcp(self.context, "eth0", networks[0],
+                                    address)
+        self.assertEqual(restarts, [])
+
+        greenthread.sleep(0.1)
+        self.assertEqual(len(written), 1)
+        self.assertEqual(restarts, ['eth0'])
+
     def test_get_dhcp_hosts_for_nw00(self):
         self.flags(use_single_default_gateway=True)
 
@@ -686,3 +742,33 @@ class LinuxNetworkTestCase(test.TestCase):
         self.mox.ReplayAll()
         manager.defer_apply_off()
         self.assertFalse(manager.iptables_apply_deferred)
+
+    def test_ipset_set_members(self):
+        cmds = []
+
+        def fake_execute(*cmd, **kwargs):
+            cmds.append((cmd, kwargs.get('process_input')))
+            return '', ''
+
+        manager = linux_net.IpsetManager(execute=fake_execute)
+        self.assertTrue(manager.set_members('foo', ['10.0.0.1', '10.0.0.2']))
+        self.assertEqual(cmds, [
+            (('ipset', 'create', 'foo', 'hash:ip', 'family', 'inet',
+              '-exist'), None),
+            (('ipset', 'flush', 'foo'), None),
+            (('ipset', 'restore', '-exist'),
+             'add foo 10.0.0.1\nadd foo 10.0.0.2\n')])
+
+        cmds[:] = []
+        self.assertFalse(manager.set_members('foo', ['10.0.0.2', '10.0.0.1']))
+        self.assertEqual(cmds, [])
+
+        self.assertTrue(manager.set_members('foo', ['10.0.0.2', '10.0.0.3']))
+        self.assertEqual(cmds, [
+            (('ipset', 'restore', '-exist'),
+             'add foo 10.0.0.3\ndel foo 10.0.0.1\n')])
+
+        cmds[:] = []
+        manager.destroy_set('foo')
+        self.assertEqual(cmds, [(('ipset', 'destroy', 'foo'), None)])
+        self.assertEqual(manager.sets, {})
@@ -1036,7 +1036,7 @@ class VlanNetworkTestCase(test.TestCase):
         def network_get(_context, network_id, project_only="allow_none"):
             return networks[network_id]
 
-        def teardown_network_on_host(_context, network):
+        def teardown_network_on_host(_context, network, address=None):
             if network['id'] == 0:
                 raise test.TestingException()
 
@@ -1391,6 +1391,33 @@ class CommonNetworkTestCase(test.TestCase):
         self.assertEqual(res[0]['instance_uuid'], _vifs[1]['instance_uuid'])
         self.assertEqual(res[1]['instance_uuid'], _vifs[2]['instance_uuid'])
 
+    def test_get_instance_uuids_by_floating_ip_regex(self):
+        manager = fake_network.FakeNetworkManager()
+        _vifs = manager.db.virtual_interface_get_all(None)
+        fake_context = context.RequestContext('user', 'project')
+
+        res = manager.get_instance_uuids_by_ip_filter(fake_context,
+                                                      {'ip': '17.\\.16\\.1'})
+        self.assertEqual(len(res), 3)
+        self.assertEqual([r['ip'] for r in res],
+                         ['172.16.1.1', '172.16.1.2', '173.16.1.2'])
+        self.assertEqual(res[0]['instance_uuid'], _vifs[0]['instance_uuid'])
+
+    def test_ip_filter_to_like(self):
+        self.assertEqual(network_manager._ip_filter_to_like('10.0.0.1'),
+                         '10_0_0_1%')
+        self.assertEqual(
+            network_manager._ip_filter_to_like('^10\\.0\\.0\\.1$'),
+            '10.0.0.1%')
+        self.assertEqual(network_manager._ip_filter_to_like('172.16.0.*'),
+                         '172_16_0%')
+        self.assertEqual(network_manager._ip_filter_to_like('10.0.0.12?'),
+                         '10_0_0_1%')
+        self.assertEqual(network_manager._ip_filter_to_like('.*'), '%')
+        self.assertEqual(network_manager._ip_filter_to_like('10.0|11'), '%')
+        self.assertEqual(network_manager._ip_filter_to_like('10.[0-9]'),
+                         '10_%')
+
     def test_get_instance_uuids_by_ipv6_regex(self):
         manager = fake_network.FakeNetworkManager()
         _vifs = manager.db.virtual_interface_get_all(None)
@@ -286,6 +286,7 @@ class HostStateTestCase(test.TestCase):
             dict(key='num_os_type_linux', value='4'),
             dict(key='num_os_type_windoze', value='1'),
             dict(key='io_workload', value='42'),
+            dict(key='image_cache_digest', value='fake_digest'),
         ]
         compute = dict(stats=stats, memory_mb=0, free_disk_gb=0, local_gb=0,
                        local_gb_used=0, free_ram_mb=0, vcpus=0, vcpus_used=0,
@@ -304,6 +305,7 @@ class HostStateTestCase(test.TestCase):
         self.assertEqual(4, host.num_instances_by_os_type['linux'])
         self.assertEqual(1, host.num_instances_by_os_type['windoze'])
         self.assertEqual(42, host.num_io_ops)
+        self.assertEqual('fake_digest', host.image_cache_digest)
 
     def test_stat_consumption_from_instance(self):
         host = host_manager.HostState("fakehost", "fakenode")
@@ -16,6 +16,7 @@
 Tests For Scheduler weights.
 """
 
+from nova.compute import image_digest
 from nova import context
 from nova.scheduler import weights
 from nova import test
@@ -34,8 +35,9 @@ class TestWeighedHost(test.TestCase):
     def test_all_weighers(self):
         classes = weights.all_weighers()
         class_names = [cls.__name__ for cls in classes]
-        self.assertEqual(len(classes), 1)
+        self.assertEqual(len(classes), 2)
         self.assertIn('RAMWeigher', class_names)
+        self.assertIn('ImageCacheWeigher', class_names)
 
     def test_all_weighers_with_deprecated_config1(self):
         self.flags(compute_fill_first_cost_fn_weight=-1.0)
@@ -115,3 +117,43 @@ class RamWeigherTestCase(test.TestCase):
         weighed_host = self._get_weighed_host(hostinfo_list)
         self.assertEqual(weighed_host.weight, 8192 * 2)
         self.assertEqual(weighed_host.obj.host, 'host4')
+
+
+class ImageCacheWeigherTestCase(test.TestCase):
+    def setUp(self):
+        super(ImageCacheWeigherTestCase, self).setUp()
+        self.weight_handler = weights.HostWeightHandler()
+        self.weight_classes = self.weight_handler.get_matching_classes(
+                ['nova.scheduler.weights.image_cache.ImageCacheWeigher'])
+        warm_digest = image_digest.make_digest(
+                [image_digest.image_fingerprint('fake_image')])
+        cold_digest = image_digest.make_digest(
+                [image_digest.image_fingerprint('other_image')])
+        self.hosts = [fakes.FakeHostState('cold', 'node', {
+                          'image_cache_digest': cold_digest}),
+                      fakes.FakeHostState('warm', 'node', {
+                          'image_cache_digest': warm_digest}),
+                      fakes.FakeHostState('unknown', 'node', {})]
+
+    def _get_weighed_hosts(self, weight_properties):
+        return self.weight_handler.get_weighed_objects(self.weight_classes,
+                self.hosts, weight_properties)
+
+    def test_host_with_image_wins(self):
+        weight_properties = {'request_spec': {'image': {'id': 'fake_image'}}}
+        weighed_hosts = self._get_weighed_hosts(weight_properties)
+        self.assertEqual('warm', weighed_hosts[0].obj.host)
+        self.assertEqual(1024, weighed_hosts[0].weight)
+        self.assertEqual([0, 0], [host.weight for host in weighed_hosts[1:]])
+
+    def test_image_ref_of_instance(self):
+        self.flags(image_cache_weight_multiplier=2.0)
+        weight_properties = {'request_spec': {
+                'instance_properties': {'image_ref': 'fake_image'}}}
+        weighed_hosts = self._get_weighed_hosts(weight_properties)
+        self.assertEqual('warm', weighed_hosts[0].obj.host)
+        self.assertEqual(2, weighed_hosts[0].weight)
+
+    def test_no_image(self):
+        weighed_hosts = self._get_weighed_hosts({})
+        self.assertEqual([0, 0, 0], [host.weight for host in weighed_hosts])
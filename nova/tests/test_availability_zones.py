@@ -23,6 +23,7 @@ from nova import availability_zones as az
 from nova import context
 from nova import db
 from nova.openstack.common import cfg
+from nova.openstack.common import timeutils
 from nova import test
 
 CONF = cfg.CONF
@@ -111,3 +112,57 @@ class AvailabilityZoneTestCases(test.TestCase):
 
         self.assertEquals(self.availability_zone,
                         az.get_host_availability_zone(self.context, self.host))
+
+    def test_get_host_availability_zones(self):
+        """Test get right availability zones of several hosts."""
+        service = self._create_service_with_topic('compute')
+        self._add_to_aggregate(service)
+
+        self.assertEquals({self.host: self.availability_zone,
+                           'other': self.default_az},
+                          az.get_host_availability_zones(self.context,
+                                                         [self.host, 'other']))
+
+    def test_host_availability_zones_are_cached(self):
+        """Test aggregates are only read again once they changed."""
+        service = self._create_service_with_topic('compute')
+        self._add_to_aggregate(service)
+        self.assertEquals(self.availability_zone,
+                        az.get_host_availability_zone(self.context, self.host))
+
+        self.mox.StubOutWithMock(db, 'aggregate_host_get_by_metadata_key')
+        self.mox.ReplayAll()
+        self.assertEquals(self.availability_zone,
+                        az.get_host_availability_zone(self.context, self.host))
+        self.assertEquals({self.host: self.availability_zone},
+                          az.get_host_availability_zones(self.context,
+                                                         [self.host]))
+
+    def test_host_availability_zones_reloaded_after_change(self):
+        """Test changes to aggregates are seen at once by this process."""
+        service = self._create_service_with_topic('compute')
+        self.assertEquals(self.default_az,
+                        az.get_host_availability_zone(self.context, self.host))
+        self._add_to_aggregate(service)
+        self.assertEquals(self.availability_zone,
+                        az.get_host_availability_zone(self.context, self.host))
+        self._delete_from_aggregate(service)
+        self.assertEquals(self.default_az,
+                        az.get_host_availability_zone(self.context, self.host))
+
+    def test_host_availability_zones_reloaded_after_cache_time(self):
+        """Test changes made by other services are seen after a while."""
+        self.flags(availability_zone_cache_time=15)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertEquals(self.default_az,
+                        az.get_host_availability_zone(self.context, self.host))
+
+        self.stubs.Set(db, 'aggregate_host_get_by_metadata_key',
+                       lambda context, key: {self.host: set(['other-az'])})
+        timeutils.advance_time_seconds(10)
+        self.assertEquals(self.default_az,
+                        az.get_host_availability_zone(self.context, self.host))
+        timeutils.advance_time_seconds(10)
+        self.assertEquals('other-az',
+                        az.get_host_availability_zone(self.context, self.host))
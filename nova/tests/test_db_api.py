@@ -26,6 +26,7 @@ from nova import context
 from nova import db
 from nova import exception
 from nova.openstack.common import cfg
+from nova.openstack.common.db.sqlalchemy import session as db_session
 from nova.openstack.common import timeutils
 from nova import test
 from nova.tests import matchers
@@ -55,6 +56,11 @@ class DbApiTestCase(test.TestCase):
         args.update(kwargs)
         return db.instance_create(ctxt, args)
 
+    def test_dispose_engine_without_engine(self):
+        self.stubs.Set(db_session, '_ENGINE', None)
+        db.dispose_engine()
+        self.assertEqual(None, db_session._ENGINE)
+
     def test_create_instance_unique_hostname(self):
         otherprojectcontext = context.RequestContext(self.user_id,
                                           "%s2" % self.project_id)
@@ -433,6 +439,55 @@ class DbApiTestCase(test.TestCase):
         self.assertEquals("building", old_ref["vm_state"])
         self.assertEquals("needscoffee", new_ref["vm_state"])
 
+    def test_instance_update_many(self):
+        ctxt = context.get_admin_context()
+        instance1 = db.instance_create(ctxt, {'power_state': 1})
+        instance2 = db.instance_create(ctxt, {'power_state': 1})
+        deleted = db.instance_create(ctxt, {'power_state': 1})
+        db.instance_destroy(ctxt, deleted['uuid'])
+
+        results = db.instance_update_many(ctxt,
+                [(instance1['uuid'], {'power_state': 4}),
+                 (deleted['uuid'], {'power_state': 4}),
+                 (instance2['uuid'], {'power_state': 0})])
+        self.assertEqual([(old['power_state'], new['power_state'])
+                          for old, new in results], [(1, 4), (1, 0)])
+        self.assertEqual(db.instance_get_by_uuid(ctxt,
+                         instance1['uuid'])['power_state'], 4)
+        self.assertEqual(db.instance_get_by_uuid(ctxt,
+                         instance2['uuid'])['power_state'], 0)
+
+    def test_instance_update_many_with_metadata(self):
+        ctxt = context.get_admin_context()
+        instance1 = db.instance_create(ctxt, {'power_state': 1,
+                                              'metadata': {'key': 'old'}})
+        instance2 = db.instance_create(ctxt, {'power_state': 1})
+
+        results = db.instance_update_many(ctxt,
+                [(instance1['uuid'], {'metadata': {'key': 'new'}}),
+                 (instance2['uuid'], {'power_state': 4})])
+        self.assertEqual([new['uuid'] for old, new in results],
+                         [instance1['uuid'], instance2['uuid']])
+        self.assertEqual(results[1][1]['extra_specs'], {})
+        instance1 = db.instance_get_by_uuid(ctxt, instance1['uuid'])
+        self.assertEqual(instance1['metadata'][0]['value'], 'new')
+        instance2 = db.instance_get_by_uuid(ctxt, instance2['uuid'])
+        self.assertEqual(instance2['power_state'], 4)
+        self.assertNotEqual(instance2['updated_at'], None)
+
+    def test_instance_get_updated_at(self):
+        ctxt = context.get_admin_context()
+        instance = db.instance_create(ctxt, {})
+        self.assertEqual(db.instance_get_updated_at(ctxt, instance['uuid']),
+                         instance['created_at'])
+        instance = db.instance_update(ctxt, instance['uuid'],
+                                      {'power_state': 1})
+        self.assertEqual(db.instance_get_updated_at(ctxt, instance['uuid']),
+                         instance['updated_at'])
+        db.instance_destroy(ctxt, instance['uuid'])
+        self.assertRaises(exception.InstanceNotFound,
+                          db.instance_get_updated_at, ctxt, instance['uuid'])
+
     def test_instance_update_with_extra_specs(self):
         # Ensure _extra_specs are returned from _instance_update.
         ctxt = context.get_admin_context()
@@ -873,6 +928,11 @@ class DbApiTestCase(test.TestCase):
         self.assertEqual(record['vif_address'], vif['address'])
         data = db.network_get_associated_fixed_ips(ctxt, 1, 'nothing')
         self.assertEqual(len(data), 0)
+        data = db.network_get_associated_fixed_ips(ctxt, 1,
+                                                   address=fixed_address)
+        self.assertEqual(len(data), 1)
+        data = db.network_get_associated_fixed_ips(ctxt, 1, address='qux')
+        self.assertEqual(len(data), 0)
 
     def test_network_get_all_by_host(self):
         ctxt = context.get_admin_context()
@@ -1044,6 +1104,31 @@ class DbApiTestCase(test.TestCase):
         _compare(bw_usages[2], expected_bw_usages[2])
         timeutils.clear_time_override()
 
+    def test_bw_usage_update_many(self):
+        ctxt = context.get_admin_context()
+        now = timeutils.utcnow()
+        start_period = now - datetime.timedelta(seconds=10)
+        db.bw_usage_update(ctxt, 'fake_uuid1', 'fake_mac1', start_period,
+                           100, 200, 12345, 67890)
+
+        db.bw_usage_update_many(ctxt, [
+            {'uuid': 'fake_uuid1', 'mac': 'fake_mac1',
+             'start_period': start_period, 'bw_in': 110, 'bw_out': 210,
+             'last_ctr_in': 12355, 'last_ctr_out': 67900},
+            {'uuid': 'fake_uuid2', 'mac': 'fake_mac2',
+             'start_period': start_period, 'bw_in': 0, 'bw_out': 0,
+             'last_ctr_in': 42, 'last_ctr_out': 43}],
+            last_refreshed=now)
+
+        bw_usages = db.bw_usage_get_by_uuids(ctxt,
+                ['fake_uuid1', 'fake_uuid2'], start_period)
+        self.assertEqual(len(bw_usages), 2)
+        self.assertEqual([(u['uuid'], u['bw_in'], u['bw_out'],
+                           u['last_ctr_in'], u['last_ctr_out'],
+                           u['last_refreshed']) for u in bw_usages],
+                         [('fake_uuid1', 110, 210, 12355, 67900, now),
+                          ('fake_uuid2', 0, 0, 42, 43, now)])
+
 
 def _get_fake_aggr_values():
     return {'name': 'fake_aggregate'}
@@ -1625,6 +1710,65 @@ class TestIpAllocation(test.TestCase):
         self.assertEqual(fixed_ip['instance_uuid'], self.instance['uuid'])
         self.assertEqual(fixed_ip['network_id'], self.network['id'])
 
+    def test_fixed_ip_associate_if_free(self):
+        address = self.create_fixed_ip(network_id=self.network['id'])
+        self.assertTrue(db.fixed_ip_associate_if_free(
+                self.ctxt, address, self.network['id'],
+                instance_uuid=self.instance['uuid']))
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
+        self.assertEqual(fixed_ip['instance_uuid'], self.instance['uuid'])
+        self.assertFalse(db.fixed_ip_associate_if_free(
+                self.ctxt, address, self.network['id'],
+                instance_uuid=self.instance['uuid']))
+
+    def test_fixed_ip_associate_if_free_skips_reserved(self):
+        address = self.create_fixed_ip(network_id=self.network['id'],
+                                       reserved=True)
+        self.assertFalse(db.fixed_ip_associate_if_free(
+                self.ctxt, address, self.network['id'], host='host'))
+
+    def test_fixed_ip_get_free_addresses(self):
+        self.create_fixed_ip(network_id=self.network['id'])
+        self.create_fixed_ip(address='192.168.0.2',
+                             network_id=self.network['id'],
+                             instance_uuid=self.instance['uuid'])
+        self.create_fixed_ip(address='192.168.0.3',
+                             network_id=self.network['id'],
+                             reserved=True)
+        self.create_fixed_ip(address='192.168.0.4',
+                             network_id=self.network['id'],
+                             host='host')
+        self.assertEqual(['192.168.0.1'],
+                         db.fixed_ip_get_free_addresses(self.ctxt,
+                                                        self.network['id']))
+
+    def test_fixed_ip_get_all_by_address_filter(self):
+        vif = db.virtual_interface_create(self.ctxt,
+                {'instance_uuid': self.instance['uuid'],
+                 'address': 'aa:bb:cc:dd:ee:ff'})
+        fixed = self.create_fixed_ip(virtual_interface_id=vif['id'])
+        self.create_fixed_ip(address='192.168.1.1',
+                             virtual_interface_id=vif['id'])
+        # not attached to an instance
+        self.create_fixed_ip(address='192.168.0.2')
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, fixed)
+        db.floating_ip_create(self.ctxt, {'address': '10.0.0.1',
+                                          'fixed_ip_id': fixed_ip['id']})
+
+        rows = db.fixed_ip_get_all_by_address_filter(self.ctxt,
+                                                     '192_168_0%')
+        self.assertEqual(rows, [{'address': '192.168.0.1',
+                                 'instance_uuid': self.instance['uuid'],
+                                 'floating_address': '10.0.0.1'}])
+        rows = db.fixed_ip_get_all_by_address_filter(self.ctxt, '10.%')
+        self.assertEqual([r['address'] for r in rows], ['192.168.0.1'])
+        rows = db.fixed_ip_get_all_by_address_filter(self.ctxt, '172%',
+                                                     '192.168.1.1')
+        self.assertEqual([r['address'] for r in rows], ['192.168.1.1'])
+        rows = db.fixed_ip_get_all_by_address_filter(self.ctxt)
+        self.assertEqual([r['address'] for r in rows],
+                         ['192.168.0.1', '192.168.1.1'])
+
 
 class InstanceDestroyConstraints(test.TestCase):
 
@@ -1711,6 +1855,28 @@ class VolumeUsageDBApiTestCase(test.TestCase):
         _compare(vol_usages[1], expected_vol_usages[1])
         timeutils.clear_time_override()
 
+    def test_vol_usage_update_many(self):
+        ctxt = context.get_admin_context()
+        now = timeutils.utcnow()
+        start_time = now - datetime.timedelta(seconds=10)
+        db.vol_usage_update(ctxt, 1, rd_req=10, rd_bytes=20,
+                            wr_req=30, wr_bytes=40, instance_id=1)
+
+        db.vol_usage_update_many(ctxt, [
+            {'id': 1, 'rd_req': 11, 'rd_bytes': 21, 'wr_req': 31,
+             'wr_bytes': 41, 'instance_id': 1},
+            {'id': 2, 'rd_req': 100, 'rd_bytes': 200, 'wr_req': 300,
+             'wr_bytes': 400, 'instance_id': 2}],
+            last_refreshed=now)
+
+        vol_usages = db.vol_get_usage_by_time(ctxt, start_time)
+        self.assertEqual([(u['volume_id'], u['curr_reads'],
+                           u['curr_read_bytes'], u['curr_writes'],
+                           u['curr_write_bytes'], u['curr_last_refreshed'])
+                          for u in vol_usages],
+                         [('1', 11, 21, 31, 41, now),
+                          ('2', 100, 200, 300, 400, now)])
+
     def test_vol_usage_update_totals_update(self):
         ctxt = context.get_admin_context()
         now = timeutils.utcnow()
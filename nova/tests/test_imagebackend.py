@@ -125,14 +125,15 @@ class RawTestCase(_ImageTestCase, test.TestCase):
         fn = self.mox.CreateMockAnything()
         self.mox.StubOutWithMock(imagebackend.lockutils.synchronized,
                                  '__call__')
-        self.mox.StubOutWithMock(imagebackend.libvirt_utils, 'copy_image')
+        self.mox.StubOutWithMock(imagebackend.libvirt_utils, 'clone_image')
         self.mox.StubOutWithMock(imagebackend.disk, 'extend')
         return fn
 
     def test_create_image(self):
         fn = self.prepare_mocks()
         fn(target=self.TEMPLATE_PATH, image_id=None)
-        imagebackend.libvirt_utils.copy_image(self.TEMPLATE_PATH, self.PATH)
+        imagebackend.libvirt_utils.clone_image(self.TEMPLATE_PATH,
+                                               self.PATH)
         self.mox.ReplayAll()
 
         image = self.image_class(self.INSTANCE, self.NAME)
@@ -153,7 +154,8 @@ class RawTestCase(_ImageTestCase, test.TestCase):
     def test_create_image_extend(self):
         fn = self.prepare_mocks()
         fn(target=self.TEMPLATE_PATH, image_id=None)
-        imagebackend.libvirt_utils.copy_image(self.TEMPLATE_PATH, self.PATH)
+        imagebackend.libvirt_utils.clone_image(self.TEMPLATE_PATH,
+                                               self.PATH)
         imagebackend.disk.extend(self.PATH, self.SIZE)
         self.mox.ReplayAll()
 
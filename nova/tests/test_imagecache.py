@@ -865,6 +865,23 @@ class ImageCacheManagerTestCase(test.TestCase):
         image_cache_manager = imagecache.ImageCacheManager()
         image_cache_manager.verify_base_images(None, [])
 
+    def test_list_cached_image_fingerprints(self):
+        hashed = 'e97222e91fc4241f49a7f520d1dcf446751129b3'
+
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.assertEqual([], imagecache.list_cached_image_fingerprints())
+
+            base_dir = os.path.join(tmpdir, '_base')
+            os.mkdir(base_dir)
+            for ent in [hashed, hashed + '_10', hashed + '.info',
+                        'ephemeral_0_10_None']:
+                open(os.path.join(base_dir, ent), 'w').close()
+            os.mkdir(os.path.join(base_dir, hashed[::-1]))
+
+            self.assertEqual([hashed],
+                             imagecache.list_cached_image_fingerprints())
+
     def test_is_valid_info_file(self):
         hashed = 'e97222e91fc4241f49a7f520d1dcf446751129b3'
 
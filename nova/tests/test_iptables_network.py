@@ -17,6 +17,9 @@
 #    under the License.
 """Unit Tests for network code."""
 
+import eventlet
+
+from nova import exception
 from nova.network import linux_net
 from nova import test
 
@@ -189,3 +192,103 @@ class IptablesManagerTestCase(test.TestCase):
                         "COMMIT" == new_lines[-2] and
                         "#Completed by nova" == new_lines[-1],
                         "iptables rules not generated in the correct order")
+
+
+class IptablesManagerIncrementalApplyTestCase(test.TestCase):
+
+    binary_name = linux_net.get_binary_name()
+
+    def setUp(self):
+        super(IptablesManagerIncrementalApplyTestCase, self).setUp()
+        self.flags(iptables_incremental_apply=True, use_ipv6=False)
+        self.calls = []
+        self.fail_noflush = False
+        self.manager = linux_net.IptablesManager(execute=self._fake_execute)
+
+    def _fake_execute(self, *cmd, **kwargs):
+        self.calls.append((cmd, kwargs.get('process_input')))
+        if self.fail_noflush and '--noflush' in cmd:
+            raise exception.ProcessExecutionError()
+        if cmd[0] == 'iptables-save':
+            return '\n'.join(IptablesManagerTestCase.sample_filter +
+                             IptablesManagerTestCase.sample_nat), ''
+        return '', ''
+
+    def test_first_apply_is_full(self):
+        self.manager.apply()
+        self.assertEqual([c[0] for c in self.calls],
+                         [('iptables-save', '-c'),
+                          ('iptables-restore', '-c')])
+        self.assertEqual(self.manager.apply_stats['full'], 1)
+
+    def test_wrapped_change_only_touches_changed_chain(self):
+        self.manager.apply()
+        self.calls = []
+
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-s 1.2.3.4 -j DROP')
+        self.manager.apply()
+
+        self.assertEqual(len(self.calls), 1)
+        cmd, process_input = self.calls[0]
+        self.assertEqual(cmd, ('iptables-restore', '-c', '--noflush'))
+        lines = process_input.split('\n')
+        self.assertEqual(lines[:2],
+                         ['*filter', ':%s-FORWARD - [0:0]' % self.binary_name])
+        self.assertTrue('[0:0] -A %s-FORWARD -s 1.2.3.4 -j DROP' %
+                        self.binary_name in lines)
+        self.assertFalse('*nat' in lines)
+        self.assertFalse(':%s-INPUT - [0:0]' % self.binary_name in lines)
+        self.assertEqual(self.manager.apply_stats['incremental'], 1)
+
+    def test_no_change_runs_nothing(self):
+        self.manager.apply()
+        self.calls = []
+        self.manager.apply()
+        self.assertEqual(self.calls, [])
+
+    def test_removed_wrapped_chain_is_deleted(self):
+        table = self.manager.ipv4['filter']
+        table.add_chain('foo')
+        table.add_rule('foo', '-j DROP')
+        self.manager.apply()
+        self.calls = []
+
+        table.remove_chain('foo')
+        self.manager.apply()
+
+        cmd, process_input = self.calls[0]
+        self.assertEqual(cmd, ('iptables-restore', '-c', '--noflush'))
+        self.assertTrue('-X %s-foo' % self.binary_name in
+                        process_input.split('\n'))
+
+    def test_unwrapped_change_is_full_apply(self):
+        self.manager.apply()
+        self.calls = []
+
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-j ACCEPT',
+                                             wrap=False)
+        self.manager.apply()
+        self.assertEqual([c[0] for c in self.calls],
+                         [('iptables-save', '-c'),
+                          ('iptables-restore', '-c')])
+
+    def test_failed_incremental_apply_falls_back_to_full(self):
+        self.manager.apply()
+        self.calls = []
+        self.fail_noflush = True
+
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-s 1.2.3.4 -j DROP')
+        self.manager.apply()
+        self.assertEqual([c[0] for c in self.calls],
+                         [('iptables-restore', '-c', '--noflush'),
+                          ('iptables-save', '-c'),
+                          ('iptables-restore', '-c')])
+
+    def test_coalesced_apply_runs_once(self):
+        self.flags(iptables_apply_coalesce_interval=0.01)
+        self.stubs.Set(self.manager, '_apply',
+                       lambda: self.calls.append('apply'))
+        threads = [eventlet.spawn(self.manager.apply) for i in range(5)]
+        for thread in threads:
+            thread.wait()
+        self.assertEqual(self.calls, ['apply'])
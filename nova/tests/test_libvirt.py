@@ -60,6 +60,8 @@ from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import driver as libvirt_driver
 from nova.virt.libvirt import firewall
 from nova.virt.libvirt import imagebackend
+from nova.virt.libvirt import imagecache
+from nova.virt.libvirt import imagepeers
 from nova.virt.libvirt import utils as libvirt_utils
 
 
@@ -2529,6 +2531,27 @@ class LibvirtConnTestCase(test.TestCase):
                    None)
         self.assertTrue(self.create_image_called)
 
+    def test_fetch_base_image_from_peers(self):
+        self.flags(libvirt_image_peers=True,
+                   libvirt_image_peers_secret='secret')
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        self.mox.StubOutWithMock(imagepeers, 'fetch_image')
+        self.mox.StubOutWithMock(fake_libvirt_utils, 'fetch_image')
+        self.mox.StubOutWithMock(imagecache, 'write_stored_checksum')
+        imagepeers.fetch_image(self.context, conn.virtapi, 'target',
+                               'image1').AndReturn(True)
+        imagepeers.fetch_image(self.context, conn.virtapi, 'target',
+                               'image2').AndReturn(False)
+        fake_libvirt_utils.fetch_image(self.context, 'target', 'image2',
+                                       'fake', 'fake')
+        imagecache.write_stored_checksum('target')
+        self.mox.ReplayAll()
+
+        conn._fetch_base_image(self.context, 'target', 'image1',
+                               'fake', 'fake')
+        conn._fetch_base_image(self.context, 'target', 'image2',
+                               'fake', 'fake')
+
     def test_get_console_output_file(self):
         fake_libvirt_utils.files['console.log'] = '01234567890'
 
@@ -3631,6 +3654,74 @@ class IptablesFirewallTestCase(test.TestCase):
                         "TCP port 80/81 acceptance rule wasn't added")
         db.instance_destroy(admin_ctxt, instance_ref['uuid'])
 
+    def test_source_group_rules_use_ipset(self):
+        self.flags(iptables_use_ipset=True)
+        instance_ref = self._create_instance_ref()
+        src_instance_ref = self._create_instance_ref()
+
+        admin_ctxt = context.get_admin_context()
+        secgroup = db.security_group_create(admin_ctxt,
+                                            {'user_id': 'fake',
+                                             'project_id': 'fake',
+                                             'name': 'testgroup',
+                                             'description': 'test group'})
+        src_secgroup = db.security_group_create(admin_ctxt,
+                                                {'user_id': 'fake',
+                                                 'project_id': 'fake',
+                                                 'name': 'testsourcegroup',
+                                                 'description': 'src group'})
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id': secgroup['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 22,
+                                       'to_port': 22,
+                                       'group_id': src_secgroup['id']})
+        db.instance_add_security_group(admin_ctxt, instance_ref['uuid'],
+                                       secgroup['id'])
+        db.instance_add_security_group(admin_ctxt, src_instance_ref['uuid'],
+                                       src_secgroup['id'])
+        instance_ref = db.instance_get(admin_ctxt, instance_ref['id'])
+
+        network_model = _fake_network_info(self.stubs, 1, spectacular=True)
+        _fake_stub_out_get_nw_info(self.stubs, lambda *a, **kw: network_model)
+        network_info = network_model.legacy()
+
+        ipset_cmds = []
+
+        def fake_ipset_execute(*cmd, **kwargs):
+            ipset_cmds.append((cmd, kwargs.get('process_input')))
+            return '', ''
+
+        self.fw.ipset.execute = fake_ipset_execute
+        self.stubs.Set(self.fw.iptables, 'apply', lambda: None)
+        self.fw.prepare_instance_filter(instance_ref, network_info)
+
+        set_name = 'nova-sg%s-v4' % src_secgroup['id']
+        ips = set(ip['address'] for ip in network_model.fixed_ips()
+                  if ip['version'] == 4)
+        self.assertEqual(self.fw.ipset.sets[set_name], ips)
+
+        chain_name = 'inst-%s' % instance_ref['id']
+        rules = [rule.rule for rule in self.fw.iptables.ipv4['filter'].rules
+                 if rule.chain == chain_name]
+        self.assertTrue('-j ACCEPT -p tcp --dport 22 -m set --match-set %s '
+                        'src' % set_name in rules)
+        for ip in ips:
+            self.assertFalse([rule for rule in rules if ip in rule])
+
+        # A membership refresh only touches the ipset
+        self.stubs.Set(self.fw.iptables, 'apply', self.fail)
+        ipset_cmds[:] = []
+        self.fw.refresh_security_group_members(src_secgroup['id'])
+        self.assertEqual(ipset_cmds, [])
+
+        self.stubs.Set(self.fw.iptables, 'apply', lambda: None)
+        self.stubs.Set(self.fw.nwfilter, 'unfilter_instance',
+                       lambda *args: None)
+        self.fw.unfilter_instance(instance_ref, network_info)
+        self.assertEqual(self.fw.ipset.sets, {})
+        self.assertEqual(ipset_cmds[-1][0], ('ipset', 'destroy', set_name))
+
     def test_filters_for_instance_with_ip_v6(self):
         self.flags(use_ipv6=True)
         network_info = _fake_network_info(self.stubs, 1)
@@ -0,0 +1,205 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import httplib
+import os
+
+import fixtures
+import webob
+
+from nova.compute import image_digest
+from nova import context
+from nova.image import glance
+from nova import test
+from nova.virt.libvirt import imagecache
+from nova.virt.libvirt import imagepeers
+
+IMAGE_ID = 'fake-image'
+IMAGE_DATA = 'fake image data' * 1000
+FINGERPRINT = image_digest.image_fingerprint(IMAGE_ID)
+
+
+class FakeHTTPResponse(object):
+    def __init__(self, res):
+        self.status = res.status_int
+        self.reason = res.status.split(' ', 1)[1]
+        self._headers = res.headers
+        self._body = res.body
+        self._offset = 0
+
+    def read(self, amt):
+        chunk = self._body[self._offset:self._offset + amt]
+        self._offset += len(chunk)
+        return chunk
+
+    def getheader(self, name):
+        return self._headers.get(name)
+
+
+class FakeHTTPConnection(object):
+    """Sends the requests to an ImagePeerApp."""
+
+    hosts = []
+
+    def __init__(self, host, port, timeout=None):
+        self.hosts.append(host)
+
+    def request(self, method, path, headers=None):
+        req = webob.Request.blank(path, method=method, headers=headers)
+        self._res = req.get_response(imagepeers.ImagePeerApp())
+
+    def getresponse(self):
+        return FakeHTTPResponse(self._res)
+
+    def close(self):
+        pass
+
+
+class FakeVirtAPI(object):
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def compute_node_get_all(self, context):
+        return self.nodes
+
+
+def _node(host, fingerprints):
+    return {'service': {'host': host, 'disabled': False},
+            'stats': [{'key': image_digest.STAT_KEY,
+                       'value': image_digest.make_digest(fingerprints)}]}
+
+
+class ImagePeersTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ImagePeersTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.flags(instances_path=self.tmpdir,
+                   libvirt_image_peers=True,
+                   libvirt_image_peers_secret='secret',
+                   host='host1')
+        self.base_dir = os.path.join(self.tmpdir, '_base')
+        os.mkdir(self.base_dir)
+        self.target = os.path.join(self.tmpdir, 'target')
+
+        FakeHTTPConnection.hosts = []
+        self.stubs.Set(httplib, 'HTTPConnection', FakeHTTPConnection)
+
+    def _cache_image(self, data=IMAGE_DATA):
+        path = os.path.join(self.base_dir, FINGERPRINT)
+        with open(path, 'w') as f:
+            f.write(data)
+        imagecache.write_stored_checksum(path)
+
+    def _fetch(self, nodes, expected_md5=None):
+        self.stubs.Set(imagepeers, '_expected_md5',
+                       lambda context, image_id: expected_md5)
+        return imagepeers.fetch_image(self.context, FakeVirtAPI(nodes),
+                                      self.target, IMAGE_ID)
+
+    def _get(self, fingerprint=FINGERPRINT, token=None):
+        if token is None:
+            token = imagepeers.make_token(fingerprint)
+        req = webob.Request.blank('/images/%s' % fingerprint,
+                                  headers={imagepeers.TOKEN_HEADER: token})
+        return req.get_response(imagepeers.ImagePeerApp())
+
+    def test_serve_image(self):
+        self._cache_image()
+        res = self._get()
+        self.assertEqual(200, res.status_int)
+        self.assertEqual(IMAGE_DATA, res.body)
+        self.assertEqual(hashlib.sha1(IMAGE_DATA).hexdigest(),
+                         res.headers[imagepeers.CHECKSUM_HEADER])
+
+    def test_serve_wrong_token(self):
+        self._cache_image()
+        self.assertEqual(403, self._get(token='0' * 40).status_int)
+        self.assertEqual(403, self._get(token='').status_int)
+
+    def test_serve_missing_image(self):
+        self.assertEqual(404, self._get().status_int)
+        self.assertEqual(404, self._get(fingerprint='../../etc').status_int)
+
+    def test_serve_image_without_checksum(self):
+        with open(os.path.join(self.base_dir, FINGERPRINT), 'w') as f:
+            f.write(IMAGE_DATA)
+        self.assertEqual(404, self._get().status_int)
+
+    def test_fetch_image(self):
+        self._cache_image()
+        nodes = [_node('host1', [FINGERPRINT]),
+                 _node('host2', [FINGERPRINT]),
+                 _node('host3', [])]
+        self.assertTrue(self._fetch(nodes,
+                                    hashlib.md5(IMAGE_DATA).hexdigest()))
+        self.assertEqual(['host2'], FakeHTTPConnection.hosts)
+        with open(self.target) as f:
+            self.assertEqual(IMAGE_DATA, f.read())
+        self.assertEqual(hashlib.sha1(IMAGE_DATA).hexdigest(),
+                         imagecache.read_stored_checksum(self.target,
+                                                         timestamped=False))
+
+    def test_fetch_image_wrong_checksum(self):
+        self._cache_image()
+        nodes = [_node('host2', [FINGERPRINT]),
+                 _node('host3', [FINGERPRINT])]
+        self.assertFalse(self._fetch(nodes,
+                                     hashlib.md5('other data').hexdigest()))
+        self.assertEqual(2, len(FakeHTTPConnection.hosts))
+        self.assertFalse(os.path.exists(self.target))
+        self.assertFalse(os.path.exists(self.target + '.part'))
+
+    def test_fetch_image_without_glance_checksum(self):
+        self._cache_image()
+        nodes = [_node('host2', [FINGERPRINT])]
+        self.assertFalse(self._fetch(nodes))
+        self.assertEqual([], FakeHTTPConnection.hosts)
+        self.assertFalse(os.path.exists(self.target))
+
+    def test_fetch_image_without_peers(self):
+        nodes = [_node('host1', [FINGERPRINT]), _node('host2', [])]
+        self.assertFalse(self._fetch(nodes))
+        self.assertEqual([], FakeHTTPConnection.hosts)
+
+    def test_fetch_image_max_tries(self):
+        self.flags(libvirt_image_peers_max_tries=2)
+        nodes = [_node('host%d' % i, [FINGERPRINT]) for i in xrange(2, 6)]
+        self.assertFalse(self._fetch(nodes,
+                                     hashlib.md5('other data').hexdigest()))
+        self.assertEqual(2, len(FakeHTTPConnection.hosts))
+
+    def test_expected_md5(self):
+        image_meta = {'disk_format': 'qcow2', 'checksum': 'fake-checksum'}
+
+        class FakeImageService(object):
+            def show(self, context, image_id):
+                return image_meta
+
+        self.stubs.Set(glance, 'get_remote_image_service',
+                       lambda context, image_id: (FakeImageService(),
+                                                  image_id))
+        self.assertEqual(None, imagepeers._expected_md5(self.context,
+                                                        IMAGE_ID))
+        image_meta['disk_format'] = 'raw'
+        self.assertEqual('fake-checksum',
+                         imagepeers._expected_md5(self.context, IMAGE_ID))
+        del image_meta['checksum']
+        self.assertEqual(None, imagepeers._expected_md5(self.context,
+                                                        IMAGE_ID))
@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import errno
 import os
 
 from nova import test
@@ -40,3 +41,54 @@ blah BLAH: bb
         self.mox.ReplayAll()
         disk_type = libvirt_utils.get_disk_type(path)
         self.assertEqual(disk_type, 'raw')
+
+    def test_clone_image(self):
+        with utils.tempdir() as tmpdir:
+            src = os.path.join(tmpdir, 'base')
+            dest = os.path.join(tmpdir, 'disk')
+            with open(src, 'w') as f:
+                f.write('canary')
+            libvirt_utils.clone_image(src, dest)
+            with open(dest) as f:
+                self.assertEqual('canary', f.read())
+
+
+class CloneImageTestCase(test.TestCase):
+    def setUp(self):
+        super(CloneImageTestCase, self).setUp()
+        self.stubs.Set(libvirt_utils, '_reflink_support', {})
+        self.reflinks = []
+        self.copies = []
+        self.stubs.Set(libvirt_utils, 'copy_image',
+                       lambda src, dest: self.copies.append(dest))
+
+    def _clone_images(self, error=None):
+        def fake_reflink(src, dest):
+            self.reflinks.append(dest)
+            if error:
+                raise IOError(error, os.strerror(error))
+
+        self.stubs.Set(libvirt_utils, '_reflink', fake_reflink)
+        with utils.tempdir() as tmpdir:
+            src = os.path.join(tmpdir, 'base')
+            open(src, 'w').close()
+            for name in ['disk1', 'disk2']:
+                libvirt_utils.clone_image(src, os.path.join(tmpdir, name))
+        return [os.path.basename(path) for path in self.reflinks]
+
+    def test_reflink(self):
+        self.assertEqual(['disk1', 'disk2'], self._clone_images())
+        self.assertEqual([], self.copies)
+
+    def test_reflinks_not_supported(self):
+        self.assertEqual(['disk1'], self._clone_images(errno.EOPNOTSUPP))
+        self.assertEqual(2, len(self.copies))
+
+    def test_reflink_error(self):
+        self.assertRaises(IOError, self._clone_images, errno.ENOSPC)
+        self.assertEqual([], self.copies)
+
+    def test_reflinks_disabled(self):
+        self.flags(libvirt_use_reflinks=False)
+        self.assertEqual([], self._clone_images())
+        self.assertEqual(2, len(self.copies))
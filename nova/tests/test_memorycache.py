@@ -0,0 +1,89 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the in process memcache client."""
+
+from nova.common import memorycache
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class MemoryCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(MemoryCacheTestCase, self).setUp()
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.flags(memory_cache_size=3)
+        self.mc = memorycache.get_client()
+
+    def _stats(self):
+        return self.mc.get_stats()[0][1]
+
+    def test_get_set(self):
+        self.assertEqual(self.mc.get('foo'), None)
+        self.assertTrue(self.mc.set('foo', 'bar'))
+        self.assertEqual(self.mc.get('foo'), 'bar')
+        stats = self._stats()
+        self.assertEqual(stats['get_hits'], 1)
+        self.assertEqual(stats['get_misses'], 1)
+
+    def test_expiry(self):
+        self.mc.set('short', 1, time=10)
+        self.mc.set('long', 2, time=20)
+        self.mc.set('forever', 3)
+        timeutils.advance_time_seconds(9)
+        self.assertEqual(self.mc.get('short'), 1)
+        timeutils.advance_time_seconds(1)
+        self.assertEqual(self.mc.get('short'), None)
+        self.assertEqual(self.mc.get('long'), 2)
+        timeutils.advance_time_seconds(10)
+        self.assertEqual(self.mc.get('long'), None)
+        self.assertEqual(self.mc.get('forever'), 3)
+        self.assertEqual(self._stats()['expired'], 2)
+
+    def test_set_again_moves_expiry(self):
+        self.mc.set('foo', 1, time=10)
+        timeutils.advance_time_seconds(5)
+        self.mc.set('foo', 2, time=10)
+        timeutils.advance_time_seconds(5)
+        self.assertEqual(self.mc.get('foo'), 2)
+        timeutils.advance_time_seconds(5)
+        self.assertEqual(self.mc.get('foo'), None)
+
+    def test_least_recently_used_is_evicted(self):
+        for key in ('a', 'b', 'c'):
+            self.mc.set(key, key)
+        self.mc.get('a')
+        self.mc.set('d', 'd')
+        self.assertEqual(self.mc.get('b'), None)
+        for key in ('a', 'c', 'd'):
+            self.assertEqual(self.mc.get(key), key)
+        self.assertEqual(self._stats()['evictions'], 1)
+        self.assertEqual(self._stats()['curr_items'], 3)
+
+    def test_add_incr_delete(self):
+        self.assertTrue(self.mc.add('count', '1', time=10))
+        self.assertFalse(self.mc.add('count', '5'))
+        self.assertEqual(self.mc.incr('count'), 2)
+        self.assertEqual(self.mc.incr('missing'), None)
+        timeutils.advance_time_seconds(10)
+        self.assertEqual(self.mc.get('count'), None)
+
+        self.mc.set('foo', 'bar')
+        self.assertTrue(self.mc.delete('foo'))
+        self.assertFalse(self.mc.delete('foo'))
+        self.assertEqual(self.mc.get('foo'), None)
@@ -20,11 +20,13 @@
 
 import base64
 import copy
+import datetime
 import hashlib
 import hmac
 import json
 import re
 
+from eventlet import greenthread
 import webob
 
 from nova.api.metadata import base
@@ -541,6 +543,100 @@ class MetadataHandlerTestCase(test.TestCase):
         self.assertEqual(response.status_int, 500)
 
 
+class MetadataCacheTestCase(test.TestCase):
+    """Test that metadata documents are built once per instance version."""
+
+    def setUp(self):
+        super(MetadataCacheTestCase, self).setUp()
+        self.instance = dict(INSTANCES[0],
+                             created_at=datetime.datetime(2013, 1, 1),
+                             updated_at=None)
+        self.builds = []
+        self.instance_reads = []
+
+        def fake_instance_get_by_uuid(context, instance_uuid):
+            self.instance_reads.append(instance_uuid)
+            return self.instance
+
+        def fake_instance_get_updated_at(context, instance_uuid):
+            return self.instance['updated_at'] or self.instance['created_at']
+
+        test_case = self
+
+        class FakeInstanceMetadata(object):
+            def __init__(self, instance, address=None):
+                test_case.builds.append((instance['uuid'], address))
+                greenthread.sleep(0)
+                self.instance = instance
+
+        self.stubs.Set(db, 'instance_get_by_uuid', fake_instance_get_by_uuid)
+        self.stubs.Set(db, 'instance_get_updated_at',
+                       fake_instance_get_updated_at)
+        self.stubs.Set(base, 'InstanceMetadata', FakeInstanceMetadata)
+        self.app = handler.MetadataRequestHandler()
+
+    def test_document_is_cached(self):
+        first = self.app.get_metadata_by_instance_id(self.instance['uuid'],
+                                                     '10.0.0.2')
+        second = self.app.get_metadata_by_instance_id(self.instance['uuid'],
+                                                      '10.0.0.2')
+        self.assertTrue(first is second)
+        self.assertEqual(len(self.builds), 1)
+        self.assertEqual(len(self.instance_reads), 1)
+
+    def test_document_is_rebuilt_when_instance_changes(self):
+        first = self.app.get_metadata_by_instance_id(self.instance['uuid'],
+                                                     '10.0.0.2')
+        self.instance['updated_at'] = datetime.datetime(2013, 1, 2)
+        second = self.app.get_metadata_by_instance_id(self.instance['uuid'],
+                                                      '10.0.0.2')
+        self.assertFalse(first is second)
+        self.assertEqual(len(self.builds), 2)
+
+    def test_concurrent_requests_are_coalesced(self):
+        threads = [greenthread.spawn(self.app.get_metadata_by_instance_id,
+                                     self.instance['uuid'], '10.0.0.2')
+                   for i in xrange(5)]
+        results = [thread.wait() for thread in threads]
+        self.assertEqual(len(self.builds), 1)
+        for result in results:
+            self.assertTrue(result is results[0])
+
+    def test_remote_address_is_mapped_to_instance(self):
+        lookups = []
+
+        def fake_get_fixed_ip_by_address(self, context, address):
+            lookups.append(address)
+            return {'instance_uuid': INSTANCES[0]['uuid']}
+
+        self.stubs.Set(network_api.API, 'get_fixed_ip_by_address',
+                       fake_get_fixed_ip_by_address)
+        first = self.app.get_metadata_by_remote_address('10.0.0.2')
+        second = self.app.get_metadata_by_remote_address('10.0.0.2')
+        self.assertTrue(first is second)
+        self.assertEqual(lookups, ['10.0.0.2'])
+        self.assertEqual(self.builds, [(INSTANCES[0]['uuid'], '10.0.0.2')])
+
+    def test_missing_instance(self):
+        def fake_instance_get_updated_at(context, instance_uuid):
+            raise exception.InstanceNotFound(instance_id=instance_uuid)
+
+        self.stubs.Set(db, 'instance_get_updated_at',
+                       fake_instance_get_updated_at)
+        self.assertEqual(self.app.get_metadata_by_instance_id('a-b-c-d',
+                                                              '10.0.0.2'),
+                         None)
+
+    def test_instance_deleted_while_building(self):
+        def fake_instance_get_by_uuid(context, instance_uuid):
+            raise exception.InstanceNotFound(instance_id=instance_uuid)
+
+        self.stubs.Set(db, 'instance_get_by_uuid', fake_instance_get_by_uuid)
+        self.assertEqual(self.app.get_metadata_by_instance_id(
+                             self.instance['uuid'], '10.0.0.2'),
+                         None)
+
+
 class MetadataPasswordTestCase(test.TestCase):
     def setUp(self):
         super(MetadataPasswordTestCase, self).setUp()
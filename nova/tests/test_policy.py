@@ -58,6 +58,29 @@ class PolicyFileTestCase(test.TestCase):
             self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
                               self.context, action, self.target)
 
+    def test_policy_file_checks_are_throttled(self):
+        with utils.tempdir() as tmpdir:
+            tmpfilename = os.path.join(tmpdir, 'policy')
+            self.flags(policy_file=tmpfilename, policy_recheck_interval=60)
+            policy.reset()
+
+            now = [1000.0]
+            self.stubs.Set(policy.time, 'time', lambda: now[0])
+
+            action = "example:test"
+            with open(tmpfilename, "w") as policyfile:
+                policyfile.write('{"example:test": ""}')
+            policy.enforce(self.context, action, self.target)
+            with open(tmpfilename, "w") as policyfile:
+                policyfile.write('{"example:test": "!"}')
+            os.utime(tmpfilename, (0, 0))
+
+            now[0] += 59
+            policy.enforce(self.context, action, self.target)
+            now[0] += 1
+            self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                              self.context, action, self.target)
+
 
 class PolicyTestCase(test.TestCase):
     def setUp(self):
@@ -147,6 +170,83 @@ class PolicyTestCase(test.TestCase):
         policy.enforce(admin_context, uppercase_action, self.target)
 
 
+class CompiledPolicyTestCase(test.TestCase):
+    def setUp(self):
+        super(CompiledPolicyTestCase, self).setUp()
+        self.rules = {
+            "admin_or_owner": "is_admin:True or project_id:%(project_id)s",
+            "example:owner": "rule:admin_or_owner",
+            "example:not_owner": "not rule:admin_or_owner",
+            "example:member_owner": [["role:member",
+                                      "project_id:%(project_id)s"]],
+            "example:missing_rule": "rule:example:noexist",
+        }
+        self.policy.set_rules(self.rules)
+        self.context = context.RequestContext('fake', 'fake', roles=['Member'],
+                                              overwrite=False)
+
+        self.to_dict_calls = 0
+        to_dict = self.context.to_dict
+
+        def counting_to_dict():
+            self.to_dict_calls += 1
+            return to_dict()
+        self.context.to_dict = counting_to_dict
+
+    def test_compiled_rules_match_interpreted_rules(self):
+        rules = common_policy._rules
+        targets = [{'project_id': 'fake'}, {'project_id': 'other'}]
+        creds_list = [
+            {'roles': ['member'], 'is_admin': False, 'project_id': 'fake'},
+            {'roles': ['MEMBER'], 'is_admin': False, 'project_id': 'other'},
+            {'roles': [], 'is_admin': True, 'project_id': 'other'},
+        ]
+        for name in self.rules:
+            func, _deps = policy._compile_check(rules[name], rules)
+            for target in targets:
+                for creds in creds_list:
+                    self.assertEqual(func(target, creds),
+                                     rules[name](target, creds))
+
+    def test_results_are_memoized_per_context(self):
+        target = {'project_id': 'fake'}
+        policy.enforce(self.context, 'example:owner', target)
+        policy.enforce(self.context, 'example:owner', dict(target))
+        self.assertEqual(self.to_dict_calls, 1)
+
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:owner',
+                          {'project_id': 'other'})
+        self.assertEqual(self.to_dict_calls, 2)
+
+        other_context = context.RequestContext('fake', 'fake',
+                                               overwrite=False)
+        policy.enforce(other_context, 'example:owner', target)
+        self.assertEqual(self.to_dict_calls, 2)
+
+    def test_memoized_results_depend_on_credentials(self):
+        target = {'project_id': 'other'}
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:owner', target)
+        self.context.is_admin = True
+        policy.enforce(self.context, 'example:owner', target)
+
+    def test_memoized_results_are_dropped_with_rules(self):
+        target = {'project_id': 'fake'}
+        policy.enforce(self.context, 'example:owner', target)
+        self.policy.set_rules({'example:owner': '!'})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:owner', target)
+
+    def test_uncompiled_checks_are_not_memoized(self):
+        self.policy.set_rules({'example:get_http': 'http://www.example.com'})
+        self.stubs.Set(urllib2, 'urlopen',
+                       lambda url, post_data: StringIO.StringIO("True"))
+        policy.enforce(self.context, 'example:get_http', {})
+        policy.enforce(self.context, 'example:get_http', {})
+        self.assertEqual(self.to_dict_calls, 2)
+
+
 class DefaultPolicyTestCase(test.TestCase):
 
     def setUp(self):
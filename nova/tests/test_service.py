@@ -21,6 +21,7 @@ Unit Tests for remote procedure calls using queue
 """
 
 import mox
+import signal
 import sys
 
 from nova import context
@@ -171,6 +172,26 @@ class ServiceTestCase(test.TestCase):
                                'nova.tests.test_service.FakeManager')
         serv.start()
 
+    def test_service_ref_created_before_forking_workers(self):
+        launched = []
+
+        class FakeProcessLauncher(object):
+            def launch_server(self, server, workers=1):
+                launched.append((server, workers))
+
+        self._service_start_mocks()
+        self.mox.ReplayAll()
+        self.stubs.Set(service, 'ProcessLauncher', FakeProcessLauncher)
+        self.stubs.Set(service, '_launcher', None)
+
+        serv = service.Service(self.host,
+                               self.binary,
+                               self.topic,
+                               'nova.tests.test_service.FakeManager')
+        service.serve(serv, workers=2)
+        self.assertEqual(1, serv.service_id)
+        self.assertEqual([(serv, 2)], launched)
+
 
 class TestWSGIService(test.TestCase):
 
@@ -205,3 +226,28 @@ class TestLauncher(test.TestCase):
         launcher.launch_server(self.service)
         self.assertNotEquals(0, self.service.port)
         launcher.stop()
+
+
+class TestProcessLauncher(test.TestCase):
+
+    def setUp(self):
+        super(TestProcessLauncher, self).setUp()
+        for signo in (signal.SIGTERM, signal.SIGINT):
+            self.addCleanup(signal.signal, signo, signal.getsignal(signo))
+        self.launcher = service.ProcessLauncher()
+        self.addCleanup(service.os.close, self.launcher.writepipe)
+
+    def test_db_connections_are_closed_before_fork(self):
+        calls = []
+        pids = iter([1001, 1002])
+
+        def fake_fork():
+            calls.append('fork')
+            return pids.next()
+
+        self.stubs.Set(db, 'dispose_engine', lambda: calls.append('dispose'))
+        self.stubs.Set(service.os, 'fork', fake_fork)
+
+        self.launcher.launch_server('fake-server', workers=2)
+        self.assertEqual(calls, ['dispose', 'fork', 'dispose', 'fork'])
+        self.assertEqual(sorted(self.launcher.children), [1001, 1002])
@@ -21,7 +21,9 @@ import hashlib
 import importlib
 import os
 import os.path
+import shutil
 import StringIO
+import sys
 import tempfile
 
 import mox
@@ -30,6 +32,7 @@ import nova
 from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common import timeutils
+from nova import rootwrap_daemon
 from nova import test
 from nova import utils
 
@@ -154,6 +157,60 @@ grep foo
             os.unlink(tmpfilename2)
 
 
+class RootwrapDaemonTestCase(test.TestCase):
+
+    def setUp(self):
+        super(RootwrapDaemonTestCase, self).setUp()
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        filters_path = os.path.join(tmpdir, 'rootwrap.d')
+        os.mkdir(filters_path)
+        with open(os.path.join(filters_path, 'test.filters'), 'w') as f:
+            f.write('[Filters]\n'
+                    'cat: CommandFilter, cat, root\n'
+                    'false: CommandFilter, false, root\n')
+        config_file = os.path.join(tmpdir, 'rootwrap.conf')
+        with open(config_file, 'w') as f:
+            f.write('[DEFAULT]\n'
+                    'filters_path=%s\n'
+                    'exec_dirs=/bin,/usr/bin\n' % filters_path)
+
+        self.client = utils.RootwrapDaemonClient(config_file)
+        daemon = os.path.join(os.path.dirname(nova.__file__), os.pardir,
+                              'bin', 'nova-rootwrap-daemon')
+        self.stubs.Set(self.client, '_daemon_command',
+                       lambda: [sys.executable, daemon, config_file])
+        self.addCleanup(self.client.stop)
+
+    def test_execute(self):
+        data = 'foo\xff\x00bar'
+        self.assertEqual(self.client.execute(['cat'], data), (0, data, ''))
+        self.assertEqual(self.client.execute(['false'])[0], 1)
+
+    def test_unauthorized_command(self):
+        returncode, stdout, stderr = self.client.execute(['rm', '-rf', '/'])
+        self.assertEqual(returncode, rootwrap_daemon.RC_UNAUTHORIZED)
+        self.assertTrue('Unauthorized command' in stdout)
+
+    def test_daemon_is_restarted(self):
+        self.client.execute(['false'])
+        socket_path = self.client.socket_path
+        self.client.process.stdin.close()
+        self.client.process.wait()
+        self.assertFalse(os.path.exists(socket_path))
+        self.assertEqual(self.client.execute(['cat'], 'foo'), (0, 'foo', ''))
+
+    def test_execute_run_as_root_uses_daemon(self):
+        self.flags(use_rootwrap_daemon=True)
+        self.stubs.Set(os, 'geteuid', lambda: 1000)
+        self.stubs.Set(utils, '_get_rootwrap_daemon_client',
+                       lambda: self.client)
+        self.assertEqual(utils.execute('cat', process_input='foo',
+                                       run_as_root=True), ('foo', ''))
+        self.assertRaises(exception.ProcessExecutionError,
+                          utils.execute, 'false', run_as_root=True)
+
+
 class GetFromPathTestCase(test.TestCase):
     def test_tolerates_nones(self):
         f = utils.get_from_path
@@ -964,3 +1021,50 @@ class GetCallArgsTestCase(test.TestCase):
         self.assertEqual(3, callargs['red'])
         self.assertTrue('blue' in callargs)
         self.assertEqual(None, callargs['blue'])
+
+
+class LRUDictTestCase(test.TestCase):
+    def setUp(self):
+        super(LRUDictTestCase, self).setUp()
+        self.lru = utils.LRUDict()
+        for key in ['a', 'b', 'c']:
+            self.lru[key] = key.upper()
+
+    def _keys(self):
+        return [key for key, value in self.lru.iteritems()]
+
+    def test_set_and_get(self):
+        self.assertEqual(3, len(self.lru))
+        self.assertEqual('B', self.lru.get('b'))
+        self.assertEqual(['a', 'c', 'b'], self._keys())
+        self.lru['a'] = 'new'
+        self.assertEqual(['c', 'b', 'a'], self._keys())
+        self.assertEqual('new', self.lru['a'])
+        self.assertEqual(None, self.lru.get('d'))
+
+    def test_peek(self):
+        self.assertEqual('A', self.lru.peek('a'))
+        self.assertEqual(['a', 'b', 'c'], self._keys())
+        self.assertEqual('x', self.lru.peek('d', 'x'))
+
+    def test_popitem(self):
+        self.lru.get('a')
+        self.assertEqual(('b', 'B'), self.lru.popitem())
+        self.assertEqual(('c', 'C'), self.lru.popitem())
+        self.assertEqual(('a', 'A'), self.lru.popitem())
+        self.assertRaises(KeyError, self.lru.popitem)
+
+    def test_pop_and_del(self):
+        self.assertEqual('B', self.lru.pop('b'))
+        self.assertEqual(None, self.lru.pop('b'))
+        del self.lru['a']
+        self.assertFalse('a' in self.lru)
+        self.assertEqual(['c'], self._keys())
+        self.assertRaises(KeyError, self.lru.__delitem__, 'a')
+
+    def test_clear(self):
+        self.lru.clear()
+        self.assertEqual(0, len(self.lru))
+        self.assertEqual([], self._keys())
+        self.lru['d'] = 'D'
+        self.assertEqual(['d'], self._keys())
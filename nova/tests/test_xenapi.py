@@ -23,6 +23,8 @@ import functools
 import os
 import re
 
+import fixtures
+
 from nova.compute import api as compute_api
 from nova.compute import instance_types
 from nova.compute import power_state
@@ -1476,6 +1478,62 @@ class CompareVersionTestCase(test.TestCase):
         self.assertTrue(vmops.cmp_version('1.2.3', '1.2.3.4') < 0)
 
 
+class SparseCopyTestCase(test.TestCase):
+    """Unit tests for _sparse_copy."""
+
+    def setUp(self):
+        super(SparseCopyTestCase, self).setUp()
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        self.src_path = os.path.join(tempdir, 'src')
+        self.dst_path = os.path.join(tempdir, 'dst')
+
+    def _copy(self, data, **kwargs):
+        with open(self.src_path, 'wb') as src:
+            src.write(data)
+        open(self.dst_path, 'wb').close()
+        vm_utils._sparse_copy(self.src_path, self.dst_path, len(data),
+                              **kwargs)
+        with open(self.dst_path, 'rb') as dst:
+            return dst.read()
+
+    def test_copies_data(self):
+        data = ('a' * 5000 + '\0' * 20000 + 'b' * 3 + '\0' * 8192 +
+                'c' * 100 + '\0' * 4096)
+        self.assertEqual(data, self._copy(data))
+        self.assertEqual(data, self._copy(data, chunk_size=8192))
+
+    def test_copies_zeros(self):
+        data = '\0' * (3 * 8192 + 10)
+        self.assertEqual(data, self._copy(data, chunk_size=8192))
+
+    def test_skips_zero_blocks(self):
+        writes = []
+        real_write_non_empty_blocks = vm_utils._write_non_empty_blocks
+
+        def fake_write_non_empty_blocks(dst, buf, length, offset,
+                                        empty_block):
+            written = real_write_non_empty_blocks(dst, buf, length, offset,
+                                                  empty_block)
+            writes.append((offset, written))
+            return written
+
+        self.stubs.Set(vm_utils, '_write_non_empty_blocks',
+                       fake_write_non_empty_blocks)
+        data = '\0' * 8192 + 'a' * 10 + '\0' * 8182 + '\0' * 4096 + 'b'
+        self.assertEqual(data, self._copy(data, chunk_size=8192))
+        # The first chunk only holds zeros, only one block of the second
+        # chunk holds data.
+        self.assertEqual([(8192, 4096), (16384, 1)], writes)
+
+    def test_find_empty_block(self):
+        empty_block = bytearray(4)
+        buf = bytearray('a\0\0\0\0\0\0b\0\0\0\0')
+        self.assertEqual(8, vm_utils._find_empty_block(buf, empty_block,
+                                                       0, len(buf)))
+        self.assertEqual(-1, vm_utils._find_empty_block(buf, empty_block,
+                                                        0, 11))
+
+
 class XenAPIHostTestCase(stubs.XenAPITestBase):
     """Tests HostState, which holds metrics from XenServer that get
     reported back to the Schedulers."""
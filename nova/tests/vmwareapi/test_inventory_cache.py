@@ -0,0 +1,165 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+from eventlet import greenthread
+
+from nova import exception
+from nova import test
+from nova.tests.vmwareapi import stubs
+from nova.virt.vmwareapi import driver
+from nova.virt.vmwareapi import error_util
+from nova.virt.vmwareapi import fake
+from nova.virt.vmwareapi import vim_util
+from nova.virt.vmwareapi import vm_util
+
+
+class InventoryCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(InventoryCacheTestCase, self).setUp()
+        fake.reset()
+        stubs.set_stubs(self.stubs)
+        self.session = driver.VMwareAPISession('test_url', 'test_username',
+                                               'test_pass', 1)
+        self.cache = self.session.inventory_cache
+
+    def tearDown(self):
+        super(InventoryCacheTestCase, self).tearDown()
+        fake.cleanup()
+
+    def _create_vm(self, name):
+        datastore = fake._get_objects("Datastore")[0]
+        vm = fake.VirtualMachine(name=name, ds=datastore)
+        fake._create_object("VirtualMachine", vm)
+        return vm
+
+    def test_follows_changes(self):
+        self.assertTrue(self.cache.available())
+        vm = self._create_vm('vm')
+        self.assertEqual(vm.obj, vm_util.get_vm_ref_from_name(self.session,
+                                                              'vm'))
+        self.assertEqual('poweredOn', self.cache.get_properties(
+            'VirtualMachine', vm.obj)['runtime.powerState'])
+
+        vm.set('runtime.powerState', 'poweredOff')
+        self.assertEqual('poweredOff', self.cache.get_properties(
+            'VirtualMachine', vm.obj)['runtime.powerState'])
+
+        del fake._db_content['VirtualMachine'][vm.obj]
+        self.assertEqual(None, self.cache.get_properties('VirtualMachine',
+                                                         vm.obj))
+        self.assertEqual(None, vm_util.get_vm_ref_from_name(self.session,
+                                                            'vm'))
+
+    def test_properties_are_not_retrieved(self):
+        vm = self._create_vm('vm')
+        self.assertTrue(self.cache.available())
+
+        calls = []
+        real_call_method = self.session._call_method
+
+        def fake_call_method(module, method, *args, **kwargs):
+            calls.append(method)
+            return real_call_method(module, method, *args, **kwargs)
+
+        self.stubs.Set(self.session, '_call_method', fake_call_method)
+        self.assertEqual(vm.obj, vm_util.get_vm_ref_from_name(self.session,
+                                                              'vm'))
+        self.assertEqual(None, vm_util.get_vm_ref_from_name(self.session,
+                                                            'missing'))
+        self.assertNotEqual(None, self.cache.find_object('Datacenter',
+                                                         'ha-datacenter'))
+        self.assertEqual(['wait_for_updates'] * 3, calls)
+
+    def test_lost_updates(self):
+        vm = self._create_vm('vm')
+        self.assertTrue(self.cache.available())
+        self.cache._version = 'lost'
+        self.assertEqual(vm.obj, self.cache.find_object('VirtualMachine',
+                                                        'vm'))
+        # The filters of the previous version were replaced
+        self.assertEqual(4, len(fake._property_filters))
+
+    def test_new_session(self):
+        vm = self._create_vm('vm')
+        self.assertTrue(self.cache.available())
+        self.session._create_session()
+        vm.set('name', 'renamed')
+        self.assertEqual(vm.obj, self.cache.find_object('VirtualMachine',
+                                                        'renamed'))
+
+    def test_wait_for_task(self):
+        task = fake.create_task('CreateVM_Task')
+
+        def complete():
+            greenthread.sleep(0.05)
+            task.get('info').state = 'success'
+
+        greenthread.spawn(complete)
+        self.assertEqual('success', self.session._wait_for_task('uuid',
+                                                                task.obj))
+        # The filter on the task is gone
+        self.assertEqual(4, len(fake._property_filters))
+
+    def test_wait_for_task_error(self):
+        task = fake.create_task('CreateVM_Task', 'error')
+        task.get('info').error = fake.DataObject()
+        task.get('info').error.localizedMessage = 'failed'
+        self.assertRaises(exception.NovaException,
+                          self.session._wait_for_task, 'uuid', task.obj)
+
+    def test_wait_for_task_times_out(self):
+        task = fake.create_task('CreateVM_Task')
+        task_info = self.cache.wait_for_task(task.obj, 0.05)
+        self.assertEqual('running', task_info.state)
+
+    def test_reads_not_held_up_by_task_waits(self):
+        self.assertTrue(self.cache.available())
+        task = fake.create_task('CreateVM_Task')
+        waiter = greenthread.spawn(self.cache.wait_for_task, task.obj, 5)
+        greenthread.sleep(0.05)
+        self.assertNotEqual(None, self.cache._listener)
+
+        start = time.time()
+        vm = self._create_vm('vm')
+        greenthread.sleep(0.05)
+        self.assertEqual(vm.obj, self.cache.find_object('VirtualMachine',
+                                                        'vm'))
+        self.assertTrue(time.time() - start < 1)
+
+        task.get('info').state = 'success'
+        self.assertEqual('success', waiter.wait().state)
+
+    def test_not_available_without_wait_for_updates(self):
+        def fake_wait_for_updates(vim, version, max_wait_seconds):
+            raise error_util.VimAttributeError("No such SOAP method "
+                                               "'WaitForUpdatesEx'", None)
+
+        self.stubs.Set(vim_util, 'wait_for_updates', fake_wait_for_updates)
+        vm = self._create_vm('vm')
+        self.assertFalse(self.cache.available())
+        self.assertEqual(None, self.session._get_inventory_cache())
+        self.assertEqual(vm.obj, vm_util.get_vm_ref_from_name(self.session,
+                                                              'vm'))
+
+    def test_disabled(self):
+        self.flags(vmwareapi_use_inventory_cache=False)
+        session = driver.VMwareAPISession('test_url', 'test_username',
+                                          'test_pass', 1)
+        self.assertEqual(None, session.inventory_cache)
+        self.assertEqual(None, session._get_inventory_cache())
@@ -0,0 +1,144 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+from eventlet import greenthread
+
+from nova.tests.xenapi import stubs
+from nova.virt import fake as virt_fake
+from nova.virt.xenapi import driver as xenapi_conn
+from nova.virt.xenapi import fake
+from nova.virt.xenapi import vm_utils
+
+
+class RecordCacheTestCase(stubs.XenAPITestBase):
+    def setUp(self):
+        super(RecordCacheTestCase, self).setUp()
+        self.flags(xenapi_connection_url='test_url',
+                   xenapi_connection_password='test_pass')
+        stubs.stubout_session(self.stubs, fake.SessionBase)
+        self.session = xenapi_conn.XenAPISession('test_url', 'root',
+                                                 'test_pass',
+                                                 virt_fake.FakeVirtAPI())
+        self.cache = self.session.record_cache
+        self.sr_ref = fake.create_sr()
+
+    def test_follows_changes(self):
+        self.assertTrue(self.cache.available())
+        vdi_ref = fake.create_vdi('vdi', self.sr_ref)
+        self.assertEqual('vdi',
+                         self.cache.get_record('VDI', vdi_ref)['name_label'])
+
+        fake.get_record('VDI', vdi_ref)['name_label'] = 'renamed'
+        self.assertEqual('renamed',
+                         self.cache.get_record('VDI', vdi_ref)['name_label'])
+
+        fake.destroy_vdi(vdi_ref)
+        self.assertEqual(None, self.cache.get_record('VDI', vdi_ref))
+        self.assertFalse(vdi_ref in self.cache.get_all_records('VDI'))
+
+    def test_records_are_not_fetched(self):
+        vdi_ref = fake.create_vdi('vdi', self.sr_ref)
+        vm_ref = fake.create_vm('vm', 'Running')
+        self.assertTrue(self.cache.available())
+
+        calls = []
+        real_call_xenapi = self.session.call_xenapi
+
+        def fake_call_xenapi(method, *args):
+            calls.append(method)
+            return real_call_xenapi(method, *args)
+
+        self.stubs.Set(self.session, 'call_xenapi', fake_call_xenapi)
+        self.assertEqual([(vdi_ref, fake.get_record('VDI', vdi_ref))],
+                         list(vm_utils._get_all_vdis_in_sr(self.session,
+                                                           self.sr_ref)))
+        self.assertEqual(vm_ref, vm_utils.lookup(self.session, 'vm'))
+        self.assertEqual(None, vm_utils.lookup(self.session, 'missing'))
+        self.assertEqual(['event.from'] * 3, calls)
+
+    def test_wait_for_record(self):
+        vdi_ref = fake.create_vdi('vdi', self.sr_ref)
+
+        def rename():
+            greenthread.sleep(0.05)
+            fake.get_record('VDI', vdi_ref)['name_label'] = 'renamed'
+
+        greenthread.spawn(rename)
+        rec = self.cache.wait_for_record(
+            'VDI', vdi_ref, lambda rec: rec['name_label'] == 'renamed', 5)
+        self.assertEqual('renamed', rec['name_label'])
+
+    def test_wait_for_record_times_out(self):
+        vdi_ref = fake.create_vdi('vdi', self.sr_ref)
+        rec = self.cache.wait_for_record(
+            'VDI', vdi_ref, lambda rec: rec['name_label'] == 'renamed', 0.05)
+        self.assertEqual('vdi', rec['name_label'])
+
+    def test_reads_not_held_up_by_waits(self):
+        vdi_ref = fake.create_vdi('vdi', self.sr_ref)
+        self.assertTrue(self.cache.available())
+        waiter = greenthread.spawn(self.cache.wait_for_record, 'VDI',
+                                   vdi_ref, lambda rec: False, 0.5)
+        greenthread.sleep(0.05)
+        self.assertNotEqual(None, self.cache._listener)
+
+        start = time.time()
+        vm_ref = fake.create_vm('vm', 'Running')
+        self.assertTrue(vm_ref in self.cache.get_all_records('VM'))
+        self.assertTrue(time.time() - start < 0.1)
+        self.assertEqual('vdi', waiter.wait()['name_label'])
+
+    def test_not_available_without_event_from(self):
+        def fake_call_xenapi(method, *args):
+            raise fake.Failure(['MESSAGE_METHOD_UNKNOWN', method])
+
+        self.stubs.Set(self.session, 'call_xenapi', fake_call_xenapi)
+        self.assertFalse(self.cache.available())
+        self.assertEqual(None, vm_utils._get_record_cache(self.session))
+
+    def test_disabled(self):
+        self.flags(xenapi_use_record_cache=False)
+        session = xenapi_conn.XenAPISession('test_url', 'root', 'test_pass',
+                                            virt_fake.FakeVirtAPI())
+        self.assertEqual(None, session.record_cache)
+        self.assertEqual(None, vm_utils._get_record_cache(session))
+
+    def test_wait_for_vhd_coalesce(self):
+        self.flags(xenapi_vhd_coalesce_poll_interval=30,
+                   xenapi_vhd_coalesce_max_attempts=1)
+        base_ref = fake.create_vdi('base', self.sr_ref)
+        base_uuid = fake.get_record('VDI', base_ref)['uuid']
+        parent_ref = fake.create_vdi('parent', self.sr_ref,
+                                     sm_config={'vhd-parent': base_uuid})
+        parent_uuid = fake.get_record('VDI', parent_ref)['uuid']
+        tmp_ref = fake.create_vdi('tmp', self.sr_ref,
+                                  sm_config={'vhd-parent': parent_uuid})
+        vdi_ref = fake.create_vdi('vdi', self.sr_ref, sm_config={
+            'vhd-parent': fake.get_record('VDI', tmp_ref)['uuid']})
+
+        def coalesce():
+            greenthread.sleep(0.05)
+            fake.get_record('VDI', vdi_ref)['sm_config'] = {
+                'vhd-parent': parent_uuid}
+
+        greenthread.spawn(coalesce)
+        self.assertEqual((parent_uuid, base_uuid),
+                         vm_utils._wait_for_vhd_coalesce(
+                             self.session, None, self.sr_ref, vdi_ref,
+                             parent_uuid))
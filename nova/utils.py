@@ -41,6 +41,7 @@ from xml.sax import saxutils
 from eventlet import event
 from eventlet.green import subprocess
 from eventlet import greenthread
+from eventlet import semaphore
 import netaddr
 
 from nova import exception
@@ -50,6 +51,7 @@ from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 from nova.openstack.common.rpc import common as rpc_common
 from nova.openstack.common import timeutils
+from nova import rootwrap_daemon
 
 notify_decorator = 'nova.openstack.common.notifier.api.notify_decorator'
 
@@ -79,6 +81,11 @@ utils_opts = [
                default="/etc/nova/rootwrap.conf",
                help='Path to the rootwrap configuration file to use for '
                     'running commands as root'),
+    cfg.BoolOpt('use_rootwrap_daemon',
+                default=False,
+                help='Run commands as root through a long-lived '
+                     'nova-rootwrap-daemon instead of starting '
+                     'nova-rootwrap for each command'),
     cfg.StrOpt('tempdir',
                default=None,
                help='Explicitly specify the temporary working directory'),
@@ -154,6 +161,90 @@ def _subprocess_setup():
     signal.signal(signal.SIGPIPE, signal.SIG_DFL)
 
 
+class RootwrapDaemonClient(object):
+    """Runs commands through a nova-rootwrap-daemon started on demand."""
+
+    def __init__(self, config_file):
+        self.config_file = config_file
+        self.process = None
+        self.socket_path = None
+        self._start_sem = semaphore.Semaphore()
+
+    def _daemon_command(self):
+        return ['sudo', 'nova-rootwrap-daemon', self.config_file]
+
+    def _ensure_started(self, restart=False):
+        with self._start_sem:
+            if (not restart and self.process is not None and
+                    self.process.poll() is None):
+                return self.socket_path
+            self.stop()
+            LOG.debug(_('Starting rootwrap daemon: %s'),
+                      ' '.join(self._daemon_command()))
+            self.process = subprocess.Popen(self._daemon_command(),
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            close_fds=True,
+                                            preexec_fn=_subprocess_setup)
+            self.socket_path = self.process.stdout.readline().strip()
+            if not self.socket_path:
+                self.process.wait()
+                self.process = None
+                raise exception.NovaException(
+                        _('Could not start nova-rootwrap-daemon'))
+            return self.socket_path
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            # NOTE: the daemon exits once its stdin is closed.
+            self.process.stdin.close()
+            self.process.wait()
+        self.process = None
+        self.socket_path = None
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self._ensure_started())
+        except socket.error:
+            # Nothing was sent yet, so the command can safely be retried
+            # with a new daemon.
+            sock.close()
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self._ensure_started(restart=True))
+        return sock
+
+    def execute(self, cmd, process_input=None):
+        """Run cmd as root, returns (returncode, stdout, stderr)."""
+        sock = self._connect()
+        try:
+            sock.sendall(rootwrap_daemon.encode({'cmd': cmd,
+                                                 'stdin': process_input}))
+            sock.shutdown(socket.SHUT_WR)
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        finally:
+            sock.close()
+        reply = rootwrap_daemon.decode(''.join(chunks))
+        return reply['returncode'], reply['stdout'], reply['stderr']
+
+
+_ROOTWRAP_DAEMON_CLIENT = None
+
+
+def _get_rootwrap_daemon_client():
+    global _ROOTWRAP_DAEMON_CLIENT
+    if _ROOTWRAP_DAEMON_CLIENT is None:
+        _ROOTWRAP_DAEMON_CLIENT = RootwrapDaemonClient(CONF.rootwrap_config)
+    return _ROOTWRAP_DAEMON_CLIENT
+
+
 def execute(*cmd, **kwargs):
     """Helper method to execute command with optional retry.
 
@@ -196,38 +287,55 @@ def execute(*cmd, **kwargs):
         raise exception.NovaException(_('Got unknown keyword args '
                                         'to utils.execute: %r') % kwargs)
 
+    use_daemon = False
     if run_as_root and os.geteuid() != 0:
-        cmd = ['sudo', 'nova-rootwrap', CONF.rootwrap_config] + list(cmd)
+        if CONF.use_rootwrap_daemon and not shell:
+            use_daemon = True
+        else:
+            cmd = ['sudo', 'nova-rootwrap', CONF.rootwrap_config] + list(cmd)
 
     cmd = map(str, cmd)
 
     while attempts > 0:
         attempts -= 1
         try:
-            LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
-            _PIPE = subprocess.PIPE  # pylint: disable=E1101
-
-            if os.name == 'nt':
-                preexec_fn = None
-                close_fds = False
+            if use_daemon:
+                LOG.debug(_('Running cmd (rootwrap daemon): %s'),
+                          ' '.join(cmd))
+                try:
+                    _returncode, stdout, stderr = \
+                        _get_rootwrap_daemon_client().execute(cmd,
+                                                              process_input)
+                except (socket.error, ValueError) as exc:
+                    raise exception.ProcessExecutionError(
+                            cmd=' '.join(cmd),
+                            description=_('Rootwrap daemon failed: %s') % exc)
+                result = (stdout, stderr)
             else:
-                preexec_fn = _subprocess_setup
-                close_fds = True
-
-            obj = subprocess.Popen(cmd,
-                                   stdin=_PIPE,
-                                   stdout=_PIPE,
-                                   stderr=_PIPE,
-                                   close_fds=close_fds,
-                                   preexec_fn=preexec_fn,
-                                   shell=shell)
-            result = None
-            if process_input is not None:
-                result = obj.communicate(process_input)
-            else:
-                result = obj.communicate()
-            obj.stdin.close()  # pylint: disable=E1101
-            _returncode = obj.returncode  # pylint: disable=E1101
+                LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
+                _PIPE = subprocess.PIPE  # pylint: disable=E1101
+
+                if os.name == 'nt':
+                    preexec_fn = None
+                    close_fds = False
+                else:
+                    preexec_fn = _subprocess_setup
+                    close_fds = True
+
+                obj = subprocess.Popen(cmd,
+                                       stdin=_PIPE,
+                                       stdout=_PIPE,
+                                       stderr=_PIPE,
+                                       close_fds=close_fds,
+                                       preexec_fn=preexec_fn,
+                                       shell=shell)
+                result = None
+                if process_input is not None:
+                    result = obj.communicate(process_input)
+                else:
+                    result = obj.communicate()
+                obj.stdin.close()  # pylint: disable=E1101
+                _returncode = obj.returncode  # pylint: disable=E1101
             LOG.debug(_('Result was %s') % _returncode)
             if not ignore_exit_code and _returncode not in check_exit_code:
                 (stdout, stderr) = result
@@ -1216,6 +1324,97 @@ class UndoManager(object):
             self._rollback()
 
 
+class LRUDict(object):
+    """Dict keeping its keys in least recently used order.
+
+    Setting a key or reading it with get() makes it the most recently used
+    one, popitem() removes the least recently used one.  The keys are
+    linked in a circular list of [prev, next, key, value] nodes, since
+    collections.OrderedDict isn't available on python 2.6.
+    """
+
+    def __init__(self):
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+        self._nodes = {}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, key):
+        return key in self._nodes
+
+    def _unlink(self, node):
+        node[0][1] = node[1]
+        node[1][0] = node[0]
+
+    def _append(self, node):
+        last = self._root[0]
+        node[0] = last
+        node[1] = self._root
+        last[1] = node
+        self._root[0] = node
+
+    def __getitem__(self, key):
+        return self._nodes[key][3]
+
+    def __setitem__(self, key, value):
+        node = self._nodes.get(key)
+        if node is None:
+            node = [None, None, key, value]
+            self._nodes[key] = node
+        else:
+            self._unlink(node)
+            node[3] = value
+        self._append(node)
+
+    def __delitem__(self, key):
+        self._unlink(self._nodes.pop(key))
+
+    def get(self, key, default=None):
+        """Return the value of a key, making it the most recently used."""
+        node = self._nodes.get(key)
+        if node is None:
+            return default
+        self._unlink(node)
+        self._append(node)
+        return node[3]
+
+    def peek(self, key, default=None):
+        """Return the value of a key without changing the order."""
+        node = self._nodes.get(key)
+        if node is None:
+            return default
+        return node[3]
+
+    def pop(self, key, default=None):
+        node = self._nodes.pop(key, None)
+        if node is None:
+            return default
+        self._unlink(node)
+        return node[3]
+
+    def popitem(self):
+        """Remove and return the least recently used (key, value)."""
+        if not self._nodes:
+            raise KeyError('popitem(): dictionary is empty')
+        node = self._root[1]
+        self._unlink(node)
+        del self._nodes[node[2]]
+        return node[2], node[3]
+
+    def iteritems(self):
+        """Iterate over the (key, value) pairs, least recently used first."""
+        node = self._root[1]
+        while node is not self._root:
+            yield node[2], node[3]
+            node = node[1]
+
+    def clear(self):
+        self._nodes.clear()
+        self._root[:] = [self._root, self._root, None, None]
+
+
 def mkfs(fs, path, label=None):
     """Format a file or block device
 
@@ -787,6 +787,16 @@ class ComputeDriver(object):
         """
         pass
 
+    def get_cached_image_fingerprints(self):
+        """Return the fingerprints of the ids of the images in the driver's
+        local image cache, see nova.compute.image_digest.
+
+        These are reported to the scheduler, so that it can prefer the
+        hosts that already have the image of an instance.  Drivers that
+        don't cache images return None.
+        """
+        return None
+
     def add_to_aggregate(self, context, aggregate, host, **kwargs):
         """Add a compute host to an aggregate."""
         #NOTE(jogo) Currently only used for XenAPI-Pool
@@ -456,3 +456,6 @@ class FakeVirtAPI(virtapi.VirtAPI):
     def agent_build_get_by_triple(self, context, hypervisor, os, architecture):
         return db.agent_build_get_by_triple(context,
                                             hypervisor, os, architecture)
+
+    def compute_node_get_all(self, context):
+        return db.compute_node_get_all(context)
@@ -37,6 +37,11 @@ firewall_opts = [
     cfg.BoolOpt('allow_same_net_traffic',
                 default=True,
                 help='Whether to allow network traffic from same network'),
+    cfg.BoolOpt('iptables_use_ipset',
+                default=False,
+                help='Match traffic from the members of a source security '
+                     'group with a single rule against an ipset of their '
+                     'addresses, instead of one rule per member'),
 ]
 
 CONF = cfg.CONF
@@ -147,6 +152,10 @@ class IptablesFirewallDriver(FirewallDriver):
         self.instances = {}
         self.network_infos = {}
         self.basically_filtered = False
+        self.ipset = linux_net.IpsetManager()
+        # (security group id, ip version) pairs of the ipsets referenced
+        # by each instance's rules, keyed by instance id
+        self.instance_ipsets = {}
 
         self.iptables.ipv4['filter'].add_chain('sg-fallback')
         self.iptables.ipv4['filter'].add_rule('sg-fallback', '-j DROP')
@@ -175,6 +184,8 @@ class IptablesFirewallDriver(FirewallDriver):
             self.network_infos.pop(instance['id'])
             self.remove_filters_for_instance(instance)
             self.iptables.apply()
+            if self.instance_ipsets.pop(instance['id'], None):
+                self._purge_unused_ipsets()
         else:
             LOG.info(_('Attempted to unfilter instance which is not '
                      'filtered'), instance=instance)
@@ -248,6 +259,40 @@ class IptablesFirewallDriver(FirewallDriver):
     def _instance_chain_name(self, instance):
         return 'inst-%s' % (instance['id'],)
 
+    @staticmethod
+    def _security_group_set_name(security_group_id, version):
+        return 'nova-sg%s-v%s' % (security_group_id, version)
+
+    def _security_group_member_ips(self, ctxt, security_group, version):
+        # FIXME(jkoelker) This needs to be ported up into
+        #                 the compute manager which already
+        #                 has access to a nw_api handle,
+        #                 and should be the only one making
+        #                 making rpc calls.
+        nw_api = network.API()
+        ips = []
+        for instance in security_group['instances']:
+            nw_info = nw_api.get_instance_nw_info(ctxt, instance)
+            ips += [ip['address'] for ip in nw_info.fixed_ips()
+                    if ip['version'] == version]
+        LOG.debug('ips: %r', ips)
+        return ips
+
+    def _update_security_group_ipset(self, ctxt, security_group, version):
+        """Sync the ipset of a security group's member addresses."""
+        name = self._security_group_set_name(security_group['id'], version)
+        ips = self._security_group_member_ips(ctxt, security_group, version)
+        self.ipset.set_members(name, ips, version)
+        return name
+
+    def _purge_unused_ipsets(self):
+        in_use = set()
+        for ipsets in self.instance_ipsets.values():
+            in_use.update(self._security_group_set_name(*key)
+                          for key in ipsets)
+        for name in set(self.ipset.sets) - in_use:
+            self.ipset.destroy_set(name)
+
     def _do_basic_rules(self, ipv4_rules, ipv6_rules, network_info):
         # Always drop invalid packets
         ipv4_rules += ['-m state --state ' 'INVALID -j DROP']
@@ -350,6 +395,7 @@ class IptablesFirewallDriver(FirewallDriver):
 
         security_groups = self._virtapi.security_group_get_by_instance(
             ctxt, instance)
+        ipsets = set()
 
         # then, security group chains and rules
         for security_group in security_groups:
@@ -391,37 +437,40 @@ class IptablesFirewallDriver(FirewallDriver):
                     args += ['-s', rule['cidr']]
                     fw_rules += [' '.join(args)]
                 else:
-                    if rule['grantee_group']:
-                        # FIXME(jkoelker) This needs to be ported up into
-                        #                 the compute manager which already
-                        #                 has access to a nw_api handle,
-                        #                 and should be the only one making
-                        #                 making rpc calls.
-                        nw_api = network.API()
-                        for instance in rule['grantee_group']['instances']:
-                            nw_info = nw_api.get_instance_nw_info(ctxt,
-                                                                  instance)
-
-                            ips = [ip['address']
-                                for ip in nw_info.fixed_ips()
-                                    if ip['version'] == version]
-
-                            LOG.debug('ips: %r', ips, instance=instance)
-                            for ip in ips:
-                                subrule = args + ['-s %s' % ip]
-                                fw_rules += [' '.join(subrule)]
+                    grantee_group = rule['grantee_group']
+                    if grantee_group and CONF.iptables_use_ipset:
+                        set_name = self._update_security_group_ipset(
+                            ctxt, grantee_group, version)
+                        ipsets.add((grantee_group['id'], version))
+                        subrule = args + ['-m set --match-set %s src' %
+                                          set_name]
+                        fw_rules += [' '.join(subrule)]
+                    elif grantee_group:
+                        ips = self._security_group_member_ips(
+                            ctxt, grantee_group, version)
+                        for ip in ips:
+                            subrule = args + ['-s %s' % ip]
+                            fw_rules += [' '.join(subrule)]
 
                 LOG.debug('Using fw_rules: %r', fw_rules, instance=instance)
 
         ipv4_rules += ['-j $sg-fallback']
         ipv6_rules += ['-j $sg-fallback']
 
+        if CONF.iptables_use_ipset:
+            self.instance_ipsets[instance['id']] = ipsets
+
         return ipv4_rules, ipv6_rules
 
     def instance_filter_exists(self, instance, network_info):
         pass
 
     def refresh_security_group_members(self, security_group):
+        if CONF.iptables_use_ipset:
+            # Membership only changes the contents of the group's ipset,
+            # the iptables rules themselves stay the same.
+            self.do_refresh_security_group_members(security_group)
+            return
         self.do_refresh_security_group_rules(security_group)
         self.iptables.apply()
 
@@ -446,6 +495,35 @@ class IptablesFirewallDriver(FirewallDriver):
                                                          network_info)
             self._inner_do_refresh_rules(instance, ipv4_rules, ipv6_rules)
 
+    def do_refresh_security_group_members(self, security_group_id):
+        """Update the ipsets of a security group from its members."""
+        versions = set()
+        instance = None
+        for instance_id, ipsets in self.instance_ipsets.items():
+            for group_id, version in ipsets:
+                if group_id == security_group_id:
+                    versions.add(version)
+                    instance = self.instances.get(instance_id)
+        if not instance:
+            # None of our instances reference this group
+            return
+
+        # Look the group up through the rules of one of the instances
+        # referencing it, to get its current members.
+        ctxt = context.get_admin_context()
+        security_groups = self._virtapi.security_group_get_by_instance(
+            ctxt, instance)
+        for security_group in security_groups:
+            rules = self._virtapi.security_group_rule_get_by_security_group(
+                ctxt, security_group)
+            for rule in rules:
+                grantee_group = rule['grantee_group']
+                if grantee_group and grantee_group['id'] == security_group_id:
+                    for version in versions:
+                        self._update_security_group_ipset(ctxt, grantee_group,
+                                                          version)
+                    return
+
     def do_refresh_instance_rules(self, instance):
         network_info = self.network_infos[instance['id']]
         ipv4_rules, ipv6_rules = self.instance_rules(instance, network_info)
@@ -81,8 +81,10 @@ from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import firewall as libvirt_firewall
 from nova.virt.libvirt import imagebackend
 from nova.virt.libvirt import imagecache
+from nova.virt.libvirt import imagepeers
 from nova.virt.libvirt import utils as libvirt_utils
 from nova.virt import netutils
+from nova import wsgi
 
 libvirt = None
 
@@ -278,6 +280,7 @@ class LibvirtDriver(driver.ComputeDriver):
 
         self._host_state = None
         self._initiator = None
+        self._image_peer_server = None
         self._wrapped_conn = None
         self._caps = None
         self.read_only = read_only
@@ -352,6 +355,16 @@ class LibvirtDriver(driver.ComputeDriver):
                         '%(major)i.%(minor)i.%(micro)i or greater.') %
                         locals())
 
+        if CONF.libvirt_image_peers and not imagepeers.enabled():
+            LOG.warn(_('libvirt_image_peers_secret is not set, not '
+                       'distributing base images between hosts'))
+        if imagepeers.enabled() and self._image_peer_server is None:
+            self._image_peer_server = wsgi.Server(
+                    'image_peers', imagepeers.ImagePeerApp(),
+                    host=CONF.libvirt_image_peers_listen,
+                    port=CONF.libvirt_image_peers_port)
+            self._image_peer_server.start()
+
     def _get_connection(self):
         if not self._wrapped_conn or not self._test_connection():
             LOG.debug(_('Connecting to libvirt: %s'), self.uri)
@@ -1395,6 +1408,20 @@ class LibvirtDriver(driver.ComputeDriver):
         if os.path.exists(console_log):
             libvirt_utils.chown(console_log, os.getuid())
 
+    def _fetch_base_image(self, context, target, image_id, user_id,
+                          project_id):
+        """Fetch a base image from the other compute hosts if they have
+        it, or from Glance."""
+        if imagepeers.enabled():
+            if imagepeers.fetch_image(context, self.virtapi, target,
+                                      image_id):
+                return
+        libvirt_utils.fetch_image(context, target, image_id, user_id,
+                                  project_id)
+        if imagepeers.enabled():
+            # Base images are only served with their checksum
+            imagecache.write_stored_checksum(target)
+
     def _create_image(self, context, instance, libvirt_xml,
                       disk_mapping, suffix='',
                       disk_images=None, network_info=None,
@@ -1457,7 +1484,7 @@ class LibvirtDriver(driver.ComputeDriver):
             size = None
 
         if 'disk' in disk_mapping:
-            image('disk').cache(fetch_func=libvirt_utils.fetch_image,
+            image('disk').cache(fetch_func=self._fetch_base_image,
                                 context=context,
                                 filename=root_fname,
                                 size=size,
@@ -2882,7 +2909,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 image = self.image_backend.image(instance,
                                                  instance_disk,
                                                  CONF.libvirt_images_type)
-                image.cache(fetch_func=libvirt_utils.fetch_image,
+                image.cache(fetch_func=self._fetch_base_image,
                             context=ctxt,
                             filename=cache_name,
                             image_id=instance['image_ref'],
@@ -3048,6 +3075,10 @@ class LibvirtDriver(driver.ComputeDriver):
         """Manage the local cache of images."""
         self.image_cache_manager.verify_base_images(context, all_instances)
 
+    def get_cached_image_fingerprints(self):
+        """Return the fingerprints of the images cached in _base."""
+        return imagecache.list_cached_image_fingerprints()
+
     def _cleanup_remote_migration(self, dest, inst_base, inst_base_resize):
         """Used only for cleanup in case migrate_disk_and_power_off fails."""
         try:
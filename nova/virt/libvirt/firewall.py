@@ -249,6 +249,8 @@ class IptablesFirewallDriver(base_firewall.IptablesFirewallDriver):
             self.network_infos.pop(instance['id'])
             self.remove_filters_for_instance(instance)
             self.iptables.apply()
+            if self.instance_ipsets.pop(instance['id'], None):
+                self._purge_unused_ipsets()
             self.nwfilter.unfilter_instance(instance, network_info)
         else:
             LOG.info(_('Attempted to unfilter instance which is not '
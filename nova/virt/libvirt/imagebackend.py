@@ -150,7 +150,7 @@ class Raw(Image):
         @lockutils.synchronized(base, 'nova-', external=True,
                                 lock_path=self.lock_path)
         def copy_raw_image(base, target, size):
-            libvirt_utils.copy_image(base, target)
+            libvirt_utils.clone_image(base, target)
             if size:
                 disk.extend(target, size)
 
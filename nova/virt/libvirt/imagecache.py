@@ -210,6 +210,19 @@ def write_stored_checksum(target):
     write_stored_info(target, field='sha1', value=checksum)
 
 
+def list_cached_image_fingerprints():
+    """Return the fingerprints of the ids of the original images in _base,
+    which are their file names.
+    """
+    base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
+    if not os.path.exists(base_dir):
+        return []
+    digest_size = hashlib.sha1().digestsize * 2
+    return [ent for ent in os.listdir(base_dir)
+            if (len(ent) == digest_size and
+                os.path.isfile(os.path.join(base_dir, ent)))]
+
+
 class ImageCacheManager(object):
     def __init__(self):
         self.lock_path = os.path.join(CONF.instances_path, 'locks')
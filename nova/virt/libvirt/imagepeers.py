@@ -0,0 +1,267 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Distribution of base images between compute hosts.
+
+Compute hosts serve the base images in their image cache to the other
+compute hosts over HTTP, and download the base images they are missing from
+them before falling back to Glance.  The hosts that have an image are found
+through the image cache digests the compute nodes report to the scheduler,
+see nova.compute.image_digest.
+
+Requests are authenticated with an HMAC of the fingerprint of the image,
+keyed with a secret shared by all the compute hosts.  A host only serves the
+base images it has a stored sha1 checksum for, and sends it along with the
+image.  As the other hosts can't be trusted with the content of the image,
+the downloading host checks it against the checksum of the image in Glance.
+Base images that were converted to raw, or whose image has no checksum in
+Glance, can't be checked and are always downloaded from Glance.
+"""
+
+import hashlib
+import hmac
+import httplib
+import os
+import random
+import re
+
+import webob.dec
+import webob.exc
+
+from nova.compute import image_digest
+from nova.image import glance
+from nova.openstack.common import cfg
+from nova.openstack.common import log as logging
+from nova.virt.libvirt import imagecache
+
+LOG = logging.getLogger(__name__)
+
+image_peers_opts = [
+    cfg.BoolOpt('libvirt_image_peers',
+                default=False,
+                help='Serve the base images cached on this host to the other '
+                     'compute hosts, and download base images from them '
+                     'before falling back to Glance'),
+    cfg.StrOpt('libvirt_image_peers_listen',
+               default='0.0.0.0',
+               help='IP address to serve base images to the other compute '
+                    'hosts on'),
+    cfg.IntOpt('libvirt_image_peers_port',
+               default=8789,
+               help='Port to serve base images to the other compute hosts '
+                    'on, the same on every host'),
+    cfg.StrOpt('libvirt_image_peers_secret',
+               default=None,
+               help='Secret shared by the compute hosts to authenticate '
+                    'their requests for base images',
+               secret=True),
+    cfg.IntOpt('libvirt_image_peers_max_tries',
+               default=3,
+               help='Number of hosts to try downloading a base image from '
+                    'before falling back to Glance'),
+    cfg.IntOpt('libvirt_image_peers_timeout',
+               default=30,
+               help='Seconds to wait for another compute host to answer '
+                    'when downloading a base image from it'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(image_peers_opts)
+CONF.import_opt('host', 'nova.netconf')
+CONF.import_opt('instances_path', 'nova.compute.manager')
+CONF.import_opt('base_dir_name', 'nova.virt.libvirt.imagecache')
+CONF.import_opt('force_raw_images', 'nova.virt.images')
+
+TOKEN_HEADER = 'X-Image-Peer-Token'
+CHECKSUM_HEADER = 'X-Image-Sha1'
+
+CHUNK_SIZE = 65536
+
+_FINGERPRINT_RE = re.compile('^[0-9a-f]{40}$')
+
+
+def enabled():
+    """Return whether base images are distributed between hosts."""
+    return CONF.libvirt_image_peers and bool(CONF.libvirt_image_peers_secret)
+
+
+def make_token(fingerprint):
+    """Return the token authenticating a request for an image."""
+    return hmac.new(CONF.libvirt_image_peers_secret, fingerprint,
+                    hashlib.sha1).hexdigest()
+
+
+def _tokens_match(token, fingerprint):
+    expected = make_token(fingerprint)
+    if len(token) != len(expected):
+        return False
+    result = 0
+    for x, y in zip(token, expected):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+def _base_path(fingerprint):
+    return os.path.join(CONF.instances_path, CONF.base_dir_name, fingerprint)
+
+
+def _iter_file(path):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), ''):
+            yield chunk
+
+
+class ImagePeerApp(object):
+    """WSGI application serving the base images of this host at
+    /images/<fingerprint>.
+    """
+
+    @webob.dec.wsgify
+    def __call__(self, req):
+        parts = req.path_info.strip('/').split('/')
+        if (req.method != 'GET' or len(parts) != 2 or
+                parts[0] != 'images' or not _FINGERPRINT_RE.match(parts[1])):
+            raise webob.exc.HTTPNotFound()
+        fingerprint = parts[1]
+
+        if not _tokens_match(req.headers.get(TOKEN_HEADER, ''),
+                             fingerprint):
+            LOG.warn(_('Refused a request for base image %(fingerprint)s '
+                       'from %(addr)s with a wrong token'),
+                     {'fingerprint': fingerprint, 'addr': req.remote_addr})
+            raise webob.exc.HTTPForbidden()
+
+        path = _base_path(fingerprint)
+        if not os.path.isfile(path):
+            raise webob.exc.HTTPNotFound()
+        checksum = imagecache.read_stored_checksum(path, timestamped=False)
+        if not checksum:
+            raise webob.exc.HTTPNotFound()
+
+        res = webob.Response(content_type='application/octet-stream')
+        res.headers[CHECKSUM_HEADER] = checksum
+        res.content_length = os.path.getsize(path)
+        res.app_iter = _iter_file(path)
+        return res
+
+
+def _find_peers(context, virtapi, fingerprint):
+    """Return the hosts that likely have the image cached, in random
+    order.
+    """
+    peers = set()
+    for node in virtapi.compute_node_get_all(context):
+        service = node.get('service') or {}
+        host = service.get('host')
+        if not host or host == CONF.host or service.get('disabled'):
+            continue
+        for stat in node.get('stats', []):
+            if (stat['key'] == image_digest.STAT_KEY and
+                    image_digest.digest_contains(stat['value'], fingerprint)):
+                peers.add(host)
+    peers = list(peers)
+    random.shuffle(peers)
+    return peers
+
+
+def _download(host, fingerprint, path):
+    """Download an image from a host to a file.
+
+    Returns the sha1 checksum the host sent, the sha1 and the md5 of what
+    was downloaded, or raises.
+    """
+    conn = httplib.HTTPConnection(host, CONF.libvirt_image_peers_port,
+                                  timeout=CONF.libvirt_image_peers_timeout)
+    try:
+        conn.request('GET', '/images/%s' % fingerprint,
+                     headers={TOKEN_HEADER: make_token(fingerprint)})
+        resp = conn.getresponse()
+        if resp.status != httplib.OK:
+            raise IOError(_('HTTP %(status)d %(reason)s') %
+                          {'status': resp.status, 'reason': resp.reason})
+        sha1 = hashlib.sha1()
+        md5 = hashlib.md5()
+        with open(path, 'wb') as f:
+            for chunk in iter(lambda: resp.read(CHUNK_SIZE), ''):
+                sha1.update(chunk)
+                md5.update(chunk)
+                f.write(chunk)
+        return (resp.getheader(CHECKSUM_HEADER), sha1.hexdigest(),
+                md5.hexdigest())
+    finally:
+        conn.close()
+
+
+def _expected_md5(context, image_id):
+    """Return the Glance checksum of the image if the base image is the
+    same as the image in Glance, None if it was converted to raw or the
+    image has no checksum.
+    """
+    image_service, image_id = glance.get_remote_image_service(context,
+                                                              image_id)
+    image_meta = image_service.show(context, image_id)
+    if CONF.force_raw_images and image_meta.get('disk_format') != 'raw':
+        return None
+    return image_meta.get('checksum')
+
+
+def fetch_image(context, virtapi, target, image_id):
+    """Download a base image from other compute hosts.
+
+    Returns whether the image was downloaded to target; the caller falls
+    back to Glance when it wasn't.
+    """
+    fingerprint = image_digest.image_fingerprint(str(image_id))
+    try:
+        peers = _find_peers(context, virtapi, fingerprint)
+    except Exception:
+        LOG.exception(_('Could not look for hosts that have image '
+                        '%(image_id)s'), {'image_id': image_id})
+        return False
+    if not peers:
+        return False
+    expected_md5 = _expected_md5(context, image_id)
+    if not expected_md5:
+        LOG.debug(_('Not downloading image %(image_id)s from other hosts, '
+                    'there is no Glance checksum to check it against'),
+                  {'image_id': image_id})
+        return False
+
+    part_path = '%s.part' % target
+    for host in peers[:CONF.libvirt_image_peers_max_tries]:
+        try:
+            sent_sha1, sha1, md5 = _download(host, fingerprint, part_path)
+        except Exception, e:
+            LOG.info(_('Could not download image %(image_id)s from '
+                       '%(host)s: %(error)s'),
+                     {'image_id': image_id, 'host': host, 'error': e})
+            continue
+        if md5 != expected_md5 or sha1 != sent_sha1:
+            LOG.warn(_('Image %(image_id)s downloaded from %(host)s has a '
+                       'wrong checksum'),
+                     {'image_id': image_id, 'host': host})
+            continue
+        os.rename(part_path, target)
+        imagecache.write_stored_info(target, field='sha1', value=sha1)
+        LOG.info(_('Downloaded image %(image_id)s from %(host)s'),
+                 {'image_id': image_id, 'host': host})
+        return True
+
+    if os.path.exists(part_path):
+        os.unlink(part_path)
+    return False
@@ -19,6 +19,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import errno
+import fcntl
 import os
 
 from lxml import etree
@@ -34,6 +36,11 @@ libvirt_opts = [
                 default=False,
                 help='Compress snapshot images when possible. This '
                      'currently applies exclusively to qcow2 images'),
+    cfg.BoolOpt('libvirt_use_reflinks',
+                default=True,
+                help='Create raw disks from their base image with a reflink '
+                     'when the filesystem supports it, so that they share '
+                     'its blocks until they are written to'),
     ]
 
 CONF = cfg.CONF
@@ -315,6 +322,53 @@ def get_disk_backing_file(path, basename=True):
     return backing_file
 
 
+# ioctl cloning a whole file, _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# Errors of FICLONE when the files can't share blocks
+_REFLINK_UNSUPPORTED_ERRNOS = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV,
+                               errno.EINVAL, errno.ENOSYS)
+
+# Whether reflinks work between two devices, by (source, destination)
+_reflink_support = {}
+
+
+def _reflink(src, dest):
+    with open(src, 'rb') as src_file:
+        with open(dest, 'wb') as dest_file:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+
+
+def clone_image(src, dest):
+    """Copy a disk image to a new local file, sharing the blocks of the
+    image if the filesystem supports reflinks
+
+    Whether the filesystem supports them is found out on the first clone
+    between two devices, images are just copied from then on if it doesn't.
+
+    :param src: Source image
+    :param dest: Destination path
+    """
+    if CONF.libvirt_use_reflinks:
+        devices = (os.stat(src).st_dev,
+                   os.stat(os.path.dirname(os.path.abspath(dest))).st_dev)
+        if _reflink_support.get(devices, True):
+            try:
+                _reflink(src, dest)
+                _reflink_support[devices] = True
+                return
+            except (IOError, OSError), e:
+                if os.path.exists(dest):
+                    os.unlink(dest)
+                if e.errno not in _REFLINK_UNSUPPORTED_ERRNOS:
+                    raise
+                LOG.info(_('Reflinks are not supported from %(src)s to '
+                           '%(dest)s, copying images instead'),
+                         {'src': src, 'dest': dest})
+                _reflink_support[devices] = False
+    copy_image(src, dest)
+
+
 def copy_image(src, dest, host=None):
     """Copy a disk image to an existing directory
 
@@ -97,3 +97,9 @@ class VirtAPI(object):
         :param architecture: agent architecture
         """
         raise NotImplementedError()
+
+    def compute_node_get_all(self, context):
+        """Get all compute nodes, with their stats
+        :param context: security context
+        """
+        raise NotImplementedError()
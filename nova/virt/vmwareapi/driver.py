@@ -31,6 +31,9 @@ A connection to the VMware ESX platform.
 :vmwareapi_api_retry_count: The API retry count in case of failure such as
                             network failures (socket errors etc.)
                             (default: 10).
+:vmwareapi_use_inventory_cache: Whether to keep the inventory in memory,
+                            up to date with WaitForUpdatesEx
+                            (default: True).
 :vnc_port:                  VNC starting port (default: 5900)
 :vnc_port_total:            Total number of VNC ports (default: 10000)
 :vnc_password:              VNC password
@@ -49,6 +52,7 @@ from nova import utils
 from nova.virt import driver
 from nova.virt.vmwareapi import error_util
 from nova.virt.vmwareapi import host
+from nova.virt.vmwareapi import inventory_cache
 from nova.virt.vmwareapi import vim
 from nova.virt.vmwareapi import vim_util
 from nova.virt.vmwareapi import vm_util
@@ -92,6 +96,14 @@ vmwareapi_opts = [
                     'socket error, etc. '
                     'Used only if compute_driver is '
                     'vmwareapi.VMwareESXDriver or vmwareapi.VMwareVCDriver.'),
+    cfg.BoolOpt('vmwareapi_use_inventory_cache',
+                default=True,
+                help='Whether to keep the properties of virtual machines, '
+                     'hosts, datacenters and resource pools in memory, up '
+                     'to date with WaitForUpdatesEx, and wait for tasks '
+                     'to complete with it instead of polling them. '
+                     'Used only if compute_driver is '
+                     'vmwareapi.VMwareESXDriver or vmwareapi.VMwareVCDriver.'),
     cfg.IntOpt('vnc_port',
                default=5900,
                help='VNC starting port'),
@@ -415,6 +427,9 @@ class VMwareAPISession(object):
         self._session_id = None
         self.vim = None
         self._create_session()
+        self.inventory_cache = None
+        if CONF.vmwareapi_use_inventory_cache:
+            self.inventory_cache = inventory_cache.InventoryCache(self)
 
     def _get_vim_object(self):
         """Create the VIM Object instance."""
@@ -542,12 +557,37 @@ class VMwareAPISession(object):
             self._create_session()
         return self.vim
 
+    def _get_inventory_cache(self):
+        """Gets the inventory cache, or None if it can't be used."""
+        if (self.inventory_cache is None or
+                not self.inventory_cache.available()):
+            return None
+        return self.inventory_cache
+
+    def _wait_for_task_info(self, task_ref, poll_interval=None):
+        """Gets the info of a task once it is no longer queued or running."""
+        inventory = self._get_inventory_cache()
+        if inventory is not None:
+            return inventory.wait_for_task(task_ref)
+        while True:
+            task_info = self._call_method(vim_util, "get_dynamic_property",
+                                          task_ref, "Task", "info")
+            if task_info.state not in ['queued', 'running']:
+                return task_info
+            time.sleep(poll_interval or CONF.vmwareapi_task_poll_interval)
+
     def _wait_for_task(self, instance_uuid, task_ref):
         """
         Return a Deferred that will give the result of the given task.
-        The task is polled until it completes.
+        The task is polled until it completes, unless the inventory cache
+        can tell when it does.
         """
         done = event.Event()
+        inventory = self._get_inventory_cache()
+        if inventory is not None:
+            self._poll_task(instance_uuid, task_ref, done,
+                            inventory.wait_for_task)
+            return done.wait()
         loop = utils.FixedIntervalLoopingCall(self._poll_task, instance_uuid,
                                               task_ref, done)
         loop.start(CONF.vmwareapi_task_poll_interval)
@@ -555,14 +595,19 @@ class VMwareAPISession(object):
         loop.stop()
         return ret_val
 
-    def _poll_task(self, instance_uuid, task_ref, done):
+    def _poll_task(self, instance_uuid, task_ref, done, get_task_info=None):
         """
         Poll the given task, and fires the given Deferred if we
-        get a result.
+        get a result. get_task_info is called to get the info of the
+        task if given.
         """
         try:
-            task_info = self._call_method(vim_util, "get_dynamic_property",
-                            task_ref, "Task", "info")
+            if get_task_info is not None:
+                task_info = get_task_info(task_ref)
+            else:
+                task_info = self._call_method(vim_util,
+                                "get_dynamic_property", task_ref, "Task",
+                                "info")
             task_name = task_info.name
             if task_info.state in ['queued', 'running']:
                 return
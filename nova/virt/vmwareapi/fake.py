@@ -21,8 +21,11 @@ A fake VMware VI API implementation.
 """
 
 import pprint
+import time
 import uuid
 
+from eventlet import greenthread
+
 from nova import exception
 from nova.openstack.common import log as logging
 from nova.virt.vmwareapi import error_util
@@ -35,6 +38,11 @@ _FAKE_FILE_SIZE = 1024
 
 _db_content = {}
 
+# Property filters created with CreateFilter, and the properties of the
+# objects they matched as given out with each WaitForUpdatesEx version.
+_property_filters = {}
+_update_snapshots = {}
+
 LOG = logging.getLogger(__name__)
 
 
@@ -54,6 +62,8 @@ def reset():
             _db_content[c] = []
         else:
             _db_content[c] = {}
+    _property_filters.clear()
+    _update_snapshots.clear()
     create_network()
     create_host_network_system()
     create_host()
@@ -66,6 +76,8 @@ def cleanup():
     """Clear the db contents."""
     for c in _CLASSES:
         _db_content[c] = {}
+    _property_filters.clear()
+    _update_snapshots.clear()
 
 
 def _create_object(table, table_obj):
@@ -385,7 +397,7 @@ class Task(ManagedObject):
 
     def __init__(self, task_name, state="running"):
         super(Task, self).__init__("Task")
-        info = DataObject
+        info = DataObject()
         info.name = task_name
         info.state = state
         self.set("info", info)
@@ -480,6 +492,90 @@ def fake_get_vmdk_size_and_properties(context, image_id, instance):
     return _FAKE_FILE_SIZE, props
 
 
+def _comparable(val):
+    """Return a value that compares equal as long as val is unchanged."""
+    if isinstance(val, ManagedObject):
+        return val.obj
+    if isinstance(val, DataObject):
+        return tuple(sorted((key, _comparable(item))
+                            for key, item in vars(val).iteritems()))
+    if isinstance(val, (list, tuple)):
+        return tuple(_comparable(item) for item in val)
+    return val
+
+
+def _filtered_properties():
+    """Return the properties of the objects matched by each filter."""
+    current = {}
+    for filter_ref, spec in _property_filters.iteritems():
+        prop_spec = spec.propSet[0]
+        objects = {}
+        for obj_spec in spec.objectSet:
+            if obj_spec.obj == "RootFolder":
+                mdos = _db_content[prop_spec.type].values()
+            elif obj_spec.obj in _db_content[prop_spec.type]:
+                mdos = [_db_content[prop_spec.type][obj_spec.obj]]
+            else:
+                mdos = []
+            for mdo in mdos:
+                props = {}
+                for prop in prop_spec.pathSet:
+                    try:
+                        val = mdo.get(prop)
+                    except exception.NovaException:
+                        continue
+                    props[prop] = (_comparable(val), val)
+                objects[mdo.obj] = props
+        current[filter_ref] = objects
+    return current
+
+
+def _updates_since(previous):
+    """Return the filter updates that turn previous into current."""
+    current = _filtered_properties()
+    filter_set = []
+    for filter_ref, objects in current.iteritems():
+        old_objects = previous.get(filter_ref, {})
+        object_set = []
+        for obj_ref, props in objects.iteritems():
+            old_props = old_objects.get(obj_ref)
+            change_set = []
+            for name, (comparable, val) in props.iteritems():
+                old_prop = (old_props or {}).get(name)
+                if old_prop is None or old_prop[0] != comparable:
+                    change = DataObject()
+                    change.name = name
+                    change.op = "assign"
+                    change.val = val
+                    change_set.append(change)
+            for name in old_props or {}:
+                if name not in props:
+                    change = DataObject()
+                    change.name = name
+                    change.op = "remove"
+                    change_set.append(change)
+            if old_props is not None and not change_set:
+                continue
+            obj_update = DataObject()
+            obj_update.kind = "enter" if old_props is None else "modify"
+            obj_update.obj = obj_ref
+            obj_update.changeSet = change_set
+            object_set.append(obj_update)
+        for obj_ref in old_objects:
+            if obj_ref not in objects:
+                obj_update = DataObject()
+                obj_update.kind = "leave"
+                obj_update.obj = obj_ref
+                obj_update.changeSet = []
+                object_set.append(obj_update)
+        if object_set:
+            filter_update = DataObject()
+            filter_update.filter = filter_ref
+            filter_update.objectSet = object_set
+            filter_set.append(filter_update)
+    return filter_set, current
+
+
 def _get_vm_mdo(vm_ref):
     """Gets the Virtual Machine with the ref from the db."""
     if _db_content.get("VirtualMachine", None) is None:
@@ -702,6 +798,43 @@ class FakeVim(object):
                 continue
         return lst_ret_objs
 
+    def _create_filter(self, method, *args, **kwargs):
+        """Creates a property filter on the objects of a single type."""
+        filter_ref = str(uuid.uuid4())
+        _property_filters[filter_ref] = kwargs.get("spec")
+        return filter_ref
+
+    def _destroy_filter(self, method, *args, **kwargs):
+        """Destroys a property filter."""
+        _property_filters.pop(args[0], None)
+
+    def _wait_for_updates(self, method, *args, **kwargs):
+        """Returns the changes made to the filtered objects since version."""
+        # NOTE: changes are found by comparing the properties with those
+        # given out with version, so that tests can keep changing
+        # _db_content directly.
+        version = kwargs.get("version") or ""
+        if version and version not in _update_snapshots:
+            raise error_util.VimFaultException(["InvalidCollectorVersion"],
+                                               _("Invalid version"))
+        previous = _update_snapshots.pop(version, {})
+        options = kwargs.get("options")
+        max_wait = getattr(options, "maxWaitSeconds", None) or 0
+        deadline = time.time() + max_wait
+        filter_set, current = _updates_since(previous)
+        while not filter_set and time.time() < deadline:
+            greenthread.sleep(0.01)
+            filter_set, current = _updates_since(previous)
+        if not filter_set:
+            _update_snapshots[version] = previous
+            return None
+        update_set = DataObject()
+        update_set.version = str(uuid.uuid4())
+        update_set.filterSet = filter_set
+        update_set.truncated = False
+        _update_snapshots[update_set.version] = current
+        return update_set
+
     def _add_port_group(self, method, *args, **kwargs):
         """Adds a port group to the host system."""
         _host_sk = _db_content["HostSystem"].keys()[0]
@@ -767,6 +900,15 @@ class FakeVim(object):
         elif attr_name == "RetrieveProperties":
             return lambda *args, **kwargs: self._retrieve_properties(
                                                 attr_name, *args, **kwargs)
+        elif attr_name == "CreateFilter":
+            return lambda *args, **kwargs: self._create_filter(attr_name,
+                                                *args, **kwargs)
+        elif attr_name == "DestroyPropertyFilter":
+            return lambda *args, **kwargs: self._destroy_filter(attr_name,
+                                                *args, **kwargs)
+        elif attr_name == "WaitForUpdatesEx":
+            return lambda *args, **kwargs: self._wait_for_updates(attr_name,
+                                                *args, **kwargs)
         elif attr_name == "AcquireCloneTicket":
             return lambda *args, **kwargs: self._just_return()
         elif attr_name == "AddPortGroup":
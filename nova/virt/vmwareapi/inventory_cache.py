@@ -0,0 +1,294 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Properties of the VMware inventory kept up to date by the PropertyCollector.
+
+Rather than retrieving the properties of every object of a type each time
+one of them is looked for, a session creates a property filter per type
+once.  WaitForUpdatesEx then returns the changes made to the filtered
+properties since the version it gave out the last time.
+
+A collector serves one WaitForUpdatesEx call at a time.  When no task is
+waited for, a read calls it without waiting and applies the changes before
+looking at the properties.  Waiting for a task adds a filter on its info,
+and starts a listener greenthread that stays in WaitForUpdatesEx for as
+long as tasks are waited for.  It applies the changes as they come, and
+completes the wait of each task as soon as the task is done.  Meanwhile
+reads use the properties as they are, without waiting for the listener.
+"""
+
+import sys
+
+from eventlet import event
+from eventlet import greenthread
+from eventlet import semaphore
+from eventlet import timeout as eventlet_timeout
+
+from nova.openstack.common import log as logging
+from nova.virt.vmwareapi import error_util
+from nova.virt.vmwareapi import vim_util
+
+LOG = logging.getLogger(__name__)
+
+# Longest the listener waits for changes in one call to WaitForUpdatesEx,
+# so that it stops soon after the last task waited for is done.
+MAX_UPDATE_WAIT = 5
+
+FAULT_INVALID_COLLECTOR_VERSION = "InvalidCollectorVersion"
+
+INVENTORY_PROPERTIES = {
+    "VirtualMachine": ["name", "runtime.connectionState",
+                       "runtime.powerState", "summary.config.numCpu",
+                       "summary.config.memorySizeMB"],
+    "HostSystem": ["name"],
+    "Datacenter": ["name", "vmFolder"],
+    "ResourcePool": ["name"],
+}
+
+
+def _ref_key(ref):
+    """Return a hashable key for a managed object reference."""
+    return getattr(ref, "value", ref)
+
+
+def _task_done(task_info):
+    return (task_info is not None and
+            task_info.state not in ["queued", "running"])
+
+
+class InventoryCache(object):
+    """Properties of the objects of some managed object types."""
+
+    def __init__(self, session, properties=None):
+        self._session = session
+        self._properties = properties or INVENTORY_PROPERTIES
+        self._vim = None
+        self._version = ""
+        # Reference of each filter and type of the objects it matches
+        self._filters = {}
+        # Task waited for, the filter on its info and the event sent with
+        # the info once it is done, by task
+        self._tasks = {}
+        self._task_filters = {}
+        self._task_events = {}
+        # Reference and properties of each object, by type and object
+        self._objects = {}
+        self._available = None
+        self._listener = None
+        self._lock = semaphore.Semaphore()
+
+    def available(self):
+        """Return whether the host supports WaitForUpdatesEx, loading the
+        cache the first time it is called."""
+        if self._available is None:
+            try:
+                self.sync()
+                self._available = True
+            except error_util.VimAttributeError:
+                LOG.info(_("The VMware host doesn't support WaitForUpdatesEx, "
+                           "not caching the inventory"))
+                self._available = False
+        return self._available
+
+    def _create_filter(self, type, properties, obj=None):
+        filter_ref = self._session._call_method(vim_util, "create_filter",
+                                                type, properties, obj)
+        self._filters[_ref_key(filter_ref)] = (filter_ref, type)
+        return filter_ref
+
+    def _reload(self):
+        """Create the filters again, from scratch."""
+        if self._session.vim is self._vim:
+            for filter_ref, type in self._filters.itervalues():
+                self._session._call_method(vim_util, "destroy_filter",
+                                           filter_ref)
+        self._vim = self._session._get_vim()
+        self._version = ""
+        self._filters.clear()
+        self._task_filters.clear()
+        self._objects.clear()
+        for type, properties in self._properties.iteritems():
+            self._create_filter(type, properties)
+        for key, task_ref in self._tasks.iteritems():
+            self._task_filters[key] = self._create_filter("Task", ["info"],
+                                                          task_ref)
+
+    def _wait_for_updates(self, timeout):
+        if self._session.vim is not self._vim:
+            self._reload()
+        try:
+            update_set = self._session._call_method(vim_util,
+                                                    "wait_for_updates",
+                                                    self._version, timeout)
+        except error_util.VimFaultException, excep:
+            if FAULT_INVALID_COLLECTOR_VERSION not in excep.fault_list:
+                raise
+            LOG.warn(_("Lost PropertyCollector updates, reloading the "
+                       "inventory"))
+            self._reload()
+            return self._wait_for_updates(0)
+        if self._session.vim is not self._vim:
+            # The session was created again during the call, together with
+            # a new PropertyCollector
+            self._reload()
+            return self._wait_for_updates(0)
+        return update_set
+
+    def _apply_updates(self, update_set):
+        """Apply an update set and the rest of it if it was truncated."""
+        while update_set:
+            self._apply(update_set)
+            self._version = update_set.version
+            if not getattr(update_set, "truncated", False):
+                break
+            update_set = self._wait_for_updates(0)
+
+    def sync(self):
+        """Apply the changes made since the last call, unless the listener
+        is running and applies them as they come."""
+        with self._lock:
+            if self._listener is None:
+                self._apply_updates(self._wait_for_updates(0))
+
+    def _apply(self, update_set):
+        for filter_update in update_set.filterSet:
+            filter_key = _ref_key(filter_update.filter)
+            if filter_key not in self._filters:
+                continue
+            type = self._filters[filter_key][1]
+            objects = self._objects.setdefault(type, {})
+            for obj_update in getattr(filter_update, "objectSet", []):
+                key = _ref_key(obj_update.obj)
+                if obj_update.kind == "leave":
+                    objects.pop(key, None)
+                    continue
+                ref, props = objects.setdefault(key, (obj_update.obj, {}))
+                for change in getattr(obj_update, "changeSet", []):
+                    if change.op in ("remove", "indirectRemove"):
+                        props.pop(change.name, None)
+                    else:
+                        props[change.name] = getattr(change, "val", None)
+
+    def get_objects(self, type):
+        """Return a list of (reference, properties) of all objects of
+        the type."""
+        self.sync()
+        return [(ref, dict(props)) for ref, props in
+                self._objects.get(type, {}).itervalues()]
+
+    def get_properties(self, type, ref):
+        """Return the properties of an object, or None if there is none."""
+        self.sync()
+        obj = self._objects.get(type, {}).get(_ref_key(ref))
+        if obj is None:
+            return None
+        return dict(obj[1])
+
+    def find_object(self, type, name):
+        """Return the reference of the object of the type with the name,
+        or None if there is none."""
+        for ref, props in self.get_objects(type):
+            if props.get("name") == name:
+                return ref
+        return None
+
+    def _task_info(self, key):
+        return self._objects.get("Task", {}).get(key, (None, {}))[1].get(
+                "info")
+
+    def _complete_tasks(self):
+        """Send the info of the tasks that are done to their waiters."""
+        for key, done in self._task_events.iteritems():
+            task_info = self._task_info(key)
+            if not done.ready() and _task_done(task_info):
+                done.send(task_info)
+
+    def _listen(self):
+        """Apply the changes as they come and complete the waits for
+        tasks, as long as tasks are waited for."""
+        try:
+            while True:
+                with self._lock:
+                    self._complete_tasks()
+                    if not self._task_events:
+                        self._listener = None
+                        return
+                    if self._session.vim is not self._vim:
+                        self._reload()
+                    vim = self._vim
+                    version = self._version
+                # The only call made without the lock, so that reads and
+                # new waits aren't held up
+                try:
+                    update_set = self._session._call_method(
+                            vim_util, "wait_for_updates", version,
+                            MAX_UPDATE_WAIT)
+                except error_util.VimFaultException, excep:
+                    if FAULT_INVALID_COLLECTOR_VERSION not in excep.fault_list:
+                        raise
+                    with self._lock:
+                        LOG.warn(_("Lost PropertyCollector updates, "
+                                   "reloading the inventory"))
+                        self._reload()
+                    continue
+                with self._lock:
+                    # Changes from a collector replaced during the call
+                    # are dropped, the filters are created again first
+                    if self._vim is vim:
+                        self._apply_updates(update_set)
+        except Exception:
+            LOG.exception(_("Could not wait for PropertyCollector updates"))
+            exc_info = sys.exc_info()
+            for done in self._task_events.itervalues():
+                if not done.ready():
+                    done.send_exception(*exc_info)
+            self._listener = None
+
+    def wait_for_task(self, task_ref, timeout=None):
+        """Wait for a task to be no longer queued or running.
+
+        Returns the last info of the task, which may still be queued or
+        running if the wait timed out.
+        """
+        key = _ref_key(task_ref)
+        done = event.Event()
+        with self._lock:
+            self._tasks[key] = task_ref
+            self._task_events[key] = done
+            if self._session.vim is self._vim:
+                self._task_filters[key] = self._create_filter("Task",
+                                                              ["info"],
+                                                              task_ref)
+            if self._listener is None:
+                self._listener = greenthread.spawn(self._listen)
+        try:
+            with eventlet_timeout.Timeout(timeout, False):
+                return done.wait()
+            return self._task_info(key)
+        finally:
+            with self._lock:
+                del self._tasks[key]
+                del self._task_events[key]
+                self._objects.get("Task", {}).pop(key, None)
+                filter_ref = self._task_filters.pop(key, None)
+                if filter_ref is not None:
+                    self._filters.pop(_ref_key(filter_ref), None)
+                if (filter_ref is not None and
+                        self._session.vim is self._vim):
+                    self._session._call_method(vim_util, "destroy_filter",
+                                               filter_ref)
@@ -176,6 +176,43 @@ def get_objects(vim, type, properties_to_collect=None, all=False):
                                 specSet=[property_filter_spec])
 
 
+def create_filter(vim, type, properties_to_collect, obj=None):
+    """
+    Creates a property filter on the properties of the objects of the type
+    specified, or of just obj if given.
+    """
+    client_factory = vim.client.factory
+    if obj is None:
+        object_spec = build_object_spec(client_factory,
+                            vim.get_service_content().rootFolder,
+                            [build_recursive_traversal_spec(client_factory)])
+    else:
+        object_spec = get_obj_spec(client_factory, obj)
+    property_spec = build_property_spec(client_factory, type=type,
+                                properties_to_collect=properties_to_collect)
+    property_filter_spec = build_property_filter_spec(client_factory,
+                                [property_spec],
+                                [object_spec])
+    return vim.CreateFilter(vim.get_service_content().propertyCollector,
+                            spec=property_filter_spec, partialUpdates=False)
+
+
+def destroy_filter(vim, filter_ref):
+    """Destroys a property filter."""
+    vim.DestroyPropertyFilter(filter_ref)
+
+
+def wait_for_updates(vim, version, max_wait_seconds):
+    """
+    Gets the changes to the filtered properties made since version, waiting
+    up to max_wait_seconds for one. Returns None if there isn't any.
+    """
+    wait_options = vim.client.factory.create('ns0:WaitOptions')
+    wait_options.maxWaitSeconds = max_wait_seconds
+    return vim.WaitForUpdatesEx(vim.get_service_content().propertyCollector,
+                                version=version, options=wait_options)
+
+
 def get_prop_spec(client_factory, spec_type, properties):
     """Builds the Property Spec Object."""
     prop_spec = client_factory.create('ns0:PropertySpec')
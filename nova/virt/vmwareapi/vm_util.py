@@ -472,6 +472,9 @@ def search_datastore_spec(client_factory, file_name):
 
 def get_vm_ref_from_name(session, vm_name):
     """Get reference to the VM with the name specified."""
+    inventory = session._get_inventory_cache()
+    if inventory is not None:
+        return inventory.find_object("VirtualMachine", vm_name)
     vms = session._call_method(vim_util, "get_objects",
                 "VirtualMachine", ["name"])
     for vm in vms:
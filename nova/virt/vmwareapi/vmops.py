@@ -22,7 +22,6 @@ Class for VM tasks like spawn, snapshot, suspend, resume etc.
 
 import base64
 import os
-import time
 import urllib
 import urllib2
 import uuid
@@ -92,10 +91,26 @@ class VMwareVMOps(object):
     def list_instances(self):
         """Lists the VM instances that are registered with the ESX host."""
         LOG.debug(_("Getting list of instances"))
+        lst_vm_names = []
+        for vm_name, conn_state in self._get_vm_names_and_states():
+            # Ignoring the orphaned or inaccessible VMs
+            if conn_state not in ["orphaned", "inaccessible"]:
+                lst_vm_names.append(vm_name)
+        LOG.debug(_("Got total of %s instances") % str(len(lst_vm_names)))
+        return lst_vm_names
+
+    def _get_vm_names_and_states(self):
+        """Get the name and connection state of every VM."""
+        inventory = self._session._get_inventory_cache()
+        if inventory is not None:
+            return [(props.get("name"), props.get("runtime.connectionState"))
+                    for vm_ref, props in
+                    inventory.get_objects("VirtualMachine")]
+
         vms = self._session._call_method(vim_util, "get_objects",
                      "VirtualMachine",
                      ["name", "runtime.connectionState"])
-        lst_vm_names = []
+        lst_vms = []
         for vm in vms:
             vm_name = None
             conn_state = None
@@ -104,11 +119,8 @@ class VMwareVMOps(object):
                     vm_name = prop.val
                 elif prop.name == "runtime.connectionState":
                     conn_state = prop.val
-            # Ignoring the orphaned or inaccessible VMs
-            if conn_state not in ["orphaned", "inaccessible"]:
-                lst_vm_names.append(vm_name)
-        LOG.debug(_("Got total of %s instances") % str(len(lst_vm_names)))
-        return lst_vm_names
+            lst_vms.append((vm_name, conn_state))
+        return lst_vms
 
     def spawn(self, context, instance, image_meta, network_info,
               block_device_info=None):
@@ -1060,21 +1072,27 @@ class VMwareVMOps(object):
         lst_properties = ["summary.config.numCpu",
                     "summary.config.memorySizeMB",
                     "runtime.powerState"]
-        vm_props = self._session._call_method(vim_util,
-                    "get_object_properties", None, vm_ref, "VirtualMachine",
-                    lst_properties)
+        inventory = self._session._get_inventory_cache()
+        if inventory is not None:
+            props = inventory.get_properties("VirtualMachine", vm_ref) or {}
+        else:
+            vm_props = self._session._call_method(vim_util,
+                        "get_object_properties", None, vm_ref,
+                        "VirtualMachine", lst_properties)
+            props = {}
+            for elem in vm_props:
+                for prop in elem.propSet:
+                    props[prop.name] = prop.val
         max_mem = None
         pwr_state = None
         num_cpu = None
-        for elem in vm_props:
-            for prop in elem.propSet:
-                if prop.name == "summary.config.numCpu":
-                    num_cpu = int(prop.val)
-                elif prop.name == "summary.config.memorySizeMB":
-                    # In MB, but we want in KB
-                    max_mem = int(prop.val) * 1024
-                elif prop.name == "runtime.powerState":
-                    pwr_state = VMWARE_POWER_STATES[prop.val]
+        if "summary.config.numCpu" in props:
+            num_cpu = int(props["summary.config.numCpu"])
+        if "summary.config.memorySizeMB" in props:
+            # In MB, but we want in KB
+            max_mem = int(props["summary.config.memorySizeMB"]) * 1024
+        if "runtime.powerState" in props:
+            pwr_state = VMWARE_POWER_STATES[props["runtime.powerState"]]
 
         return {'state': pwr_state,
                 'max_mem': max_mem,
@@ -1195,12 +1213,19 @@ class VMwareVMOps(object):
 
     def _get_datacenter_ref_and_name(self):
         """Get the datacenter name and the reference."""
+        inventory = self._session._get_inventory_cache()
+        if inventory is not None:
+            dc_ref, props = inventory.get_objects("Datacenter")[0]
+            return dc_ref, props["name"]
         dc_obj = self._session._call_method(vim_util, "get_objects",
                 "Datacenter", ["name"])
         return dc_obj[0].obj, dc_obj[0].propSet[0].val
 
     def _get_host_ref_from_name(self, host_name):
         """Get reference to the host with the name specified."""
+        inventory = self._session._get_inventory_cache()
+        if inventory is not None:
+            return inventory.find_object("HostSystem", host_name)
         host_objs = self._session._call_method(vim_util, "get_objects",
                     "HostSystem", ["name"])
         for host in host_objs:
@@ -1210,6 +1235,9 @@ class VMwareVMOps(object):
 
     def _get_vmfolder_ref(self):
         """Get the Vm folder ref from the datacenter."""
+        inventory = self._session._get_inventory_cache()
+        if inventory is not None:
+            return inventory.get_objects("Datacenter")[0][1]["vmFolder"]
         dc_objs = self._session._call_method(vim_util, "get_objects",
                                              "Datacenter", ["vmFolder"])
         # There is only one default datacenter in a standalone ESX host
@@ -1219,7 +1247,10 @@ class VMwareVMOps(object):
     def _get_res_pool_ref(self):
         # Get the resource pool. Taking the first resource pool coming our
         # way. Assuming that is the default resource pool.
-        if self._cluster is None:
+        inventory = self._session._get_inventory_cache()
+        if self._cluster is None and inventory is not None:
+            res_pool_ref = inventory.get_objects("ResourcePool")[0][0]
+        elif self._cluster is None:
             res_pool_ref = self._session._call_method(vim_util, "get_objects",
                                                       "ResourcePool")[0].obj
         else:
@@ -1238,14 +1269,8 @@ class VMwareVMOps(object):
                                    datastorePath=ds_path)
         # Wait till the state changes from queued or running.
         # If an error state is returned, it means that the path doesn't exist.
-        while True:
-            task_info = self._session._call_method(vim_util,
-                                       "get_dynamic_property",
-                                       search_task, "Task", "info")
-            if task_info.state in ['queued', 'running']:
-                time.sleep(2)
-                continue
-            break
+        task_info = self._session._wait_for_task_info(search_task,
+                                                      poll_interval=2)
         if task_info.state == "error":
             return False
         return True
@@ -1261,14 +1286,8 @@ class VMwareVMOps(object):
                                    searchSpec=search_spec)
         # Wait till the state changes from queued or running.
         # If an error state is returned, it means that the path doesn't exist.
-        while True:
-            task_info = self._session._call_method(vim_util,
-                                       "get_dynamic_property",
-                                       search_task, "Task", "info")
-            if task_info.state in ['queued', 'running']:
-                time.sleep(2)
-                continue
-            break
+        task_info = self._session._wait_for_task_info(search_task,
+                                                      poll_interval=2)
         if task_info.state == "error":
             return False, False
 
@@ -45,6 +45,7 @@ import xmlrpclib
 from eventlet import queue
 from eventlet import timeout
 
+from nova.compute import image_digest
 from nova import context
 from nova import exception
 from nova.openstack.common import cfg
@@ -53,6 +54,7 @@ from nova.virt import driver
 from nova.virt.xenapi import host
 from nova.virt.xenapi import pool
 from nova.virt.xenapi import pool_states
+from nova.virt.xenapi import record_cache
 from nova.virt.xenapi import vm_utils
 from nova.virt.xenapi import vmops
 from nova.virt.xenapi import volumeops
@@ -89,6 +91,11 @@ xenapi_opts = [
                default=5,
                help='Max number of times to poll for VHD to coalesce. '
                     'Used only if compute_driver=xenapi.XenAPIDriver'),
+    cfg.BoolOpt('xenapi_use_record_cache',
+                default=True,
+                help='Keep the records of VMs, VDIs and SRs in memory, '
+                     'updated from the XenAPI event stream, instead of '
+                     'fetching them for each lookup'),
     cfg.StrOpt('xenapi_sr_base_path',
                default='/var/run/sr-mount',
                help='Base path to the storage repository'),
@@ -409,6 +416,13 @@ class XenAPIDriver(driver.ComputeDriver):
 
         return dic
 
+    def get_cached_image_fingerprints(self):
+        """Return the fingerprints of the images cached in the SR."""
+        sr_ref = vm_utils.safe_find_sr(self._session)
+        cached_images = vm_utils._find_cached_images(self._session, sr_ref)
+        return [image_digest.image_fingerprint(image_id)
+                for image_id in cached_images]
+
     def ensure_filtering_rules_for_instance(self, instance_ref, network_info):
         # NOTE(salvatore-orlando): it enforces security groups on
         # host initialization and live migration.
@@ -625,6 +639,10 @@ class XenAPISession(object):
         self.product_version, self.product_brand = \
             self._get_product_version_and_brand()
         self._virtapi = virtapi
+        if CONF.xenapi_use_record_cache:
+            self.record_cache = record_cache.RecordCache(self)
+        else:
+            self.record_cache = None
 
     def _create_first_session(self, url, user, pw, exception):
         try:
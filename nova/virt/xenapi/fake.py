@@ -50,13 +50,17 @@
 A fake XenAPI SDK.
 """
 
+import copy
 import pickle
 import random
+import time
 import uuid
 from xml.sax import saxutils
 
 import pprint
 
+from eventlet import greenthread
+
 from nova import exception
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
@@ -68,6 +72,9 @@ _CLASSES = ['host', 'network', 'session', 'pool', 'SR', 'VBD',
 
 _db_content = {}
 
+# Records of the classes watched with event.from, by the token given out
+_event_snapshots = {}
+
 LOG = logging.getLogger(__name__)
 
 
@@ -80,6 +87,7 @@ def log_db_contents(msg=None):
 def reset():
     for c in _CLASSES:
         _db_content[c] = {}
+    _event_snapshots.clear()
     host = create_host('fake')
     create_vm('fake',
               'Running',
@@ -354,6 +362,28 @@ def get_record(table, ref):
         raise Failure(['HANDLE_INVALID', table, ref])
 
 
+def _events_since(classes, previous):
+    """Return the events that turn previous into the current records."""
+    current = dict((cls, copy.deepcopy(_db_content[cls])) for cls in classes)
+    events = []
+    for cls in classes:
+        old = previous.get(cls, {})
+        for ref, rec in current[cls].iteritems():
+            if ref not in old:
+                operation = 'add'
+            elif old[ref] != rec:
+                operation = 'mod'
+            else:
+                continue
+            events.append({'class': cls.lower(), 'operation': operation,
+                           'ref': ref, 'snapshot': rec})
+        for ref in old:
+            if ref not in current[cls]:
+                events.append({'class': cls.lower(), 'operation': 'del',
+                               'ref': ref})
+    return events, current
+
+
 def check_for_session_leaks():
     if len(_db_content['session']) > 0:
         raise exception.NovaException('Sessions have leaked: %s' %
@@ -663,6 +693,21 @@ class SessionBase(object):
                         vif_map, options):
         pass
 
+    def event_from(self, _1, classes, token, timeout):
+        # NOTE: changes are found by comparing the records with those
+        # given out with token, so that tests can keep changing
+        # _db_content directly.  As with XenAPI, a token can be used more
+        # than once.
+        previous = _event_snapshots.get(token, {})
+        deadline = time.time() + timeout
+        events, current = _events_since(classes, previous)
+        while not events and time.time() < deadline:
+            greenthread.sleep(0.01)
+            events, current = _events_since(classes, previous)
+        token = str(uuid.uuid4())
+        _event_snapshots[token] = current
+        return {'events': events, 'valid_ref_counts': {}, 'token': token}
+
     def network_get_all_records_where(self, _1, filter):
         return self.xenapi.network.get_all_records()
 
@@ -0,0 +1,165 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Records of XenAPI objects kept up to date from the event stream.
+
+Rather than fetching every record of a class each time one of them is
+looked for, a session keeps the records of VMs, VDIs and SRs in memory.
+event.from() returns the changes made to them since the token it gave out
+the last time, so a read calls it without waiting and applies what it
+returns before looking at the records.
+
+Callers waiting for a record to change don't hold up the reads with calls
+to event.from() that block.  A single listener greenthread, running while
+there are waiters, waits for events on a token of its own and wakes the
+waiters, which then read the records like any other caller.
+"""
+
+import time
+
+from eventlet import event
+from eventlet import greenthread
+from eventlet import semaphore
+from eventlet import timeout as eventlet_timeout
+
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Longest the listener waits for events in one call to event.from(), so
+# that it stops soon after the last waiter is gone.
+MAX_EVENT_WAIT = 5.0
+
+
+class RecordCache(object):
+    """Records of the objects of some XenAPI classes, by class and ref."""
+
+    def __init__(self, session, classes=('VM', 'VDI', 'SR')):
+        self._session = session
+        self._classes = list(classes)
+        self._records = dict((cls.lower(), {}) for cls in classes)
+        self._token = ''
+        self._available = None
+        self._lock = semaphore.Semaphore()
+        # Number of callers waiting for a record to change, the listener
+        # waiting for events for them and the event it sends on a change
+        self._waiters = 0
+        self._listener = None
+        self._changed = event.Event()
+
+    def available(self):
+        """Return whether XenAPI supports event.from(), loading the cache
+        the first time it is called."""
+        if self._available is None:
+            try:
+                self.sync()
+                self._available = True
+            except self._session.XenAPI.Failure, exc:
+                if exc.details[0] != 'MESSAGE_METHOD_UNKNOWN':
+                    raise
+                LOG.info(_("XenAPI doesn't support event.from, not caching "
+                           "records"))
+                self._available = False
+        return self._available
+
+    def sync(self):
+        """Apply the changes made since the last call."""
+        with self._lock:
+            try:
+                result = self._session.call_xenapi('event.from',
+                                                   self._classes,
+                                                   self._token, 0.0)
+            except self._session.XenAPI.Failure, exc:
+                if exc.details[0] != 'EVENTS_LOST':
+                    raise
+                LOG.warn(_("Lost XenAPI events, reloading all records"))
+                for records in self._records.itervalues():
+                    records.clear()
+                result = self._session.call_xenapi('event.from',
+                                                   self._classes, '', 0.0)
+
+            for ev in result['events']:
+                records = self._records.get(ev['class'].lower())
+                if records is None:
+                    continue
+                if ev['operation'] == 'del':
+                    records.pop(ev['ref'], None)
+                elif 'snapshot' in ev:
+                    records[ev['ref']] = ev['snapshot']
+            self._token = result['token']
+
+    def get_all_records(self, record_type):
+        """Return a dict of ref to record of all objects of record_type."""
+        self.sync()
+        return dict(self._records[record_type.lower()])
+
+    def get_record(self, record_type, ref):
+        """Return the record of an object, or None if there is none."""
+        self.sync()
+        return self._records[record_type.lower()].get(ref)
+
+    def wait_for_record(self, record_type, ref, predicate, timeout):
+        """Wait up to timeout seconds for predicate(record) to be true.
+
+        Returns the last record of the object, predicate may not be true
+        for it if the wait timed out.
+        """
+        deadline = time.time() + timeout
+        self._waiters += 1
+        try:
+            while True:
+                # Taken before reading, so that a change made after the
+                # read wakes us up
+                changed = self._changed
+                self.sync()
+                record = self._records[record_type.lower()].get(ref)
+                if record is not None and predicate(record):
+                    return record
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return record
+                if self._listener is None:
+                    self._listener = greenthread.spawn(self._listen)
+                with eventlet_timeout.Timeout(remaining, False):
+                    changed.wait()
+        finally:
+            self._waiters -= 1
+
+    def _notify_waiters(self):
+        changed, self._changed = self._changed, event.Event()
+        changed.send()
+
+    def _listen(self):
+        """Wake the waiters up on each change, as long as there are."""
+        token = self._token
+        while self._waiters:
+            try:
+                result = self._session.call_xenapi('event.from',
+                                                   self._classes, token,
+                                                   MAX_EVENT_WAIT)
+            except Exception:
+                LOG.exception(_("Could not wait for XenAPI events"))
+                # The waiters read the records again, running into the
+                # error themselves if it persists
+                self._notify_waiters()
+                greenthread.sleep(MAX_EVENT_WAIT)
+                token = self._token
+                continue
+            token = result['token']
+            if result['events']:
+                self._notify_waiters()
+        self._listener = None
@@ -23,6 +23,7 @@ their attributes like VDIs, VIFs, as well as their lookup functions.
 
 import contextlib
 import decimal
+import errno
 import os
 import re
 import time
@@ -141,6 +142,11 @@ SECTOR_SIZE = 512
 MBR_SIZE_SECTORS = 63
 MBR_SIZE_BYTES = MBR_SIZE_SECTORS * SECTOR_SIZE
 KERNEL_DIR = '/boot/guest'
+SPARSE_COPY_CHUNK_SIZE = 1024 * 1024
+SPARSE_COPY_PROGRESS_INTERVAL = 30  # seconds
+# NOTE: not in the os module before Python 3.3, these are the Linux values.
+SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
 MAX_VDI_CHAIN_SIZE = 16
 
 
@@ -1344,8 +1350,22 @@ def set_vm_name_label(session, vm_ref, name_label):
     session.call_xenapi("VM.set_name_label", vm_ref, name_label)
 
 
+def _get_record_cache(session):
+    """Return the record cache of a session, or None if it has none."""
+    cache = getattr(session, 'record_cache', None)
+    if cache is not None and cache.available():
+        return cache
+    return None
+
+
 def list_vms(session):
-    for vm_ref, vm_rec in session.get_all_refs_and_recs('VM'):
+    cache = _get_record_cache(session)
+    if cache:
+        vms = cache.get_all_records('VM').iteritems()
+    else:
+        vms = session.get_all_refs_and_recs('VM')
+
+    for vm_ref, vm_rec in vms:
         if (vm_rec["resident_on"] != session.get_xenapi_host() or
             vm_rec["is_a_template"] or vm_rec["is_control_domain"]):
             continue
@@ -1378,7 +1398,13 @@ def lookup_vm_vdis(session, vm_ref):
 
 def lookup(session, name_label):
     """Look the instance up and return it if available."""
-    vm_refs = session.call_xenapi("VM.get_by_name_label", name_label)
+    cache = _get_record_cache(session)
+    if cache:
+        vm_refs = [vm_ref for vm_ref, vm_rec
+                   in cache.get_all_records('VM').iteritems()
+                   if vm_rec['name_label'] == name_label]
+    else:
+        vm_refs = session.call_xenapi("VM.get_by_name_label", name_label)
     n = len(vm_refs)
     if n == 0:
         return None
@@ -1703,6 +1729,13 @@ def _integrate_series(data, col, start, until=None):
 
 
 def _get_all_vdis_in_sr(session, sr_ref):
+    cache = _get_record_cache(session)
+    if cache:
+        for vdi_ref, vdi_rec in cache.get_all_records('VDI').iteritems():
+            if vdi_rec['SR'] == sr_ref:
+                yield vdi_ref, vdi_rec
+        return
+
     for vdi_ref in session.call_xenapi('SR.get_VDIs', sr_ref):
         try:
             vdi_rec = session.call_xenapi('VDI.get_record', vdi_ref)
@@ -1722,10 +1755,19 @@ def get_instance_vdis_for_sr(session, vm_ref, sr_ref):
             continue
 
 
-def _get_vhd_parent_uuid(session, vdi_ref):
-    vdi_rec = session.call_xenapi("VDI.get_record", vdi_ref)
+def _get_vdi_record(session, vdi_ref):
+    cache = _get_record_cache(session)
+    vdi_rec = cache and cache.get_record('VDI', vdi_ref)
+    if not vdi_rec:
+        vdi_rec = session.call_xenapi("VDI.get_record", vdi_ref)
+    return vdi_rec
+
+
+def _get_vhd_parent_uuid(session, vdi_ref, vdi_rec=None):
+    if vdi_rec is None:
+        vdi_rec = _get_vdi_record(session, vdi_ref)
 
-    if 'vhd-parent' not in vdi_rec['sm_config']:
+    if not vdi_rec['sm_config'].get('vhd-parent'):
         return None
 
     parent_uuid = vdi_rec['sm_config']['vhd-parent']
@@ -1789,8 +1831,9 @@ def _wait_for_vhd_coalesce(session, instance, sr_ref, vdi_ref,
 
         # Search for any other vdi which parents to original parent and is not
         # in the active vm/instance vdi chain.
-        vdi_uuid = session.call_xenapi('VDI.get_record', vdi_ref)['uuid']
-        parent_vdi_uuid = _get_vhd_parent_uuid(session, vdi_ref)
+        vdi_rec = _get_vdi_record(session, vdi_ref)
+        vdi_uuid = vdi_rec['uuid']
+        parent_vdi_uuid = _get_vhd_parent_uuid(session, vdi_ref, vdi_rec)
         for _ref, rec in _get_all_vdis_in_sr(session, sr_ref):
             if ((rec['uuid'] != vdi_uuid) and
                (rec['uuid'] != parent_vdi_uuid) and
@@ -1812,10 +1855,23 @@ def _wait_for_vhd_coalesce(session, instance, sr_ref, vdi_ref,
     # matches the underlying VHDs.
     _scan_sr(session, sr_ref)
 
+    def _coalesced(vdi_rec):
+        parent_uuid = _get_vhd_parent_uuid(session, vdi_ref, vdi_rec)
+        return not original_parent_uuid or parent_uuid == original_parent_uuid
+
+    cache = _get_record_cache(session)
     max_attempts = CONF.xenapi_vhd_coalesce_max_attempts
     for i in xrange(max_attempts):
         _scan_sr(session, sr_ref)
-        parent_uuid = _get_vhd_parent_uuid(session, vdi_ref)
+        if cache:
+            # The record of the VDI changes once it's coalesced, wait for
+            # that to happen rather than sleep for the whole interval.
+            vdi_rec = cache.wait_for_record(
+                'VDI', vdi_ref, _coalesced,
+                CONF.xenapi_vhd_coalesce_poll_interval)
+        else:
+            vdi_rec = None
+        parent_uuid = _get_vhd_parent_uuid(session, vdi_ref, vdi_rec)
         if original_parent_uuid and (parent_uuid != original_parent_uuid):
             LOG.debug(_("Parent %(parent_uuid)s doesn't match original parent"
                         " %(original_parent_uuid)s, waiting for coalesce..."),
@@ -1825,7 +1881,8 @@ def _wait_for_vhd_coalesce(session, instance, sr_ref, vdi_ref,
             base_uuid = _get_vhd_parent_uuid(session, parent_ref)
             return parent_uuid, base_uuid
 
-        greenthread.sleep(CONF.xenapi_vhd_coalesce_poll_interval)
+        if not cache:
+            greenthread.sleep(CONF.xenapi_vhd_coalesce_poll_interval)
 
     msg = (_("VHD coalesce attempts exceeded (%(max_attempts)d)"
              ", giving up...") % locals())
@@ -2048,13 +2105,79 @@ def _resize_part_and_fs(dev, start, old_sectors, new_sectors):
     utils.execute('tune2fs', '-j', partition_path, run_as_root=True)
 
 
-def _sparse_copy(src_path, dst_path, virtual_size, block_size=4096):
-    """Copy data, skipping long runs of zeros to create a sparse file."""
+def _next_data_range(fd, offset, end):
+    """Return the (start, end) of the next range of fd that may hold data.
+
+    Uses SEEK_DATA and SEEK_HOLE where the source supports them to skip
+    its holes without reading them, otherwise the whole rest of it may
+    hold data.
+    """
+    try:
+        data_start = os.lseek(fd, offset, SEEK_DATA)
+    except OSError as e:
+        if e.errno == errno.ENXIO:
+            # Nothing but holes after offset
+            return end, end
+        return offset, end
+
+    try:
+        data_end = os.lseek(fd, data_start, SEEK_HOLE)
+    except OSError:
+        data_end = end
+    return min(data_start, end), min(data_end, end)
+
+
+def _find_empty_block(buf, empty_block, start, end):
+    """Return the offset of the first aligned block of zeros, or -1."""
+    block_size = len(empty_block)
+    found = buf.find(empty_block, start, end)
+    while found != -1:
+        aligned = found + (-found % block_size)
+        if buf.startswith(empty_block, aligned, end):
+            return aligned
+        found = buf.find(empty_block, aligned, end)
+    return -1
+
+
+def _write_non_empty_blocks(dst, buf, length, offset, empty_block):
+    """Write the first length bytes of buf at offset, skipping zero blocks.
+
+    Returns the number of bytes written.
+    """
+    block_size = len(empty_block)
+    written = 0
+    pos = 0
+    while pos < length:
+        zeros = _find_empty_block(buf, empty_block, pos, length)
+        run_end = length if zeros == -1 else zeros
+        if run_end > pos:
+            dst.seek(offset + pos)
+            dst.write(buffer(buf, pos, run_end - pos))
+            written += run_end - pos
+        if zeros == -1:
+            break
+        pos = zeros + block_size
+        while buf.startswith(empty_block, pos, length):
+            pos += block_size
+    return written
+
+
+def _sparse_copy(src_path, dst_path, virtual_size, block_size=4096,
+                 chunk_size=SPARSE_COPY_CHUNK_SIZE):
+    """Copy data, skipping runs of zeros to create a sparse file.
+
+    Data is read chunk_size bytes at a time into the same buffer.  Chunks
+    of zeros are skipped whole, in other chunks the blocks of zeros are
+    found with bytearray.find() and the data between them is written
+    with one call per run.
+    """
     start_time = time.time()
-    EMPTY_BLOCK = '\0' * block_size
-    bytes_read = 0
-    skipped_bytes = 0
-    left = virtual_size
+    progress_time = start_time
+    chunk_size -= chunk_size % block_size
+    buf = bytearray(chunk_size)
+    empty_chunk = bytearray(chunk_size)
+    empty_block = bytearray(block_size)
+    bytes_written = 0
 
     LOG.debug(_("Starting sparse_copy src=%(src_path)s dst=%(dst_path)s "
                 "virtual_size=%(virtual_size)d block_size=%(block_size)d"),
@@ -2065,28 +2188,48 @@ def _sparse_copy(src_path, dst_path, virtual_size, block_size=4096):
     # ownership of the devices.
     with utils.temporary_chown(src_path):
         with utils.temporary_chown(dst_path):
-            with open(src_path, "r") as src:
-                with open(dst_path, "w") as dst:
-                    data = src.read(min(block_size, left))
-                    while data:
-                        if data == EMPTY_BLOCK:
-                            dst.seek(block_size, os.SEEK_CUR)
-                            left -= block_size
-                            bytes_read += block_size
-                            skipped_bytes += block_size
-                        else:
-                            dst.write(data)
-                            data_len = len(data)
-                            left -= data_len
-                            bytes_read += data_len
-
-                        if left <= 0:
-                            break
-
-                        data = src.read(min(block_size, left))
+            with open(src_path, "rb", 0) as src:
+                with open(dst_path, "wb", 0) as dst:
+                    offset = 0
+                    while offset < virtual_size:
+                        offset, data_end = _next_data_range(
+                            src.fileno(), offset, virtual_size)
+                        src.seek(offset)
+                        while offset < data_end:
+                            # NOTE: only whole bytearrays can be read into
+                            # on python 2.6, the last chunk of a data range
+                            # gets its own.
+                            chunk = buf
+                            if data_end - offset < chunk_size:
+                                chunk = bytearray(data_end - offset)
+                            length = src.readinto(chunk)
+                            if not length:
+                                # Source is smaller than virtual_size
+                                offset = virtual_size
+                                break
+
+                            if (length < chunk_size or
+                                    not chunk.startswith(empty_chunk)):
+                                bytes_written += _write_non_empty_blocks(
+                                    dst, chunk, length, offset, empty_block)
+                            offset += length
+
+                            now = time.time()
+                            if (now - progress_time >=
+                                    SPARSE_COPY_PROGRESS_INTERVAL):
+                                progress_time = now
+                                progress = offset * 100 / virtual_size
+                                LOG.debug(_("sparse_copy of %(src_path)s "
+                                            "%(progress)d%% done"), locals())
+
+                    if os.path.isfile(dst_path):
+                        # Zeros skipped at the end must still be part of
+                        # a regular file.
+                        dst.truncate(virtual_size)
 
     duration = time.time() - start_time
-    compression_pct = float(skipped_bytes) / bytes_read * 100
+    compression_pct = (float(virtual_size - bytes_written) /
+                       max(virtual_size, 1) * 100)
 
     LOG.debug(_("Finished sparse_copy in %(duration).2f secs, "
                 "%(compression_pct).2f%% reduction in size"), locals())
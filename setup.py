@@ -65,6 +65,7 @@ setuptools.setup(name='nova',
                'bin/nova-novncproxy',
                'bin/nova-objectstore',
                'bin/nova-rootwrap',
+               'bin/nova-rootwrap-daemon',
                'bin/nova-scheduler',
                'bin/nova-spicehtml5proxy',
                'bin/nova-xvpvncproxy',